@@ -0,0 +1,172 @@
+"""
+Bulk question answering over the employee desk chain.
+
+Usage:
+    python -m api.employee_desk.batch --input questions.jsonl --output answers.jsonl \
+        --org-id fourthsquare [--concurrency 8] [--checkpoint answers.ckpt]
+
+Each input line is {"id": ..., "query": ..., "user_email": ...}; only "query" is required.
+Re-running with the same --checkpoint skips the ids already answered and appends to --output.
+Only this CLI resumes: the HTTP batch route keeps no checkpoint, since a retried request
+may land on another instance; callers re-send the items they have no result for.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from typing import AsyncIterator, Iterable, Optional
+
+from langchain_community.callbacks.manager import get_openai_callback
+from pydantic import BaseModel, Field
+
+from api.employee_desk.chains import get_cached_employee_desk_chain
+from api.employee_desk.tenants import DEFAULT_ORG_ID, TENANT_MAX_CONCURRENCY, admit_tenant, tenant_admission
+from shared.answer_cache import normalize_query
+
+BATCH_CONCURRENCY = int(os.getenv("EMPLOYEE_DESK_BATCH_CONCURRENCY", "8"))
+
+class BatchItem(BaseModel):
+    id: str | None = Field(default=None,description="Caller's ID for the question; derived from the query when missing")
+    query: str = Field(description="Question to answer")
+    user_email: str | None = Field(default=None,description="User email passed to the chain")
+
+    def item_id(self) -> str:
+        return self.id or hashlib.sha1(self.query.encode("utf-8")).hexdigest()
+
+def parse_batch_items(lines: Iterable[str]) -> list[BatchItem]:
+    """
+    Parse JSONL input, skipping blank lines.
+
+    Raises:
+        ValueError: If a line isn't valid JSON or has no query
+    """
+    items = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            items.append(BatchItem.model_validate(json.loads(line)))
+        except ValueError as e:
+            raise ValueError(f"Invalid batch item on line {line_number}: {e}")
+    return items
+
+def load_checkpoint(path: Optional[str]) -> set[str]:
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as checkpoint_file:
+        return {line.strip() for line in checkpoint_file if line.strip()}
+
+async def run_batch(
+    items: list[BatchItem],
+    org_id: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    checkpoint_path: Optional[str] = None,
+) -> AsyncIterator[dict]:
+    """
+    Answer a batch of standalone questions and yield one result per item as chunks finish.
+
+    Questions run without a conversation, so the chain skips the memory lookup, and
+    identical questions (after normalization) are answered once. Work is sent to
+    `chain.abatch` in chunks with at most `concurrency` chains in flight; item ids are
+    appended to `checkpoint_path` after each chunk so an interrupted run can resume.
+
+    Yields:
+        dict: {"id", "query", "answer", "followup_questions", "search_query", "context_id", "error"}
+
+    Raises:
+        ValueError: Before the first result, if `concurrency` is below 1
+    """
+    # abatch would wait forever on a semaphore of 0
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    done = load_checkpoint(checkpoint_path)
+    pending = [item for item in items if item.item_id() not in done]
+    if len(pending) < len(items):
+        logging.info(f"Resuming batch: {len(items) - len(pending)} items already answered")
+
+    # one chain call per distinct question
+    groups: dict[str, list[BatchItem]] = {}
+    for item in pending:
+        groups.setdefault(normalize_query(item.query), []).append(item)
+    unique_items = [group[0] for group in groups.values()]
+
+    chain = await get_cached_employee_desk_chain(org_id=org_id)
+    chunk_size = max(concurrency * 4, 1)
+    for start in range(0, len(unique_items), chunk_size):
+        chunk = unique_items[start:start + chunk_size]
+        outputs = await chain.abatch(
+            [{"query": item.query, "conversation_id": None, "user_email": item.user_email} for item in chunk],
+            config={"max_concurrency": concurrency},
+            return_exceptions=True,
+        )
+        answered_ids = []
+        for representative, output in zip(chunk, outputs):
+            for item in groups[normalize_query(representative.query)]:
+                if isinstance(output, Exception):
+                    logging.error(f"Batch item {item.item_id()} failed: {output}")
+                    result = {"id": item.item_id(), "query": item.query, "error": str(output)}
+                else:
+                    result = {
+                        "id": item.item_id(),
+                        "query": item.query,
+                        "answer": output.get("answer"),
+                        "followup_questions": output.get("followup_questions"),
+                        "search_query": output.get("search_query"),
+                        "context_id": output.get("context_id"),
+                        "error": None,
+                    }
+                    answered_ids.append(item.item_id())
+                yield result
+        if checkpoint_path and answered_ids:
+            with open(checkpoint_path, "a", encoding="utf-8") as checkpoint_file:
+                checkpoint_file.write("".join(f"{item_id}\n" for item_id in answered_ids))
+
+async def run_tenant_batch(
+    items: list[BatchItem],
+    org_id: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    checkpoint_path: Optional[str] = None,
+) -> AsyncIterator[dict]:
+    """
+    `run_batch` under the org's quota, for the HTTP route: the batch holds one of the
+    org's request slots, runs at most its max_concurrency chains at once, and the tokens
+    it used are charged to the org's token bucket.
+
+    Raises:
+        ValueError: Before the first result, if `concurrency` is below 1
+        TenantQuotaExceeded: Before the first result, if the org is over its quota
+    """
+    async with admit_tenant(org_id) as employee_config:
+        max_concurrency = employee_config.max_concurrency or TENANT_MAX_CONCURRENCY
+        if max_concurrency:
+            concurrency = min(concurrency, max_concurrency)
+        with get_openai_callback() as callback:
+            try:
+                async for result in run_batch(items, org_id=org_id, concurrency=concurrency, checkpoint_path=checkpoint_path):
+                    yield result
+            finally:
+                tenant_admission.charge(org_id, callback.total_tokens)
+
+async def main(args: argparse.Namespace) -> None:
+    with open(args.input, encoding="utf-8") as input_file:
+        items = parse_batch_items(input_file)
+    output_mode = "a" if args.checkpoint and os.path.exists(args.checkpoint) else "w"
+    with open(args.output, output_mode, encoding="utf-8") as output_file:
+        async for result in run_batch(items, org_id=args.org_id, concurrency=args.concurrency, checkpoint_path=args.checkpoint):
+            output_file.write(json.dumps(result) + "\n")
+            output_file.flush()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="JSONL file of questions")
+    parser.add_argument("--output", required=True, help="JSONL file to write answers to")
+    parser.add_argument("--org-id", default=DEFAULT_ORG_ID, required=DEFAULT_ORG_ID is None, help="Org whose chain answers the questions")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Chains in flight")
+    parser.add_argument("--checkpoint", help="File of answered ids, used to resume")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    asyncio.run(main(args))
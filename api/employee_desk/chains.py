@@ -1,88 +1,236 @@
+import asyncio
+import logging
+import os
+from functools import partial
 from operator import itemgetter
 
 from langchain_core.runnables import (
     Runnable,
+    RunnableBranch,
     RunnableLambda,
     RunnableParallel,
+    RunnableConfig,
     RunnablePassthrough,
 )
 
-from api.employee_desk.utils import get_employee_desk_memory, modify_relevant_items
+from api.employee_desk.utils import (
+    RERANK_CANDIDATES,
+    RERANKER,
+    get_cached_answer,
+    get_employee_config,
+    get_employee_desk_memory,
+    modify_relevant_items,
+    rerank_relevant_items,
+    start_employee_config_watcher,
+)
 from api.employee_desk.prompts import get_prompt_templates
-from api.employee_desk.retrievers import get_retriever
+from api.employee_desk.retrievers import TOP_K, get_retriever
+from api.employee_desk.rewrite_gate import rewrite_gate
+from api.employee_desk.streaming import ANSWER_STREAM_TAG
 from api.employee_desk.schemas import EmployeeQueryResponse, EmployeeQueryRewriter
-from shared.llms import default_model
+from shared.caches import AsyncTTLCache
+from shared.llms import get_model, get_stage_model
 from shared.output_parsers import pydantic_dict_output_parser
+from shared.rerank import get_reranker
+from shared.routing import model_router
+from shared.startup import mark_ready
+from shared.tokens import get_token_limit
 
-async def get_employee_desk_chain(org_id: str) -> Runnable:
+CHAIN_CACHE_SIZE = int(os.getenv("EMPLOYEE_DESK_CHAIN_CACHE_SIZE", "32"))
+CHAIN_CACHE_TTL = float(os.getenv("EMPLOYEE_DESK_CHAIN_CACHE_TTL", "3600"))
+# Adaptive routing changes the answering model (and its cost), so it is opt-in
+MODEL_ROUTING_ENABLED = os.getenv("EMPLOYEE_DESK_MODEL_ROUTING", "false").lower() in ("1", "true", "yes")
+WARM_ORG_IDS = [org_id.strip() for org_id in os.getenv("EMPLOYEE_DESK_WARM_ORGS", os.getenv("EMPLOYEE_DESK_DEFAULT_ORG", "")).split(",") if org_id.strip()]
+
+# Named runnables timed per request by StageTimingCallbackHandler
+EMPLOYEE_DESK_STAGES = (
+    'GetMemoryAndSpeculativeRetrieval',
+    'GetEmployeeMemory',
+    'SpeculativeRetrieval',
+    'RewriteQuery',
+    'AzureAISearchRetriever',
+    'RerankDocuments',
+    'GetRelevantItems',
+    'RouteModel',
+    'GenerateResponse',
+    'EmployeeDeskChain',
+)
+
+# Compiled chains keyed by org_id, shared by every request of the worker
+chain_registry: AsyncTTLCache[Runnable] = AsyncTTLCache(maxsize=CHAIN_CACHE_SIZE, ttl=CHAIN_CACHE_TTL)
+# Stages the chains are composed from, also run one by one by the durable orchestration
+stage_registry: AsyncTTLCache[dict[str, Runnable]] = AsyncTTLCache(maxsize=CHAIN_CACHE_SIZE, ttl=CHAIN_CACHE_TTL)
+
+async def get_employee_desk_stages(org_id: str) -> dict[str, Runnable]:
     """
-    Create and return the employee desk processing chain.
+    Create the individual stages of the employee desk chain.
+
+    Every stage takes and returns plain JSON-compatible values, so the same stages back
+    the composed chain and the durable orchestration activities:
+        memory:   {"conversation_id"} -> list of memory messages (empty without a conversation_id)
+        rewrite:  {"query", "memory"} -> search query
+        retrieve: search query -> {"context", "context_id"}
+        route:    {"search_query", "context", "memory"} -> model name
+        respond:  {"query", "memory", "search_query", "context", "context_id", "model_name"}
+                  -> {"answer", "followup_questions"}
 
     Args:
         org_id: Organization ID for configuration
 
     Returns:
-        Runnable: Configured LangChain runnable for processing employee queries
+        dict: Stage name -> runnable
     """
-    # Initialize prompt templates and retriever
-    prompt_templates = await get_prompt_templates(org_id=org_id)
-    retriever = await get_retriever(org_id=org_id)
+    # With a reranker, retrieval over-fetches candidates and the reranker decides how many fit
+    reranker = get_reranker(RERANKER)
 
-    # Configure models with structured outputs
-    default_model_for_query_rewriter = default_model.with_structured_output(
-        schema=EmployeeQueryRewriter, strict=True
+    # Initialize config, prompt templates and retriever concurrently; the config cache
+    # de-duplicates the three lookups into a single Cosmos query
+    employee_config, prompt_templates, retriever = await asyncio.gather(
+        get_employee_config(org_id=org_id),
+        get_prompt_templates(org_id=org_id),
+        get_retriever(org_id=org_id, top_k=RERANK_CANDIDATES if reranker else TOP_K),
     )
-    default_model_for_query_response = default_model.with_structured_output(
-        schema=EmployeeQueryResponse, strict=True
+
+    # Configure models with structured outputs; deployments are chosen per stage (and per org)
+    query_rewriter_model = get_stage_model('query_rewriter', employee_config.models)
+    query_response_model = get_stage_model('query_response', employee_config.models)
+    # Orgs that pin a response deployment opt out of adaptive routing
+    routing_enabled = MODEL_ROUTING_ENABLED and 'query_response' not in employee_config.models
+    token_limit = get_token_limit(query_response_model.deployment_name)
+    if routing_enabled:
+        # the context is packed before routing, so it must fit the smallest window the router can pick
+        token_limit = min([token_limit, *(get_token_limit(name) for name in model_router.model_names())])
+    model_for_query_rewriter = query_rewriter_model.with_structured_output(
+        schema=EmployeeQueryRewriter, strict=True
     )
 
     # Query rewriter chain
     query_rewriter_chain = (
         prompt_templates['query_rewriter_prompt']
         .with_config({'run_name': 'EmployeeQueryRewriterPrompt'})
-        | default_model_for_query_rewriter
+        | model_for_query_rewriter
         | RunnableLambda(pydantic_dict_output_parser)
         .with_config({'run_name': 'EmployeeQueryRewriterParser'})
     ).with_config({'run_name': 'EmployeeQueryRewriterChain'})
 
-    # Query response chain
-    query_response_chain = (
-        prompt_templates['query_response_prompt']
-        .with_config({'run_name': 'EmployeeQueryResponsePrompt'})
-        | default_model_for_query_response
-        | RunnableLambda(pydantic_dict_output_parser)
-        .with_config({'run_name': 'EmployeeQueryResponseParser'})
-    ).with_config({'run_name': 'EmployeeQueryResponseChain'})
+    # Over-fetched candidates are reranked and cut down to what fits the context budget;
+    # without a reranker the top documents are packed in search order
+    search = retriever.with_config({'run_name': 'AzureAISearchRetriever'})
+    if reranker:
+        search = (
+            RunnableParallel(query=RunnablePassthrough(), docs=search)
+            | RunnableLambda(partial(
+                rerank_relevant_items,
+                employee_config=employee_config,
+                reranker=reranker,
+                token_limit=token_limit,
+            ))
+            .with_config({'run_name': 'RerankDocuments'})
+        )
 
-    # Main response processing chain
-    response_chain = (
-        {
-            "query": itemgetter("query"),
-            "conversation_id": itemgetter("conversation_id"),
-            "user_email": itemgetter("user_email"),
-            "memory": (
-                itemgetter("conversation_id")
-                | RunnableLambda(get_employee_desk_memory)
+    # Query response chains, one per deployment the router can pick, built on first use
+    query_response_chains: dict[str, Runnable] = {}
+
+    def get_query_response_chain(model_name: str) -> Runnable:
+        if model_name not in query_response_chains:
+            model_for_query_response = get_model(model_name).with_structured_output(
+                schema=EmployeeQueryResponse, strict=True
+            ).with_config({'tags': [ANSWER_STREAM_TAG]})
+            query_response_chains[model_name] = (
+                prompt_templates['query_response_prompt']
+                .with_config({'run_name': 'EmployeeQueryResponsePrompt'})
+                | model_for_query_response
+                | RunnableLambda(pydantic_dict_output_parser)
+                .with_config({'run_name': 'EmployeeQueryResponseParser'})
+            ).with_config({'run_name': 'EmployeeQueryResponseChain'})
+        return query_response_chains[model_name]
+
+    def route_model(inputs: dict) -> str:
+        if not routing_enabled:
+            return query_response_model.deployment_name
+        return model_router.route(inputs['search_query'], inputs['context'], inputs['memory']).model_name
+
+    # Query response behind the answer cache (bypassed for turns with memory)
+    async def respond(inputs: dict, config: RunnableConfig) -> dict:
+        return await get_cached_answer(
+            inputs,
+            org_id=employee_config.org_id,
+            respond=partial(get_query_response_chain(inputs['model_name']).ainvoke, config=config),
+        )
+
+    stages = {
+        # standalone questions (the batch path) have no conversation and skip the memory store
+        'memory': (
+            itemgetter("conversation_id")
+            | RunnableBranch(
+                (lambda conversation_id: not conversation_id, RunnableLambda(lambda _: [])),
+                RunnableLambda(get_employee_desk_memory)
                 .with_config({'run_name': 'GetEmployeeMemory'})
                 | RunnableLambda(lambda x: x['memory'])
-                .with_config({'run_name': 'ModifyMemory'})
-            ),
-        }
-        | RunnablePassthrough()
-        .assign(
-            search_query=(
+                .with_config({'run_name': 'ModifyMemory'}),
+            )
+        ),
+        # the rewriter only runs when the rewrite gate finds the query depends on memory
+        'rewrite': RunnableBranch(
+            (
+                lambda x: rewrite_gate.should_rewrite(x['query'], x['memory']),
                 query_rewriter_chain
                 | RunnableLambda(lambda x: x['search_query'])
-                .with_config({'run_name': 'AssignRewrittenQuery'})
-            )
+                .with_config({'run_name': 'AssignRewrittenQuery'}),
+            ),
+            itemgetter("query"),
+        ),
+        # retrieval + context packing, shared by the speculative and the rewritten-query paths
+        'retrieve': (
+            search
+            | RunnableLambda(partial(
+                modify_relevant_items,
+                employee_config=employee_config,
+                token_limit=token_limit,
+            ))
+            .with_config({'run_name': 'ModifyRelevantItems'})
+        ),
+        'route': RunnableLambda(route_model).with_config({'run_name': 'RouteModel'}),
+        'respond': RunnableLambda(respond).with_config({'run_name': 'CachedQueryResponse'}),
+    }
+    # a worker that built a chain on demand is as ready as a warmed one
+    mark_ready()
+    return stages
+
+async def get_employee_desk_chain(org_id: str) -> Runnable:
+    """
+    Create and return the employee desk processing chain.
+
+    Args:
+        org_id: Organization ID for configuration
+
+    Returns:
+        Runnable: Configured LangChain runnable for processing employee queries
+    """
+    stages = await get_cached_employee_desk_stages(org_id=org_id)
+
+    # Main response processing chain. Memory and retrieval for the raw query run
+    # concurrently; the speculative results are reused whenever the query is not rewritten.
+    response_chain = (
+        RunnableParallel(
+            query=itemgetter("query"),
+            conversation_id=itemgetter("conversation_id"),
+            user_email=itemgetter("user_email"),
+            memory=stages['memory'],
+            speculative_retrieved=(
+                itemgetter("query")
+                | stages['retrieve']
+            ).with_config({'run_name': 'SpeculativeRetrieval'}),
         )
+        .with_config({'run_name': 'GetMemoryAndSpeculativeRetrieval'})
+        | RunnablePassthrough()
+        .assign(search_query=stages['rewrite'])
         .with_config({'run_name': 'RewriteQuery'})
         | RunnablePassthrough()
         .assign(
-            retrieved=(
-                itemgetter("search_query")
-                | retriever.with_config({'run_name': 'AzureAISearchRetriever'})
-                | RunnableLambda(modify_relevant_items)
+            retrieved=RunnableBranch(
+                (lambda x: x["search_query"] == x["query"], itemgetter("speculative_retrieved")),
+                itemgetter("search_query") | stages['retrieve'],
             )
         )
         .with_config({'run_name': 'GetRelevantItems'})
@@ -94,7 +242,9 @@ async def get_employee_desk_chain(org_id: str) -> Runnable:
             .with_config({'run_name': 'AssignContextID'})
         )
         | RunnablePassthrough()
-        .assign(final_response=query_response_chain)
+        .assign(model_name=stages['route'])
+        | RunnablePassthrough()
+        .assign(final_response=stages['respond'])
         .with_config({'run_name': 'GenerateResponse'})
         | RunnablePassthrough()
         .assign(
@@ -107,4 +257,40 @@ async def get_employee_desk_chain(org_id: str) -> Runnable:
 
     employee_desk_chain = response_chain.with_config({'run_name': 'EmployeeDeskChain'})
 
-    return employee_desk_chain
\ No newline at end of file
+    return employee_desk_chain
+
+async def get_cached_employee_desk_stages(org_id: str) -> dict[str, Runnable]:
+    """Return the employee desk stages for an org, building them on first use."""
+    return await stage_registry.get_or_load(org_id, lambda: get_employee_desk_stages(org_id=org_id))
+
+async def get_cached_employee_desk_chain(org_id: str) -> Runnable:
+    """
+    Return the compiled employee desk chain for an org, building it on first use.
+
+    Args:
+        org_id: Organization ID for configuration
+
+    Returns:
+        Runnable: Cached LangChain runnable for processing employee queries
+    """
+    return await chain_registry.get_or_load(org_id, lambda: get_employee_desk_chain(org_id=org_id))
+
+async def warm_employee_desk_chains(org_ids: list[str] | None = None) -> None:
+    """
+    Pre-build the chains for the given orgs (defaults to EMPLOYEE_DESK_WARM_ORGS).
+
+    Failures are logged and skipped so one bad config can't block startup. Also starts
+    the company_configs change feed watcher when it is enabled.
+    """
+    start_employee_config_watcher(on_change=invalidate_employee_desk_chain)
+    for org_id in (WARM_ORG_IDS if org_ids is None else org_ids):
+        try:
+            await get_cached_employee_desk_chain(org_id)
+            logging.info(f"Warmed employee desk chain for org_id {org_id}")
+        except Exception as e:
+            logging.warning(f"Could not warm employee desk chain for org_id {org_id}: {e}")
+
+def invalidate_employee_desk_chain(org_id: str | None = None) -> None:
+    """Drop the cached chain and stages for an org, or all of them when org_id is None."""
+    chain_registry.invalidate(org_id)
+    stage_registry.invalidate(org_id)
@@ -0,0 +1,73 @@
+from time import perf_counter
+from types import SimpleNamespace
+
+from langchain_community.callbacks.manager import get_openai_callback
+
+from api.employee_desk.chains import get_cached_employee_desk_stages
+from api.employee_desk.endpoints import build_chat_response, format_response_data
+from api.employee_desk.tenants import TURN_SECRETS, admit_tenant, record_tenant_usage
+from api.employee_desk.utils import enqueue_employee_desk_chatlog
+from shared.schemas import ChatRequest
+from shared.secrets import secrets
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens", "total_cost")
+# Stages that call a model hold one of the tenant's request slots while they run
+TENANT_ADMITTED_STAGES = ("rewrite", "route", "respond")
+
+async def run_stage(org_id: str, stage: str, stage_input) -> dict:
+    """
+    Run one employee desk stage for a durable activity.
+
+    Returns:
+        dict: {"output": stage output, "seconds": run time, "usage": LLM usage of the stage}
+
+    Raises:
+        TenantQuotaExceeded: If a model stage can't get one of the org's request slots
+    """
+    # activities may run on a worker that served no request yet
+    await secrets.aprefetch(TURN_SECRETS)
+    stages = await get_cached_employee_desk_stages(org_id=org_id)
+    start_time = perf_counter()
+    with get_openai_callback() as callback:
+        if stage in TENANT_ADMITTED_STAGES:
+            async with admit_tenant(org_id):
+                output = await stages[stage].ainvoke(stage_input)
+        else:
+            output = await stages[stage].ainvoke(stage_input)
+    return {
+        "output": output,
+        "seconds": round(perf_counter() - start_time, 4),
+        "usage": {field: getattr(callback, field) for field in USAGE_FIELDS},
+    }
+
+async def generate_response(org_id: str, state: dict) -> dict:
+    """
+    Route the turn and generate the answer; the output carries model_name, answer and
+    followup_questions, the usage and timing cover both stages.
+    """
+    route_result = await run_stage(org_id, "route", state)
+    respond_result = await run_stage(org_id, "respond", {**state, "model_name": route_result["output"]})
+    return {
+        "output": {"model_name": route_result["output"], **respond_result["output"]},
+        "seconds": round(route_result["seconds"] + respond_result["seconds"], 4),
+        "usage": merge_usage(route_result["usage"], respond_result["usage"]),
+    }
+
+def merge_usage(*usages: dict) -> dict:
+    """Sum the LLM usage reported by several activities."""
+    return {field: sum(usage.get(field) or 0 for usage in usages) for field in USAGE_FIELDS}
+
+async def persist_chat_response(chain_response: dict, chat_request: dict, usage: dict, start_time: float, stage_timings: dict[str, float], stage_tokens: dict[str, int]) -> dict:
+    """Build the ChatResponse of an orchestrated turn, queue it for Cosmos and return the API payload."""
+    await secrets.aprefetch(TURN_SECRETS)
+    response = build_chat_response(
+        chain_response,
+        ChatRequest(**chat_request),
+        SimpleNamespace(**usage),
+        start_time,
+        stage_timings=stage_timings,
+        stage_tokens=stage_tokens,
+    )
+    record_tenant_usage(response.org_id, response)
+    await enqueue_employee_desk_chatlog(chat_response=response)
+    return format_response_data(response)
@@ -1,18 +1,30 @@
 from datetime import datetime
+import json
 import logging
 from time import time
+from typing import AsyncIterator, Mapping
 from uuid import uuid4
 
 from langchain_community.callbacks.manager import get_openai_callback
+from opentelemetry import trace
 from pytz import timezone
 
-from api.employee_desk.chains import get_employee_desk_chain
-from api.employee_desk.utils import create_employee_desk_chatlog
-from shared.llms import default_model
+from api.employee_desk.chains import EMPLOYEE_DESK_STAGES, get_cached_employee_desk_chain
+from api.employee_desk.streaming import stream_employee_desk_chain
+from api.employee_desk.tenants import admit_tenant, record_tenant_usage, resolve_org_id
+from api.employee_desk.utils import enqueue_employee_desk_chatlog
+from shared.callbacks import StageTimingCallbackHandler
+from shared.llms import DEFAULT_MODEL_NAME
 from shared.schemas import ChatRequest, ChatResponse
+from shared.tracing import traced, tracer
 
-async def process_chat_request(chat_request:ChatRequest) -> dict | ChatResponse:
-    
+def validate_chat_request(chat_request:ChatRequest) -> str:
+    """
+    Validate the incoming conversation turn and return the stripped user query.
+
+    Raises:
+        ValueError: If the conversation payload is malformed
+    """
     query:str | None = chat_request.conversation.get('content','').strip()
 
     error_msg:str | None = None
@@ -27,89 +39,184 @@ async def process_chat_request(chat_request:ChatRequest) -> dict | ChatResponse:
     if error_msg:
         raise ValueError(error_msg)
 
+    return query
+
+def greeting_response(conversation_id:str, message:str) -> dict:
+    return {
+                "data": {"role": "assistant", "content": "Hello! How can I assist you today?"},
+                "conversation_id": conversation_id,
+                "message": message,
+                "statusCode": 0,
+                "__lastupdateddate": None,
+                "__lastupdatedby": None,
+            }
+
+def error_response(conversation_id:str | None) -> dict:
+    return {
+                "data": {"role": "assistant", "content": "I'm sorry, I was unable to process your query. Please try again."},
+                "conversation_id": conversation_id,
+                "message": "Conversation Continuation",
+                "statusCode": 0,
+                "__lastupdateddate": None,
+                "__lastupdatedby": None,
+            }
+
+def build_chat_response(chain_response:dict, chat_request:ChatRequest, callback, start_time:float, **extra) -> ChatResponse:
+    """
+    Merge the chain output with request, timing and usage data into a ChatResponse.
+
+    Token counts and cost are left empty when the callback recorded none (e.g. streamed
+    calls without usage), since ChatResponse only accepts positive values.
+    """
+    response:dict = dict(chain_response)
+    response['model_name'] = response.get('model_name') or DEFAULT_MODEL_NAME
+    end_time = time()
+    response.update({
+        "user_email": chat_request.user_email,
+        "total_time": round(end_time-start_time,2),
+        "prompt_tokens": callback.prompt_tokens or None,
+        "completion_tokens": callback.completion_tokens or None,
+        "total_tokens": callback.total_tokens or None,
+        "total_cost": round(callback.total_cost,5) or None,
+        "timestamp": str(datetime.now(timezone('America/New_York')).isoformat()),
+        **extra,
+    })
+    response = ChatResponse(**response)
+    response.id = response.conversation_id+"-"+response.timestamp
+    return response
+
+def format_response_data(response:ChatResponse) -> dict:
+    return {
+                "data":
+                {
+                    "role": "assistant", "content": response.answer,
+                    "followup_questions": response.followup_questions,
+                    "citation": [
+                                    {"label": "google.com","value": "https://google.com"},
+                                    {"label": "Wikipedia","value": "https://wikipedia.com"},
+                                    {"label": "FourthSquare","value": "https://fourthsquare.com"}
+                                ],
+                },
+                "conversation_id": response.conversation_id,
+                "message": "Conversation Continuation",
+                "statusCode": 0,
+                "__lastupdateddate": response.timestamp,
+                "__lastupdatedby": "API",
+            }
+
+async def process_chat_request(chat_request:ChatRequest, headers:Mapping[str,str] | None = None) -> dict | ChatResponse:
+    """
+    Answer one chat turn for the tenant of the user's email domain.
+
+    Raises:
+        ValueError: If the payload is malformed or the tenant is unknown
+        TenantForbidden: If the payload or headers name another tenant
+        TenantQuotaExceeded: If the tenant is over its concurrency or token quota
+    """
+    query:str = validate_chat_request(chat_request)
+
     if not isinstance(chat_request.conversation_id,str) or chat_request.conversation_id.strip()=='':
         logging.info("New Conversation Initiated")
         chat_request.conversation_id = str(uuid4())
-        return {
-                    "data": {"role": "assistant", "content": "Hello! How can I assist you today?"},
-                    "conversation_id": chat_request.conversation_id,
-                    "message": "Conversation Initialized",
-                    "statusCode": 0,
-                    "__lastupdateddate": None,
-                    "__lastupdatedby": None,
-                }
+        return greeting_response(chat_request.conversation_id, "Conversation Initialized")
 
     if query == '':
         logging.info("Empty Query")
-        return {
-                    "data": {"role": "assistant", "content": "Hello! How can I assist you today?"},
-                    "conversation_id": chat_request.conversation_id,
-                    "message": "Conversation Continuation",
-                    "statusCode": 0,
-                    "__lastupdateddate": None,
-                    "__lastupdatedby": None,
-                }
+        return greeting_response(chat_request.conversation_id, "Conversation Continuation")
     else:
-        config: dict = {"metadata": {"conversation_id": chat_request.conversation_id}}
-        logging.error('starting else')
+        org_id = await resolve_org_id(chat_request, headers)
+        stage_timer = StageTimingCallbackHandler(EMPLOYEE_DESK_STAGES, metric_prefix="employee_desk")
+        config: dict = {"metadata": {"conversation_id": chat_request.conversation_id, "org_id": org_id}, "callbacks": [stage_timer]}
         start_time = time()
-        
+
+        async with admit_tenant(org_id):
+            try:
+                with traced("employee_desk.chat_request", conversation_id=chat_request.conversation_id, org_id=org_id):
+                    with get_openai_callback() as callback:
+                        chain = await get_cached_employee_desk_chain(org_id=org_id)
+                        logging.debug(f"Invoking employee desk chain for conversation {chat_request.conversation_id}")
+                        chain_response = await chain.ainvoke({"query": query, "conversation_id": chat_request.conversation_id,"user_email": chat_request.user_email},config=config)
+
+                    response = build_chat_response(chain_response, chat_request, callback, start_time, org_id=org_id, stage_timings=stage_timer.timings, stage_tokens=stage_timer.token_counts)
+                    logging.info(f"Stage timings: {stage_timer.timings}, stage tokens: {stage_timer.token_counts}")
+                    record_tenant_usage(org_id, response)
+                    await enqueue_employee_desk_chatlog(chat_response=response)
+                    response_data = format_response_data(response)
+                    logging.debug(f"Response data: {response_data}")
+                    return response_data
+
+            except Exception as e:
+                    logging.error(f"Error getting response body: {str(e)}", exc_info=True)
+                    return error_response(chat_request.conversation_id)
+
+def format_sse(event:str, data:dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_chat_request(chat_request:ChatRequest, headers:Mapping[str,str] | None = None) -> AsyncIterator[str]:
+    """
+    Process a chat request and yield server-sent events.
+
+    Emits a `token` event per answer delta as the response model generates it, then a
+    single `final` event carrying the same payload as `process_chat_request` (follow-up
+    questions and metadata). The completed ChatResponse is persisted like the non-streaming route.
+    Validation, tenant and quota errors are raised before the first event.
+    """
+    query:str = validate_chat_request(chat_request)
+
+    if not isinstance(chat_request.conversation_id,str) or chat_request.conversation_id.strip()=='':
+        logging.info("New Conversation Initiated")
+        chat_request.conversation_id = str(uuid4())
+        yield format_sse("final", greeting_response(chat_request.conversation_id, "Conversation Initialized"))
+        return
+
+    if query == '':
+        logging.info("Empty Query")
+        yield format_sse("final", greeting_response(chat_request.conversation_id, "Conversation Continuation"))
+        return
+
+    org_id = await resolve_org_id(chat_request, headers)
+    stage_timer = StageTimingCallbackHandler(EMPLOYEE_DESK_STAGES, metric_prefix="employee_desk")
+    config: dict = {"metadata": {"conversation_id": chat_request.conversation_id, "org_id": org_id}, "callbacks": [stage_timer]}
+    start_time = time()
+    time_to_first_token: float | None = None
+    chain_response: dict | None = None
+
+    async with admit_tenant(org_id):
+        # same span as process_chat_request, but only made current while the turn runs and never
+        # across a yield: the rest of the stream may be consumed from another task's context
+        span = tracer.start_span("employee_desk.chat_request", attributes={"conversation_id": chat_request.conversation_id, "org_id": org_id})
         try:
             with get_openai_callback() as callback:
-                logging.error('before chain')
-                chain = await get_employee_desk_chain(org_id='fourthsquare')
-                logging.error('after chain')
-                chain_response = await chain.ainvoke({"query": query, "conversation_id": chat_request.conversation_id,"user_email": chat_request.user_email},config=config)
-                logging.error('after chain invoke')
-                response:dict = chain_response
-                logging.error('got chain response')
-                
-                response['model_name'] = default_model.deployment_name
-            
-            end_time = time()
-            logging.error('before update')
-            response.update({
-                "user_email": chat_request.user_email,
-                "total_time": round(end_time-start_time,2),
-                "prompt_tokens": callback.prompt_tokens,
-                "completion_tokens": callback.completion_tokens,
-                "total_tokens": callback.total_tokens,
-                "total_cost": round(callback.total_cost,5),
-                "timestamp": str(datetime.now(timezone('America/New_York')).isoformat()),
-            })
-            logging.error('before chat response')
-            response = ChatResponse(**response)
-            response.id = response.conversation_id+"-"+response.timestamp
-            logging.error('before cosmos')
-            await create_employee_desk_chatlog(chat_response=response)
-            logging.error('after cosmos')
-            response_data = {
-                                "data": 
-                                {
-                                    "role": "assistant", "content": response.answer,
-                                    "followup_questions": response.followup_questions,
-                                    "citation": [
-                                                    {"label": "google.com","value": "https://google.com"},
-                                                    {"label": "Wikipedia","value": "https://wikipedia.com"},
-                                                    {"label": "FourthSquare","value": "https://fourthsquare.com"}
-                                                ],
-                                },
-                                "conversation_id": response.conversation_id,
-                                "message": "Conversation Continuation",
-                                "statusCode": 0,
-                                "__lastupdateddate": response.timestamp,
-                                "__lastupdatedby": "API",
-                            }
-            logging.error(response_data)
-            return response_data
+                with trace.use_span(span):
+                    chain = await get_cached_employee_desk_chain(org_id=org_id)
+                inputs = {"query": query, "conversation_id": chat_request.conversation_id,"user_email": chat_request.user_email}
+                events = stream_employee_desk_chain(chain, inputs, config=config)
+                while True:
+                    with trace.use_span(span):
+                        item = await anext(events, None)
+                    if item is None:
+                        break
+                    event, payload = item
+                    if event == "token":
+                        if time_to_first_token is None:
+                            time_to_first_token = round(time()-start_time,2)
+                        yield format_sse("token", {"content": payload})
+                    else:
+                        chain_response = payload
+
+            with trace.use_span(span):
+                if chain_response is None:
+                    raise ValueError("Chain finished without a final response")
+
+                response = build_chat_response(chain_response, chat_request, callback, start_time, org_id=org_id, time_to_first_token=time_to_first_token, stage_timings=stage_timer.timings, stage_tokens=stage_timer.token_counts)
+                logging.info(f"Stage timings: {stage_timer.timings}, stage tokens: {stage_timer.token_counts}")
+                record_tenant_usage(org_id, response)
+                await enqueue_employee_desk_chatlog(chat_response=response)
+            yield format_sse("final", format_response_data(response))
 
         except Exception as e:
-                logging.error(f"Error getting response body: {str(e)}")
-                return {
-                    "data": {"role": "assistant", "content": "I'm sorry, I was unable to process your query. Please try again."},
-                    "conversation_id": chat_request.conversation_id,
-                    "message": "Conversation Continuation",
-                    "statusCode": 0,
-                    "__lastupdateddate": None,
-                    "__lastupdatedby": None,
-                }
\ No newline at end of file
+            logging.error(f"Error streaming response body: {str(e)}", exc_info=True)
+            yield format_sse("error", error_response(chat_request.conversation_id))
+        finally:
+            span.end()
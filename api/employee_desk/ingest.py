@@ -0,0 +1,152 @@
+"""
+Ingest an org's policy documents into the index its EmployeeConfig points at.
+
+Usage:
+    python -m api.employee_desk.ingest --org-id <org> --path ./policies
+    python -m api.employee_desk.ingest --org-id <org> --container policies [--prefix hr/] \
+        [--connection-string "UseDevelopmentStorage=true"]
+
+Only documents whose content hash changed since the last run are re-chunked and
+re-embedded; the manifest lives next to the local indexes (<index_name>.manifest.json).
+Documents missing from the source are deleted from the index, limited to those under
+--prefix; a source that lists nothing deletes nothing unless --allow-empty-source is given.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from azure.cosmos import exceptions
+
+from api.employee_desk.retrievers import LOCAL_INDEX_DIR, SEARCH_ENDPOINT_OVERRIDE, get_local_index, invalidate_retrieval_cache
+from api.employee_desk.schemas import EmployeeConfig, EmployeeConfigRepository
+from api.employee_desk.tenants import DEFAULT_ORG_ID
+from api.employee_desk.utils import employee_answer_cache, load_employee_config
+from shared.ingestion import (
+    CHUNK_OVERLAP_TOKENS,
+    CHUNK_TOKENS,
+    INGESTION_CONCURRENCY,
+    AzureSearchSink,
+    BlobSource,
+    DiskSource,
+    DocumentSource,
+    IndexSink,
+    IngestManifest,
+    IngestStats,
+    LocalIndexSink,
+    ingest,
+)
+from shared.llms import get_embedding_model
+from shared.secrets import secrets
+
+# Vector field of the Azure AI Search index; chunks are only embedded for Azure when it is set
+SEARCH_VECTOR_FIELD = os.getenv("AZURE_AI_SEARCH_VECTOR_FIELD") or None
+
+# Attempts at bumping index_version when the config keeps changing underneath
+INDEX_VERSION_ATTEMPTS = 3
+
+def manifest_path(index_name: str) -> str:
+    return os.path.join(LOCAL_INDEX_DIR, f"{index_name}.manifest.json")
+
+async def bump_index_version(repo: EmployeeConfigRepository, employee_config: EmployeeConfig) -> None:
+    """
+    Set index_version with a patch guarded by the config's etag, so fields this process
+    doesn't know about are kept and a concurrent edit is re-read rather than overwritten.
+    The bump is dropped if the edit moved the org to another index.
+    """
+    for _ in range(INDEX_VERSION_ATTEMPTS):
+        current, etag = await repo.get_with_etag(employee_config.id, employee_config.org_id)
+        if current is None or (current.index_name, current.retrieval_backend) != (employee_config.index_name, employee_config.retrieval_backend):
+            logging.warning(f"EmployeeConfig of org_id {employee_config.org_id} changed index during ingestion; index_version not bumped")
+            return
+        try:
+            await repo.patch(
+                employee_config.id,
+                employee_config.org_id,
+                [{"op": "set", "path": "/index_version", "value": datetime.now(timezone.utc).isoformat()}],
+                etag=etag,
+            )
+            return
+        except exceptions.CosmosAccessConditionFailedError:
+            continue
+    raise RuntimeError(f"EmployeeConfig of org_id {employee_config.org_id} kept changing; index_version not bumped")
+
+async def ingest_employee_documents(
+    org_id: str,
+    source: DocumentSource,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    concurrency: int = INGESTION_CONCURRENCY,
+    manifest_file: Optional[str] = None,
+    allow_empty_source: bool = False,
+) -> IngestStats:
+    """
+    Sync `source` into the org's index (local hybrid index or Azure AI Search, per its
+    retrieval_backend). When anything changed, the retrieval and answer caches of this
+    process are dropped and the config's index_version is bumped, so other workers drop
+    theirs through the company_configs change feed.
+    """
+    repo = EmployeeConfigRepository(conn_str=secrets.azure_cosmos_db_connection_string)
+    try:
+        employee_config = await load_employee_config(org_id, repo=repo)
+        if not employee_config.index_name:
+            raise ValueError(f"EmployeeConfig of org_id {org_id} has no index_name")
+
+        sink: IndexSink
+        if employee_config.retrieval_backend == "local":
+            sink = LocalIndexSink(await asyncio.to_thread(get_local_index, employee_config.index_name))
+        else:
+            sink = AzureSearchSink(
+                endpoint=SEARCH_ENDPOINT_OVERRIDE or secrets.azure_ai_search_service_endpoint,
+                index_name=employee_config.index_name,
+                api_key=secrets.azure_ai_search_api_key,
+                vector_field=SEARCH_VECTOR_FIELD,
+            )
+        embedding_model = get_embedding_model()
+        stats = await ingest(
+            source,
+            sink,
+            IngestManifest(manifest_file or manifest_path(employee_config.index_name)),
+            embed_documents=embedding_model.aembed_documents if embedding_model else None,
+            max_tokens=max_tokens,
+            overlap_tokens=overlap_tokens,
+            concurrency=concurrency,
+            allow_empty_source=allow_empty_source,
+        )
+        logging.info(f"Ingested {employee_config.index_name} for org_id {org_id}: {stats}")
+
+        if stats.changed:
+            invalidate_retrieval_cache(employee_config.index_name)
+            employee_answer_cache.invalidate(org_id)
+            await bump_index_version(repo, employee_config)
+    finally:
+        await repo.close()
+    return stats
+
+async def main(args: argparse.Namespace) -> None:
+    if args.path:
+        source = DiskSource(args.path)
+    else:
+        source = BlobSource(args.connection_string or secrets.azure_storage_account_connection_string, args.container, prefix=args.prefix)
+    stats = await ingest_employee_documents(
+        args.org_id, source, max_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens, concurrency=args.concurrency,
+        allow_empty_source=args.allow_empty_source,
+    )
+    print(stats)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--org-id", default=DEFAULT_ORG_ID, required=DEFAULT_ORG_ID is None, help="Org whose index is updated")
+    sources = parser.add_mutually_exclusive_group(required=True)
+    sources.add_argument("--path", help="Directory of documents")
+    sources.add_argument("--container", help="Blob container of documents")
+    parser.add_argument("--prefix", default="", help="Only ingest blobs under this prefix")
+    parser.add_argument("--connection-string", help="Storage connection string (defaults to the Key Vault one)")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="Maximum tokens per chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=CHUNK_OVERLAP_TOKENS, help="Overlap between windows of a long paragraph")
+    parser.add_argument("--concurrency", type=int, default=INGESTION_CONCURRENCY, help="Documents and embedding batches in flight")
+    parser.add_argument("--allow-empty-source", action="store_true", help="Delete every previously ingested document when the source lists none")
+    asyncio.run(main(parser.parse_args()))
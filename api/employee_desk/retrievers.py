@@ -1,15 +1,165 @@
+import asyncio
+import os
+from typing import Optional
+from urllib.parse import quote
+
+import aiohttp
 from langchain_community.retrievers import AzureAISearchRetriever
+from langchain_core.callbacks import AsyncCallbackManagerForRetrieverRun, CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from shared.caches import AsyncTTLCache
+from shared.hybrid_index import HybridIndex, IndexedChunk
+from shared.lifecycle import on_shutdown
+from shared.llms import get_embedding_model
+from shared.metrics import metrics
 from shared.secrets import secrets
 from api.employee_desk.utils import get_employee_config
 
-async def get_retriever(org_id: str)->AzureAISearchRetriever:
+SEARCH_API_VERSION = "2024-07-01"
+TOP_K = 3
+# Points the retriever at another Azure AI Search compatible endpoint (e.g. a local fake server)
+SEARCH_ENDPOINT_OVERRIDE = os.getenv("AZURE_AI_SEARCH_ENDPOINT_OVERRIDE") or None
+SEARCH_MAX_CONNECTIONS = int(os.getenv("AZURE_AI_SEARCH_MAX_CONNECTIONS", "100"))
+# Root of the on-disk indexes used by orgs with retrieval_backend="local", one directory per index_name
+LOCAL_INDEX_DIR = os.getenv("EMPLOYEE_DESK_LOCAL_INDEX_DIR", os.path.join(os.getcwd(), "indexes"))
+
+# Search results keyed by (index_name, search_query, top_k); concurrent identical searches share one call
+retrieval_cache: AsyncTTLCache[list[Document]] = AsyncTTLCache(
+    maxsize=int(os.getenv("EMPLOYEE_DESK_RETRIEVAL_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("EMPLOYEE_DESK_RETRIEVAL_CACHE_TTL", "900")),
+)
+_retrievers: dict[tuple[str, int], "CachedAzureAISearchRetriever"] = {}
+_local_indexes: dict[str, HybridIndex] = {}
+_search_session: Optional[aiohttp.ClientSession] = None
+
+class CachedAzureAISearchRetriever(AzureAISearchRetriever):
+    """
+    AzureAISearchRetriever that serves async searches through `retrieval_cache`
+    and can target an explicit `endpoint` instead of `<service_name>.search.windows.net`.
+    """
+    endpoint: Optional[str] = None
+
+    def _build_search_url(self, query: str) -> str:
+        if not self.endpoint:
+            return super()._build_search_url(query)
+        url = f"{self.endpoint.rstrip('/')}/indexes/{self.index_name}/docs?api-version={self.api_version}&search={quote(query)}"
+        if self.top_k:
+            url += f"&$top={self.top_k}"
+        if self.filter:
+            url += f"&$filter={quote(self.filter)}"
+        return url
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> list[Document]:
+        key = (self.index_name, query, self.top_k)
+        docs = retrieval_cache.get(key)
+        if docs is not None:
+            metrics.increment("retrieval_cache.hits", index=self.index_name)
+        else:
+            metrics.increment("retrieval_cache.misses", index=self.index_name)
+            docs = await retrieval_cache.get_or_load(
+                key, lambda: super(CachedAzureAISearchRetriever, self)._aget_relevant_documents(query, run_manager=run_manager)
+            )
+        # callers get their own list; the cached Documents themselves are treated as read-only
+        return list(docs)
+
+def chunk_to_document(chunk: IndexedChunk, score: float) -> Document:
+    """Document in the shape AzureAISearchRetriever returns: the chunk text plus file_name and the other fields as metadata."""
+    return Document(
+        page_content=chunk.chunk,
+        metadata={**chunk.metadata, "id": chunk.id, "file_name": chunk.file_name, "@search.score": score},
+    )
+
+def get_local_index(index_name: str) -> HybridIndex:
+    """Open (once per worker) the on-disk hybrid index for an index name."""
+    index = _local_indexes.get(index_name)
+    if index is None:
+        index = _local_indexes[index_name] = HybridIndex(os.path.join(LOCAL_INDEX_DIR, index_name))
+    return index
+
+class LocalHybridRetriever(BaseRetriever):
+    """
+    Retriever over a local HybridIndex: BM25 and, when an embedding deployment is
+    configured, dense cosine rankings fused with reciprocal-rank fusion. Results go
+    through `retrieval_cache` like the Azure AI Search ones.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    index: HybridIndex
+    index_name: str
+    top_k: int = TOP_K
+
+    def _search(self, query: str, query_vector: Optional[list[float]]) -> list[Document]:
+        # pick up chunks appended by an ingestion run since the last search
+        self.index.refresh()
+        return [chunk_to_document(chunk, score) for chunk, score in self.index.search(query, self.top_k, query_vector)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> list[Document]:
+        embedding_model = get_embedding_model()
+        query_vector = embedding_model.embed_query(query) if embedding_model and query.strip() else None
+        return self._search(query, query_vector)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> list[Document]:
+        async def load() -> list[Document]:
+            embedding_model = get_embedding_model()
+            query_vector = await embedding_model.aembed_query(query) if embedding_model and query.strip() else None
+            return await asyncio.to_thread(self._search, query, query_vector)
+
+        key = (self.index_name, query, self.top_k)
+        docs = retrieval_cache.get(key)
+        if docs is not None:
+            metrics.increment("retrieval_cache.hits", index=self.index_name)
+        else:
+            metrics.increment("retrieval_cache.misses", index=self.index_name)
+            docs = await retrieval_cache.get_or_load(key, load)
+        return list(docs)
+
+def get_search_session() -> aiohttp.ClientSession:
+    """Return the pooled HTTP session shared by every search retriever of the worker."""
+    global _search_session
+    if _search_session is None or _search_session.closed:
+        _search_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=SEARCH_MAX_CONNECTIONS, ttl_dns_cache=300),
+        )
+    return _search_session
+
+@on_shutdown
+async def close_search_session() -> None:
+    global _search_session
+    if _search_session is not None:
+        await _search_session.close()
+        _search_session = None
+
+def invalidate_retrieval_cache(index_name: Optional[str] = None) -> None:
+    """Drop cached search results for an index (e.g. after re-ingestion), or for every index."""
+    if index_name is None:
+        retrieval_cache.invalidate()
+        return
+    for key in retrieval_cache.keys():
+        if key[0] == index_name:
+            retrieval_cache.invalidate(key)
+
+async def get_retriever(org_id: str, top_k: int = TOP_K) -> BaseRetriever:
+    """Return the org's retriever: Azure AI Search, or the local hybrid index when its retrieval_backend is "local"."""
     employee_config = await get_employee_config(org_id=org_id)
-    return AzureAISearchRetriever(
-        content_key="chunk",
-        top_k=3,  
-        index_name= employee_config.index_name,
-        api_key=secrets.azure_ai_search_api_key,
-        service_name=secrets.azure_ai_search_service_name,
-        api_version="2024-07-01",
-        azure_ad_token="null"
-    )
\ No newline at end of file
+    if employee_config.retrieval_backend == "local":
+        index = await asyncio.to_thread(get_local_index, employee_config.index_name)
+        return LocalHybridRetriever(index=index, index_name=employee_config.index_name, top_k=top_k)
+    key = (employee_config.index_name, top_k)
+    retriever = _retrievers.get(key)
+    if retriever is None or retriever.aiosession is None or retriever.aiosession.closed:
+        retriever = CachedAzureAISearchRetriever(
+            content_key="chunk",
+            top_k=top_k,
+            index_name= employee_config.index_name,
+            api_key=secrets.azure_ai_search_api_key,
+            service_name=secrets.azure_ai_search_service_name,
+            api_version=SEARCH_API_VERSION,
+            azure_ad_token="null",
+            aiosession=get_search_session(),
+            endpoint=SEARCH_ENDPOINT_OVERRIDE,
+        )
+        _retrievers[key] = retriever
+    return retriever
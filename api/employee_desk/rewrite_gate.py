@@ -0,0 +1,92 @@
+import json
+import math
+import os
+import re
+from typing import Callable, Optional
+
+from shared.metrics import metrics
+
+# Words that usually point back at an earlier turn
+REFERRING_WORDS = {
+    "it", "its", "they", "them", "their", "theirs", "this", "that", "these", "those",
+    "he", "him", "his", "she", "her", "hers", "one", "ones", "there", "same", "former", "latter",
+    "above", "previous", "else", "instead", "too", "either",
+}
+FOLLOWUP_PREFIX = re.compile(r"^\s*(and|also|but|so|then|or|what about|how about|same for|why not)\b", re.IGNORECASE)
+WORD = re.compile(r"[a-z0-9']+")
+
+class LogisticRewriteClassifier:
+    """
+    Tiny local bag-of-words logistic model estimating P(query needs a rewrite).
+
+    Loaded from JSON: {"bias": float, "weights": {"word": float, ...}}. Besides the query's
+    words, the features `__words_<n>` (word count capped at 20) and `__question_mark` are used.
+    """
+    def __init__(self, bias: float, weights: dict[str, float]):
+        self.bias = bias
+        self.weights = weights
+
+    @classmethod
+    def from_file(cls, path: str) -> "LogisticRewriteClassifier":
+        with open(path, encoding="utf-8") as model_file:
+            model = json.load(model_file)
+        return cls(bias=model.get("bias", 0.0), weights=model.get("weights", {}))
+
+    def features(self, query: str) -> list[str]:
+        words = WORD.findall(query.lower())
+        features = list(set(words)) + [f"__words_{min(len(words), 20)}"]
+        if query.strip().endswith("?"):
+            features.append("__question_mark")
+        return features
+
+    def __call__(self, query: str) -> float:
+        score = self.bias + sum(self.weights.get(feature, 0.0) for feature in self.features(query))
+        return 1 / (1 + math.exp(-score))
+
+class RewriteGate:
+    """
+    Decides whether a turn needs the query-rewriter LLM call. The rewrite is skipped on
+    the first turn (empty memory) and for queries that already read as standalone: no
+    referring words, no follow-up prefix or ellipsis, and at least `min_standalone_words`
+    words. When a classifier is configured it replaces the word heuristics.
+    """
+    def __init__(
+        self,
+        min_standalone_words: int = 5,
+        classifier: Optional[Callable[[str], float]] = None,
+        classifier_threshold: float = 0.5,
+    ):
+        self.min_standalone_words = min_standalone_words
+        self.classifier = classifier
+        self.classifier_threshold = classifier_threshold
+
+    def decide(self, query: str, memory: Optional[list[dict]]) -> tuple[bool, str]:
+        """Return (needs_rewrite, reason)."""
+        if not memory:
+            return False, "empty_memory"
+        if self.classifier is not None:
+            return self.classifier(query) >= self.classifier_threshold, "classifier"
+        if "..." in query or "…" in query or FOLLOWUP_PREFIX.match(query):
+            return True, "followup_marker"
+        words = WORD.findall(query.lower())
+        if REFERRING_WORDS.intersection(words):
+            return True, "referring_word"
+        if len(words) < self.min_standalone_words:
+            return True, "short_query"
+        return False, "self_contained"
+
+    def should_rewrite(self, query: str, memory: Optional[list[dict]]) -> bool:
+        needs_rewrite, reason = self.decide(query, memory)
+        metrics.increment("rewrite_gate.rewritten" if needs_rewrite else "rewrite_gate.bypassed", reason=reason)
+        return needs_rewrite
+
+def create_rewrite_gate() -> RewriteGate:
+    """Build the gate from EMPLOYEE_DESK_REWRITE_* settings."""
+    classifier_path = os.getenv("EMPLOYEE_DESK_REWRITE_CLASSIFIER")
+    return RewriteGate(
+        min_standalone_words=int(os.getenv("EMPLOYEE_DESK_REWRITE_MIN_WORDS", "5")),
+        classifier=LogisticRewriteClassifier.from_file(classifier_path) if classifier_path else None,
+        classifier_threshold=float(os.getenv("EMPLOYEE_DESK_REWRITE_CLASSIFIER_THRESHOLD", "0.5")),
+    )
+
+rewrite_gate = create_rewrite_gate()
@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from shared.databases import AsyncCosmosRepository
+from typing import Literal
+
+from pydantic import BaseModel, Field, field_validator
+from shared.databases import AsyncCosmosRepository, projection_clause
 from shared.schemas import ChatResponse
 
 class EmployeeQueryRewriter(BaseModel):
@@ -17,6 +19,17 @@ class EmployeeConfig(BaseModel):
     query: str = Field(description="Query topics for employee assistance")
     about: str = Field(description="Information about the organization or configuration")
     index_name: str = Field(description="Name of the search index", default="")
+    index_version: str = Field(description="Time of the last ingestion that changed the index", default="")
+    retrieval_backend: Literal["azure_search", "local"] = Field(description="Azure AI Search, or the local hybrid index under EMPLOYEE_DESK_LOCAL_INDEX_DIR", default="azure_search")
+    models: dict[str, str] = Field(description="Deployment per chain stage, e.g. {'query_rewriter': 'gpt-4.1-nano'}", default_factory=dict)
+    email_domains: list[str] = Field(description="User email domains that resolve to this org", default_factory=list)
+    max_concurrency: int | None = Field(description="Requests of this org processed at once", default=None, gt=0)
+    tokens_per_minute: int | None = Field(description="LLM tokens per minute this org may use", default=None, gt=0)
+
+    @field_validator("email_domains")
+    @classmethod
+    def lowercase_email_domains(cls, email_domains: list[str]) -> list[str]:
+        return [domain.strip().lower() for domain in email_domains]
 
 class EmployeeConfigRepository(AsyncCosmosRepository[EmployeeConfig]):
     def __init__(self, conn_str: str):
@@ -30,9 +43,15 @@ class EmployeeConfigRepository(AsyncCosmosRepository[EmployeeConfig]):
         )
 
     async def find_by_org_id(self, org_id: str) -> list[EmployeeConfig]:
-        sql = "SELECT * FROM c WHERE c.org_id = @org_id"
+        sql = f"SELECT {projection_clause(EmployeeConfig)} FROM c WHERE c.org_id = @org_id"
         params = [{"name": "@org_id", "value": org_id}]
-        return await self.query(sql, params)
+        return await self.query(sql, params, partition_key=org_id)
+
+    async def find_org_ids_by_email_domain(self, domain: str) -> list[str]:
+        # domains are stored lowercase; LOWER also matches configs written before that
+        sql = "SELECT c.org_id FROM c WHERE EXISTS(SELECT VALUE d FROM d IN c.email_domains WHERE LOWER(d) = @domain)"
+        params = [{"name": "@domain", "value": domain.strip().lower()}]
+        return [doc["org_id"] async for doc in self.iter_query(sql, params, raw=True)]
 
 class EmployeeChatResponseRepository(AsyncCosmosRepository[ChatResponse]):
     def __init__(self, conn_str: str):
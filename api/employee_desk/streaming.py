@@ -0,0 +1,52 @@
+from typing import Any, AsyncIterator
+
+from langchain_core.runnables import Runnable
+from langchain_core.utils.json import parse_partial_json
+
+ANSWER_STREAM_TAG = "employee_desk_answer"
+
+def _chunk_text(chunk) -> str:
+    """Return the raw JSON text carried by a structured-output message chunk."""
+    if chunk.content:
+        return chunk.content if isinstance(chunk.content, str) else ""
+    # function-calling structured output streams the JSON in tool call args instead
+    tool_call_chunks = getattr(chunk, "tool_call_chunks", None) or []
+    return "".join(tool_call_chunk.get("args") or "" for tool_call_chunk in tool_call_chunks)
+
+async def stream_employee_desk_chain(chain: Runnable, inputs: dict, config: dict | None = None) -> AsyncIterator[tuple[str, Any]]:
+    """
+    Run the employee desk chain and yield its answer as it is generated.
+
+    The response model emits the structured `EmployeeQueryResponse` as JSON fragments; the
+    partial JSON is re-parsed on each chunk and only the new tail of `answer` is yielded.
+
+    Args:
+        chain: Compiled employee desk chain
+        inputs: Chain input (query, conversation_id, user_email)
+        config: Runnable config passed through to the chain
+
+    Yields:
+        ("token", str) for every answer delta, then ("final", dict) with the chain output
+    """
+    root_run_id = None
+    raw_json = ""
+    streamed_answer = ""
+
+    async for event in chain.astream_events(inputs, config=config, version="v2"):
+        if root_run_id is None:
+            root_run_id = event["run_id"]
+
+        if event["event"] == "on_chat_model_stream" and ANSWER_STREAM_TAG in event.get("tags", []):
+            raw_json += _chunk_text(event["data"]["chunk"])
+            partial = parse_partial_json(raw_json) if raw_json else None
+            answer = partial.get("answer") if isinstance(partial, dict) else None
+            if isinstance(answer, str) and len(answer) > len(streamed_answer):
+                yield "token", answer[len(streamed_answer):]
+                streamed_answer = answer
+
+        elif event["event"] == "on_chain_end" and event["run_id"] == root_run_id:
+            output = event["data"]["output"]
+            # answers served from the answer cache never stream, so send them in one piece
+            if not streamed_answer and output.get("answer"):
+                yield "token", output["answer"]
+            yield "final", output
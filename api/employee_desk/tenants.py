@@ -0,0 +1,96 @@
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Mapping, Optional
+
+from api.employee_desk.schemas import EmployeeConfig
+from api.employee_desk.utils import find_org_by_email_domain, get_employee_config
+from shared.admission import TenantAdmission
+from shared.metrics import metrics
+from shared.schemas import ChatRequest, ChatResponse
+from shared.secrets import secrets
+
+ORG_ID_HEADER = "x-org-id"
+# Fallback for single-tenant deployments whose clients send no tenant information
+DEFAULT_ORG_ID = os.getenv("EMPLOYEE_DESK_DEFAULT_ORG") or None
+# Limits for orgs whose config doesn't set its own (0 means unlimited)
+TENANT_MAX_CONCURRENCY = int(os.getenv("EMPLOYEE_DESK_TENANT_MAX_CONCURRENCY", "0"))
+TENANT_TOKENS_PER_MINUTE = int(os.getenv("EMPLOYEE_DESK_TENANT_TPM", "0"))
+
+# Secrets a chat turn reads, resolved off the event loop before the turn first touches them
+TURN_SECRETS = (
+    "azure_cosmos_db_connection_string",
+    "azure_ai_search_service_name",
+    "azure_ai_search_api_key",
+    "azure_ai_service_endpoint_eastus",
+    "azure_ai_service_api_key_eastus",
+    "azure_ai_service_endpoint_eastus2",
+    "azure_ai_service_api_key_eastus2",
+)
+
+tenant_admission = TenantAdmission(max_wait=float(os.getenv("EMPLOYEE_DESK_TENANT_MAX_WAIT", "10")))
+
+class TenantForbidden(Exception):
+    """The request names an org the user doesn't belong to."""
+
+async def resolve_tenant(user_email: Optional[str], requested_org_id: Optional[str] = None) -> str:
+    """
+    Return the org that claims the user's email domain, or EMPLOYEE_DESK_DEFAULT_ORG when no
+    org claims it. A requested org_id is only checked against that org, never trusted on its
+    own: every caller shares the same function key.
+
+    Raises:
+        ValueError: If no tenant can be resolved
+        TenantForbidden: If `requested_org_id` isn't the user's org
+    """
+    # every route starts here
+    await secrets.aprefetch(TURN_SECRETS)
+    org_id = None
+    if user_email and "@" in user_email:
+        org_id = await find_org_by_email_domain(user_email.rsplit("@", 1)[1])
+    org_id = org_id or DEFAULT_ORG_ID
+    if not org_id:
+        raise ValueError("Could not resolve the organization: the user's email domain isn't registered to any org")
+    requested_org_id = (requested_org_id or "").strip()
+    if requested_org_id and requested_org_id != org_id:
+        raise TenantForbidden(f"User {user_email} may not access org {requested_org_id}")
+    return org_id
+
+async def resolve_org_id(chat_request: ChatRequest, headers: Optional[Mapping[str, str]] = None) -> str:
+    """
+    Resolve the tenant of a chat request from the user's email domain; an org_id in the
+    payload or the x-org-id header must match it.
+
+    Raises:
+        ValueError: If no tenant can be resolved
+        TenantForbidden: If the request names another org
+    """
+    requested_org_id = chat_request.org_id or (headers.get(ORG_ID_HEADER) if headers else None)
+    return await resolve_tenant(chat_request.user_email, requested_org_id)
+
+@asynccontextmanager
+async def admit_tenant(org_id: str) -> AsyncIterator[EmployeeConfig]:
+    """
+    Load the tenant's config and hold one of its request slots for the block.
+
+    Raises:
+        ValueError: If the org has no EmployeeConfig
+        TenantQuotaExceeded: If the org is over its concurrency or token quota
+    """
+    employee_config = await get_employee_config(org_id=org_id)
+    async with tenant_admission.admit(
+        org_id,
+        max_concurrency=employee_config.max_concurrency or TENANT_MAX_CONCURRENCY,
+        tokens_per_minute=employee_config.tokens_per_minute or TENANT_TOKENS_PER_MINUTE,
+    ):
+        yield employee_config
+
+def record_tenant_usage(org_id: str, response: ChatResponse) -> None:
+    """Per-tenant request, latency, token and cost metrics; the tokens are also charged to the tenant's quota."""
+    metrics.increment("tenant.requests", org_id=org_id)
+    if response.total_time:
+        metrics.observe("tenant.latency_seconds", response.total_time, org_id=org_id)
+    if response.total_tokens:
+        metrics.increment("tenant.tokens", response.total_tokens, org_id=org_id)
+        tenant_admission.charge(org_id, response.total_tokens)
+    if response.total_cost:
+        metrics.increment("tenant.cost", response.total_cost, org_id=org_id)
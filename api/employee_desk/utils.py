@@ -1,4 +1,8 @@
-from typing import Optional
+import asyncio
+import logging
+import os
+import tempfile
+from typing import Callable, Optional
 from langchain.schema import Document
 
 from api.employee_desk.schemas import (
@@ -6,28 +10,180 @@ from api.employee_desk.schemas import (
     EmployeeConfigRepository,
     EmployeeChatResponseRepository,
 )
+from shared.memory import MemoryBackend, create_memory_backend
 from shared.utils import (
+    append_memory,
     create_chatlog,
     get_memory,
     modify_relevant_items as shared_modify_relevant_items,
+    rerank_relevant_items as shared_rerank_relevant_items,
     calculate_tokens
 )
+from shared.answer_cache import AnswerCache
+from shared.caches import AsyncTTLCache
+from shared.lifecycle import on_exit, on_shutdown
+from shared.metrics import metrics
+from shared.llms import EMBEDDING_DEPLOYMENT, get_embedding_model
+from shared.rerank import Reranker
 from shared.schemas import ChatResponse
 from shared.secrets import secrets
+from shared.tokens import DEFAULT_TOKEN_LIMIT
+from shared.write_behind import WriteBehindWriter
 
+CONFIG_CACHE_TTL = float(os.getenv("EMPLOYEE_DESK_CONFIG_CACHE_TTL", "600"))
+TRUNCATE_SOURCES = os.getenv("EMPLOYEE_DESK_TRUNCATE_SOURCES", "").lower() in ("1", "true", "yes")
+CONFIG_WATCH_INTERVAL = float(os.getenv("EMPLOYEE_DESK_CONFIG_WATCH_INTERVAL", "5"))
+# With a reranker ("lexical" or "cross-encoder"), retrieval over-fetches RERANK_CANDIDATES
+# documents and the reranker picks at most RERANK_MAX_DOCUMENTS of them within the context
+# budget; "none" (the default) packs the plain top 3
+RERANKER = os.getenv("EMPLOYEE_DESK_RERANKER", "none")
+RERANK_CANDIDATES = int(os.getenv("EMPLOYEE_DESK_RERANK_CANDIDATES", "12"))
+RERANK_MAX_DOCUMENTS = int(os.getenv("EMPLOYEE_DESK_RERANK_MAX_DOCUMENTS", "5")) or None
+# relevance/diversity (MMR) trade-off of the selection; empty or 0 ranks on relevance alone
+RERANK_MMR_LAMBDA = float(os.getenv("EMPLOYEE_DESK_RERANK_MMR_LAMBDA", "0.7") or 0) or None
 
-async def get_employee_config(org_id: str) -> EmployeeConfig:
+# EmployeeConfig keyed by org_id; concurrent misses for one org share a single Cosmos query
+employee_config_cache: AsyncTTLCache[EmployeeConfig] = AsyncTTLCache(maxsize=256, ttl=CONFIG_CACHE_TTL)
+# org_id per user email domain ("" when no org claims the domain)
+email_domain_cache: AsyncTTLCache[str] = AsyncTTLCache(maxsize=1024, ttl=CONFIG_CACHE_TTL)
+_config_watcher: Optional[asyncio.Task] = None
+
+ANSWER_CACHE_ENABLED = os.getenv("EMPLOYEE_DESK_ANSWER_CACHE", "true").lower() in ("1", "true", "yes")
+
+async def _embed_query(text: str) -> list[float]:
+    return await get_embedding_model().aembed_query(text)
+
+# Answers for first-turn questions keyed by org, normalized search query and context ids;
+# the embedding lookup is only enabled when an embedding deployment is configured, and
+# the client (with its Key Vault secrets) is only built on the first lookup
+employee_answer_cache = AnswerCache(
+    maxsize=int(os.getenv("EMPLOYEE_DESK_ANSWER_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("EMPLOYEE_DESK_ANSWER_CACHE_TTL", "3600")),
+    embed=_embed_query if EMBEDDING_DEPLOYMENT else None,
+    similarity_threshold=float(os.getenv("EMPLOYEE_DESK_ANSWER_CACHE_SIMILARITY", "0.95")),
+    name="employee_desk_answer_cache",
+)
+
+MEMORY_WINDOW_SIZE = int(os.getenv("EMPLOYEE_DESK_MEMORY_WINDOW", "10"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("EMPLOYEE_DESK_MEMORY_TOKEN_BUDGET", "1500"))
+
+# Whether every turn is answered by this process: a single worker process on an app
+# that can't scale out past one instance
+SINGLE_WORKER = (
+    os.getenv("WEBSITE_MAX_DYNAMIC_APPLICATION_SCALE_OUT") == "1"
+    and os.getenv("FUNCTIONS_WORKER_PROCESS_COUNT", "1") == "1"
+)
+# A worker-local window misses turns other workers answered, so by default it is only used
+# by a single worker; otherwise memory is read from Cosmos every turn ("none") unless a
+# shared (redis) backend is configured
+MEMORY_BACKEND = os.getenv("EMPLOYEE_DESK_MEMORY_BACKEND") or ("inprocess" if SINGLE_WORKER else "none")
+
+# Sliding memory window per conversation, updated write-through as chat logs are queued
+employee_memory_cache: Optional[MemoryBackend] = None
+if MEMORY_BACKEND != "none":
+    employee_memory_cache = create_memory_backend(
+        backend=MEMORY_BACKEND,
+        window_size=MEMORY_WINDOW_SIZE,
+        ttl=float(os.getenv("EMPLOYEE_DESK_MEMORY_TTL", "3600")),
+        redis_url=os.getenv("EMPLOYEE_DESK_MEMORY_REDIS_URL"),
+    )
+    on_shutdown(employee_memory_cache.close)
+
+# Chat logs are persisted in the background, batched per conversation_id partition
+chatlog_writer: WriteBehindWriter[ChatResponse] = WriteBehindWriter(
+    repo_factory=lambda: EmployeeChatResponseRepository(conn_str=secrets.azure_cosmos_db_connection_string),
+    partition_key=lambda chat_response: chat_response.conversation_id,
+    model_cls=ChatResponse,
+    spill_path=os.getenv(
+        "EMPLOYEE_DESK_CHATLOG_SPILL_PATH",
+        os.path.join(tempfile.gettempdir(), "employee_desk_chatlogs.jsonl"),
+    ),
+    max_queue_size=int(os.getenv("EMPLOYEE_DESK_CHATLOG_QUEUE_SIZE", "1000")),
+    name="employee_desk_chatlog",
+)
+on_shutdown(chatlog_writer.drain)
+on_exit(chatlog_writer.spill_pending)
+
+
+async def load_employee_config(org_id: str, repo: Optional[EmployeeConfigRepository] = None) -> EmployeeConfig:
     """
-    Load and return the EmployeeConfig for the given org_id asynchronously.
+    Load the EmployeeConfig for the given org_id from Cosmos, bypassing the cache.
     """
-    repo = EmployeeConfigRepository(conn_str=secrets.azure_cosmos_db_connection_string)
+    repo = repo or EmployeeConfigRepository(conn_str=secrets.azure_cosmos_db_connection_string)
     configs = await repo.find_by_org_id(org_id)
     if not configs:
         raise ValueError(f"No EmployeeConfig found for org_id {org_id}")
-    
-    global employee_config
-    employee_config = configs[0]
-    return employee_config
+    return configs[0]
+
+async def get_employee_config(org_id: str) -> EmployeeConfig:
+    """
+    Return the EmployeeConfig for the given org_id, served from the in-process cache.
+    """
+    return await employee_config_cache.get_or_load(org_id, lambda: load_employee_config(org_id))
+
+async def find_org_by_email_domain(domain: str) -> Optional[str]:
+    """
+    Return the org_id whose config lists `domain` in email_domains, or None.
+
+    Raises:
+        ValueError: If more than one org claims the domain
+    """
+    domain = domain.strip().lower()
+
+    async def load() -> str:
+        repo = EmployeeConfigRepository(conn_str=secrets.azure_cosmos_db_connection_string)
+        org_ids = sorted(set(await repo.find_org_ids_by_email_domain(domain)))
+        if len(org_ids) > 1:
+            raise ValueError(f"Email domain {domain} is claimed by several orgs: {org_ids}")
+        return org_ids[0] if org_ids else ""
+    return await email_domain_cache.get_or_load(domain, load) or None
+
+def invalidate_employee_config(org_id: Optional[str] = None) -> None:
+    """Drop the cached config (and answers built from it) for an org, or every org when org_id is None."""
+    employee_config_cache.invalidate(org_id)
+    employee_answer_cache.invalidate(org_id)
+    # a changed config may claim or release email domains
+    email_domain_cache.invalidate()
+
+async def watch_employee_config_changes(
+    repo: Optional[EmployeeConfigRepository] = None,
+    on_change: Optional[Callable[[str], None]] = None,
+    poll_interval: float = CONFIG_WATCH_INTERVAL,
+) -> None:
+    """
+    Poll the company_configs change feed and invalidate the cache for every changed org.
+
+    Args:
+        repo: Repository exposing `read_change_feed`; a fake can be passed in tests
+        on_change: Extra callback invoked with each changed org_id (e.g. chain invalidation)
+        poll_interval: Seconds to wait between change feed reads
+    """
+    repo = repo or EmployeeConfigRepository(conn_str=secrets.azure_cosmos_db_connection_string)
+    continuation: Optional[str] = None
+    while True:
+        try:
+            changes, continuation = await repo.read_change_feed(continuation)
+            for config in changes:
+                logging.info(f"EmployeeConfig changed for org_id {config.org_id}")
+                invalidate_employee_config(config.org_id)
+                if on_change:
+                    on_change(config.org_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Error reading company_configs change feed: {e}")
+        await asyncio.sleep(poll_interval)
+
+def start_employee_config_watcher(on_change: Optional[Callable[[str], None]] = None) -> Optional[asyncio.Task]:
+    """
+    Start the change feed watcher once per worker when EMPLOYEE_DESK_CONFIG_WATCH is enabled.
+    """
+    global _config_watcher
+    if os.getenv("EMPLOYEE_DESK_CONFIG_WATCH", "").lower() not in ("1", "true", "yes"):
+        return None
+    if _config_watcher is None or _config_watcher.done():
+        _config_watcher = asyncio.create_task(watch_employee_config_changes(on_change=on_change))
+    return _config_watcher
 
 async def create_employee_desk_chatlog(chat_response: ChatResponse) -> bool:
     """
@@ -44,13 +200,56 @@ async def create_employee_desk_chatlog(chat_response: ChatResponse) -> bool:
         repo=EmployeeChatResponseRepository(conn_str=secrets.azure_cosmos_db_connection_string)
     )
 
-async def get_employee_desk_memory(conversation_id: str, limit: int = 5) -> dict[str, list]:
+async def enqueue_employee_desk_chatlog(chat_response: ChatResponse) -> bool:
+    """
+    Queue a chatlog entry for background persistence, off the response path,
+    and write the turn through to the conversation memory cache.
+    
+    Args:
+        chat_response: The chat response to log
+        
+    Returns:
+        bool: True if queued, False if it was spilled to the local file
+    """
+    if employee_memory_cache is not None:
+        await append_memory(cache=employee_memory_cache, chat_response=chat_response)
+    return await chatlog_writer.enqueue(chat_response)
+
+async def get_cached_answer(inputs: dict, org_id: str, respond) -> dict:
+    """
+    Answer a query through the answer cache, calling `respond` on a miss.
+
+    Turns with conversation memory bypass the cache, since their answer depends on the history.
+    A fresh answer is cached off the response path, reusing the lookup's query embedding.
+    
+    Args:
+        inputs: Chain state with memory, search_query and context_id
+        org_id: Organization the chain serves
+        respond: Coroutine function producing the response dict on a miss
+        
+    Returns:
+        dict: The structured answer (answer, followup_questions)
+    """
+    if not ANSWER_CACHE_ENABLED or inputs.get('memory'):
+        metrics.increment("employee_desk_answer_cache.bypasses")
+        return await respond(inputs)
+
+    cached, query_vector = await employee_answer_cache.lookup(org_id, inputs['search_query'], inputs['context_id'])
+    if cached is not None:
+        return cached
+
+    response = await respond(inputs)
+    employee_answer_cache.store_in_background(org_id, inputs['search_query'], inputs['context_id'], response, vector=query_vector)
+    return response
+
+async def get_employee_desk_memory(conversation_id: str, limit: int = MEMORY_WINDOW_SIZE) -> dict[str, list]:
     """
     Retrieve conversation history for a specific conversation.
     
     Args:
         conversation_id: The ID of the conversation
-        limit: Maximum number of messages to retrieve
+        limit: Maximum number of turns to retrieve; the result is further trimmed
+            to EMPLOYEE_DESK_MEMORY_TOKEN_BUDGET tokens
         
     Returns:
         dict: Conversation history
@@ -58,24 +257,50 @@ async def get_employee_desk_memory(conversation_id: str, limit: int = 5) -> dict
     return await get_memory(
         repo=EmployeeChatResponseRepository(conn_str=secrets.azure_cosmos_db_connection_string),
         conversation_id=conversation_id,
-        limit=limit
+        limit=limit,
+        cache=employee_memory_cache,
+        token_budget=MEMORY_TOKEN_BUDGET,
     )
 
-async def modify_relevant_items(docs: list[Document]) -> dict[str, str | list[str]]:
+async def rerank_relevant_items(inputs: dict, employee_config: EmployeeConfig, reranker: Reranker, token_limit: int = DEFAULT_TOKEN_LIMIT) -> list[Document]:
+    """
+    Rerank the candidates retrieved for a search query and keep the best few that fit the context budget.
+    
+    Args:
+        inputs: {"query": search query, "docs": candidate documents}
+        employee_config: Configuration of the org the documents were retrieved for
+        reranker: Scorer for the candidates
+        token_limit: Context token budget of the model answering the query
+        
+    Returns:
+        list: Selected documents, most relevant first
+    """
+    return await shared_rerank_relevant_items(
+        query=inputs["query"],
+        docs=inputs["docs"],
+        about=employee_config.about,
+        reranker=reranker,
+        token_limit=token_limit,
+        mmr_lambda=RERANK_MMR_LAMBDA,
+        max_documents=RERANK_MAX_DOCUMENTS,
+    )
+
+async def modify_relevant_items(docs: list[Document], employee_config: EmployeeConfig, token_limit: int = DEFAULT_TOKEN_LIMIT) -> dict[str, str | list[str]]:
     """
     Format relevant documents into a context string with source information.
     
     Args:
         docs: List of document objects
+        employee_config: Configuration of the org the documents were retrieved for
+        token_limit: Context token budget of the model answering the query
         
     Returns:
         dict: Contains formatted context and source IDs
     """
-    if not employee_config:
-        raise ValueError("Employee configuration not loaded. Call get_employee_config first.")
-        
     return await shared_modify_relevant_items(
         docs=docs,
         about=employee_config.about,
-        catalog=""
+        catalog="",
+        token_limit=token_limit,
+        truncate=TRUNCATE_SOURCES,
     )
@@ -0,0 +1,37 @@
+import asyncio
+import logging
+from typing import Optional
+
+from api.employee_desk.chains import warm_employee_desk_chains
+from api.employee_desk.utils import chatlog_writer
+from shared.secrets import secrets
+from shared.startup import mark_ready, startup_phase
+from shared.tokens import get_encoder
+
+_warmup_lock = asyncio.Lock()
+
+async def open_connection_pools() -> None:
+    """Attach the pooled Cosmos container used for chat logs (and memory) so the first turn doesn't bootstrap it."""
+    await chatlog_writer.repo_factory().init_container()
+
+async def warm_up_employee_desk(org_ids: Optional[list[str]] = None) -> None:
+    """
+    Bring a worker to the state the first chat turn would otherwise have to reach itself:
+    secrets fetched, tokenizer loaded, chains (configs, prompts, retrievers, LLM clients and
+    their HTTP pools) built and Cosmos attached. Marks the worker ready when done; a
+    failing step is logged and the remaining steps still run.
+    """
+    async with _warmup_lock:
+        steps = (
+            ("warmup:secrets", secrets.aprefetch),
+            ("warmup:tokenizer", lambda: asyncio.get_running_loop().run_in_executor(None, get_encoder)),
+            ("warmup:chains", lambda: warm_employee_desk_chains(org_ids)),
+            ("warmup:pools", open_connection_pools),
+        )
+        for phase, step in steps:
+            with startup_phase(phase):
+                try:
+                    await step()
+                except Exception as e:
+                    logging.warning(f"Warmup step {phase} failed: {e}")
+        mark_ready()
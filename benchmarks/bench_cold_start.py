@@ -0,0 +1,104 @@
+"""
+Measure worker cold start: each run is a fresh Python process that imports function_app,
+optionally runs the warmup subsystem, then sends the first chat turn (greeting + question)
+against the local fakes. Reports p50/p95/p99 per phase for runs without and with warmup.
+
+Usage:
+    python -m benchmarks.bench_cold_start [--runs 20] [--llm-ttft 0.3] [--secret-latency 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from time import perf_counter
+
+from benchmarks.fakes import FakeServiceSettings, create_openai_app, create_search_app, start_app
+from shared.metrics import Histogram
+
+PHASES = ("import_seconds", "warmup_seconds", "first_turn_seconds", "total_seconds")
+
+async def child(args: argparse.Namespace) -> dict:
+    """One cold start, run inside a fresh process."""
+    settings = FakeServiceSettings(cosmos_latency=args.cosmos_latency, secret_latency=args.secret_latency)
+    llm_url, search_url = f"http://127.0.0.1:{args.llm_port}", f"http://127.0.0.1:{args.search_port}"
+    os.environ["AZURE_AI_SEARCH_ENDPOINT_OVERRIDE"] = search_url
+
+    start_time = perf_counter()
+    import function_app  # noqa: F401
+    import_seconds = perf_counter() - start_time
+
+    from benchmarks.load_test import _user_function, install_fakes, run_conversation
+    install_fakes(settings, llm_url, search_url)
+
+    warmup_seconds = 0.0
+    if args.warmup:
+        from api.employee_desk.warmup import warm_up_employee_desk
+        warmup_start = perf_counter()
+        await warm_up_employee_desk()
+        warmup_seconds = perf_counter() - warmup_start
+
+    from blueprints.employeedesk_bp import employeedesk_chat_request
+    from shared.lifecycle import shutdown
+    errors: list[str] = []
+    turn_start = perf_counter()
+    await run_conversation(_user_function(employeedesk_chat_request), ["How many vacation days do I get?"], "coldstart@fourthsquare.com", [], errors)
+    first_turn_seconds = perf_counter() - turn_start
+    await shutdown()
+    return {
+        "import_seconds": import_seconds,
+        "warmup_seconds": warmup_seconds,
+        "first_turn_seconds": first_turn_seconds,
+        "total_seconds": import_seconds + warmup_seconds + first_turn_seconds,
+        "errors": errors,
+    }
+
+async def run_process(args: argparse.Namespace, warmup: bool) -> dict:
+    command = [
+        sys.executable, "-m", "benchmarks.bench_cold_start", "--child",
+        "--llm-port", str(args.llm_port), "--search-port", str(args.search_port),
+        "--cosmos-latency", str(args.cosmos_latency), "--secret-latency", str(args.secret_latency),
+    ] + (["--warmup"] if warmup else [])
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE)
+    stdout, _ = await process.communicate()
+    return json.loads(stdout.decode().strip().splitlines()[-1])
+
+async def main(args: argparse.Namespace) -> None:
+    settings = FakeServiceSettings(llm_time_to_first_token=args.llm_ttft, search_latency=args.search_latency)
+    llm_runner = await start_app(create_openai_app(settings), "127.0.0.1", args.llm_port)
+    search_runner = await start_app(create_search_app(settings), "127.0.0.1", args.search_port)
+    try:
+        print(f"{'mode':<10} {'phase':<20} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for label, warmup in (("lazy", False), ("warmed", True)):
+            histograms = {phase: Histogram() for phase in PHASES}
+            errors = 0
+            for _ in range(args.runs):
+                result = await run_process(args, warmup)
+                errors += len(result["errors"])
+                for phase in PHASES:
+                    histograms[phase].observe(result[phase])
+            for phase, histogram in histograms.items():
+                summary = histogram.summary()
+                print(f"{label:<10} {phase:<20} {summary['p50']:>8.3f} {summary['p95']:>8.3f} {summary['p99']:>8.3f}")
+            if errors:
+                print(f"{label:<10} {errors} failed turns")
+    finally:
+        await llm_runner.cleanup()
+        await search_runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20, help="Cold starts per mode")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="Fake LLM time to first token (s)")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Fake search latency (s)")
+    parser.add_argument("--cosmos-latency", type=float, default=0.01, help="Fake Cosmos latency per call (s)")
+    parser.add_argument("--secret-latency", type=float, default=0.05, help="Fake Key Vault latency per secret (s)")
+    parser.add_argument("--llm-port", type=int, default=8711)
+    parser.add_argument("--search-port", type=int, default=8712)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--warmup", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(asyncio.run(child(args))))
+    else:
+        asyncio.run(main(args))
@@ -0,0 +1,68 @@
+"""
+Compare the old context packing in `modify_relevant_items` with the token-budget packer.
+
+Usage:
+    python -m benchmarks.bench_token_packing [--repeat 20]
+"""
+import argparse
+import asyncio
+import random
+from time import perf_counter
+
+from langchain.schema import Document
+from tiktoken import get_encoding
+
+from shared.tokens import token_counter
+from shared.utils import modify_relevant_items
+
+WORDS = (
+    "employee leave policy vacation sick days benefits payroll manager approval request "
+    "laptop vpn password reset onboarding handbook holiday remote work expense reimbursement"
+).split()
+
+async def legacy_modify_relevant_items(docs: list[Document], about: str, catalog: str = "") -> dict:
+    """The packing loop as it was: re-encodes the full context for every document."""
+    context: str = f'Source 1: \n\n{about}{catalog}\n\n'
+    source_num: int = 2
+    context_id: list[str] = []
+    TOKEN_LIMIT = 3600
+
+    for doc in docs:
+        encoding = get_encoding('cl100k_base')
+        if len(encoding.encode(context + doc.page_content)) < TOKEN_LIMIT:
+            context += f'\nSource {source_num}: {doc.metadata["file_name"]}\n\n{doc.page_content}\n'
+            source_num += 1
+            context_id.append(doc.metadata['file_name'])
+
+    return {"context": context, "context_id": context_id}
+
+def make_docs(k: int, words_per_doc: int = 250, seed: int = 7) -> list[Document]:
+    rng = random.Random(seed)
+    return [
+        Document(
+            page_content=" ".join(rng.choice(WORDS) for _ in range(words_per_doc)),
+            metadata={"file_name": f"policy_{i}.pdf"},
+        )
+        for i in range(k)
+    ]
+
+async def time_packer(packer, docs: list[Document], repeat: int) -> float:
+    start = perf_counter()
+    for _ in range(repeat):
+        await packer(docs=docs, about="FourthSquare HR and IT policies.")
+    return (perf_counter() - start) / repeat * 1000
+
+async def main(repeat: int) -> None:
+    print(f"{'k':>5} {'legacy ms':>12} {'packer cold ms':>15} {'packer warm ms':>15} {'speedup (warm)':>15}")
+    for k in (3, 20, 100):
+        docs = make_docs(k)
+        legacy_ms = await time_packer(legacy_modify_relevant_items, docs, repeat)
+        token_counter._counts.clear()
+        cold_ms = await time_packer(modify_relevant_items, docs, 1)
+        warm_ms = await time_packer(modify_relevant_items, docs, repeat)
+        print(f"{k:>5} {legacy_ms:>12.2f} {cold_ms:>15.2f} {warm_ms:>15.2f} {legacy_ms / warm_ms:>14.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per measurement")
+    asyncio.run(main(parser.parse_args().repeat))
@@ -0,0 +1,124 @@
+"""
+Compare context selection strategies offline on logged ChatResponse records.
+
+For every logged turn the candidates for its search_query are retrieved once, then each
+strategy picks the context: "top3" packs the first three search results (the default),
+the others rerank the over-fetched candidates and select at most
+EMPLOYEE_DESK_RERANK_MAX_DOCUMENTS of them within the model's budget. Per strategy it
+reports selection latency, documents and context tokens used, recall of the logged
+context_id, and answer support: the share of the logged answer's content words that
+appear in the selected context.
+
+Usage:
+    python -m benchmarks.eval_rerank --input chat_responses.jsonl --org-id <org>
+    python -m benchmarks.eval_rerank --from-cosmos --limit 500 --org-id <org> [--cross-encoder]
+"""
+import argparse
+import asyncio
+import json
+from time import perf_counter
+
+from api.employee_desk.retrievers import TOP_K, get_retriever
+from api.employee_desk.schemas import EmployeeChatResponseRepository
+from api.employee_desk.utils import RERANK_CANDIDATES, RERANK_MAX_DOCUMENTS, get_employee_config
+from benchmarks.eval_rewrite_gate import load_records
+from shared.hybrid_index import tokenize
+from shared.llms import get_stage_model_name
+from shared.metrics import Histogram
+from shared.rerank import CrossEncoderReranker, LexicalReranker
+from shared.schemas import ChatResponse
+from shared.secrets import secrets
+from shared.tokens import count_tokens, get_token_limit
+from shared.utils import modify_relevant_items, rerank_relevant_items
+
+async def fetch_records(limit: int) -> list[ChatResponse]:
+    repo = EmployeeChatResponseRepository(conn_str=secrets.azure_cosmos_db_connection_string)
+    return await repo.query(
+        "SELECT TOP @limit c.query, c.search_query, c.answer, c.context_id, c.org_id FROM c ORDER BY c.timestamp DESC",
+        [{"name": "@limit", "value": limit}],
+    )
+
+def answer_support(answer: str, context: str) -> float:
+    words = {word for word in tokenize(answer) if len(word) > 3}
+    return len(words & set(tokenize(context))) / len(words) if words else 1.0
+
+async def evaluate(records: list[ChatResponse], org_id: str, cross_encoder: bool = False) -> dict:
+    employee_config = await get_employee_config(org_id=org_id)
+    token_limit = get_token_limit(get_stage_model_name("query_response", employee_config.models))
+    retriever = await get_retriever(org_id=org_id, top_k=RERANK_CANDIDATES)
+
+    strategies = {
+        "top3": None,
+        "lexical": (LexicalReranker(), None),
+        "lexical_mmr": (LexicalReranker(), 0.7),
+    }
+    if cross_encoder:
+        strategies["cross_encoder"] = (CrossEncoderReranker(), None)
+        strategies["cross_encoder_mmr"] = (CrossEncoderReranker(), 0.7)
+    results = {
+        name: {"seconds": Histogram(), "documents": Histogram(), "context_tokens": Histogram(), "recall": [], "support": []}
+        for name in strategies
+    }
+    retrieval_seconds = Histogram()
+
+    for record in records:
+        if not record.search_query or not record.answer or record.org_id not in (None, org_id):
+            continue
+        start_time = perf_counter()
+        candidates = await retriever.ainvoke(record.search_query)
+        retrieval_seconds.observe(perf_counter() - start_time)
+
+        for name, strategy in strategies.items():
+            start_time = perf_counter()
+            if strategy is None:
+                selected = candidates[:TOP_K]
+            else:
+                reranker, mmr_lambda = strategy
+                selected = await rerank_relevant_items(
+                    record.search_query, candidates, about=employee_config.about,
+                    reranker=reranker, token_limit=token_limit, mmr_lambda=mmr_lambda,
+                    max_documents=RERANK_MAX_DOCUMENTS,
+                )
+            packed = await modify_relevant_items(docs=selected, about=employee_config.about, token_limit=token_limit)
+            result = results[name]
+            result["seconds"].observe(perf_counter() - start_time)
+            result["documents"].observe(len(packed["context_id"]))
+            result["context_tokens"].observe(count_tokens(packed["context"]))
+            if record.context_id:
+                result["recall"].append(len(set(record.context_id) & set(packed["context_id"])) / len(set(record.context_id)))
+            result["support"].append(answer_support(record.answer, packed["context"]))
+
+    def mean(values: list[float]) -> float | None:
+        return round(sum(values) / len(values), 3) if values else None
+
+    return {
+        "records": retrieval_seconds.count,
+        "candidates": RERANK_CANDIDATES,
+        "max_documents": RERANK_MAX_DOCUMENTS,
+        "token_limit": token_limit,
+        "retrieval_seconds": retrieval_seconds.summary(),
+        "strategies": {
+            name: {
+                "selection_seconds": result["seconds"].summary(),
+                "mean_documents": round(result["documents"].summary()["mean"], 2),
+                "mean_context_tokens": round(result["context_tokens"].summary()["mean"], 1),
+                "logged_context_recall": mean(result["recall"]),
+                "answer_support": mean(result["support"]),
+            }
+            for name, result in results.items()
+        },
+    }
+
+async def main(args: argparse.Namespace) -> None:
+    records = await fetch_records(args.limit) if args.from_cosmos else load_records(args.input)
+    print(json.dumps(await evaluate(records, args.org_id, cross_encoder=args.cross_encoder), indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="JSONL export of ChatResponse records")
+    source.add_argument("--from-cosmos", action="store_true", help="Read the latest records from chat_responses")
+    parser.add_argument("--limit", type=int, default=500, help="Records to read with --from-cosmos")
+    parser.add_argument("--org-id", required=True, help="Org whose index is queried")
+    parser.add_argument("--cross-encoder", action="store_true", help="Also evaluate the cross-encoder (needs sentence-transformers)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""
+Replay logged ChatResponse records through the rewrite gate and check retrieval is unchanged.
+
+For every logged turn the gate would now bypass, the raw query is retrieved and its
+documents are compared with the documents retrieved for the logged (LLM-rewritten)
+search_query. Records come from a JSONL export of chat_responses or straight from Cosmos.
+
+Usage:
+    python -m benchmarks.eval_rewrite_gate --input chat_responses.jsonl --org-id fourthsquare
+    python -m benchmarks.eval_rewrite_gate --from-cosmos --limit 500 --org-id fourthsquare
+"""
+import argparse
+import asyncio
+import json
+from collections import Counter
+
+from api.employee_desk.retrievers import get_retriever
+from api.employee_desk.rewrite_gate import rewrite_gate
+from api.employee_desk.schemas import EmployeeChatResponseRepository
+from shared.schemas import ChatResponse
+from shared.secrets import secrets
+
+def load_records(path: str) -> list[ChatResponse]:
+    with open(path, encoding="utf-8") as records_file:
+        return [ChatResponse.model_validate(json.loads(line)) for line in records_file if line.strip()]
+
+async def fetch_records(limit: int) -> list[ChatResponse]:
+    repo = EmployeeChatResponseRepository(conn_str=secrets.azure_cosmos_db_connection_string)
+    return await repo.query(
+        "SELECT TOP @limit c.query, c.search_query, c.memory, c.context_id, c.conversation_id FROM c ORDER BY c.timestamp DESC",
+        [{"name": "@limit", "value": limit}],
+    )
+
+async def evaluate(records: list[ChatResponse], org_id: str) -> dict:
+    retriever = await get_retriever(org_id=org_id)
+    reasons: Counter = Counter()
+    overlaps: list[float] = []
+    identical = 0
+
+    for record in records:
+        if not record.query or not record.search_query:
+            continue
+        needs_rewrite, reason = rewrite_gate.decide(record.query, record.memory)
+        reasons[reason] += 1
+        if needs_rewrite or record.search_query.strip() == record.query.strip():
+            continue
+        raw_docs, rewritten_docs = await asyncio.gather(
+            retriever.ainvoke(record.query),
+            retriever.ainvoke(record.search_query),
+        )
+        raw_ids = {doc.metadata.get("file_name") for doc in raw_docs}
+        rewritten_ids = {doc.metadata.get("file_name") for doc in rewritten_docs}
+        union = raw_ids | rewritten_ids
+        overlaps.append(len(raw_ids & rewritten_ids) / len(union) if union else 1.0)
+        identical += raw_ids == rewritten_ids
+
+    bypassed = sum(count for reason, count in reasons.items() if reason in ("empty_memory", "self_contained"))
+    total = sum(reasons.values())
+    return {
+        "records": total,
+        "bypass_rate": round(bypassed / total, 3) if total else 0.0,
+        "reasons": dict(reasons),
+        "compared_bypassed_turns": len(overlaps),
+        "mean_jaccard": round(sum(overlaps) / len(overlaps), 3) if overlaps else None,
+        "identical_context_rate": round(identical / len(overlaps), 3) if overlaps else None,
+    }
+
+async def main(args: argparse.Namespace) -> None:
+    records = await fetch_records(args.limit) if args.from_cosmos else load_records(args.input)
+    print(json.dumps(await evaluate(records, args.org_id), indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="JSONL export of ChatResponse records")
+    source.add_argument("--from-cosmos", action="store_true", help="Read the latest records from chat_responses")
+    parser.add_argument("--limit", type=int, default=500, help="Records to read with --from-cosmos")
+    parser.add_argument("--org-id", default="fourthsquare", help="Org whose index is queried")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,203 @@
+"""
+Local stand-ins for the Azure services the employee desk calls, for load testing:
+
+ - FakeCosmosRepository: in-memory AsyncCosmosRepository with a per-call latency
+ - FakeKeyVaultBackend: SecretBackend serving fixed values with a per-fetch latency
+ - search app: Azure AI Search compatible `GET /indexes/{index}/docs` over a synthetic corpus
+ - openai app: Azure OpenAI compatible `POST /openai/deployments/{deployment}/chat/completions`
+   with configurable time to first token and token rate, streaming and structured outputs
+"""
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional, Type
+
+from aiohttp import web
+from pydantic import BaseModel
+
+from shared.secrets import SECRET_NAMES, SecretBackend
+
+WORDS = (
+    "employee leave policy vacation sick days benefits payroll manager approval request "
+    "laptop vpn password reset onboarding handbook holiday remote work expense reimbursement "
+    "insurance dental retirement training travel badge office parking overtime timesheet"
+).split()
+
+@dataclass
+class FakeServiceSettings:
+    cosmos_latency: float = 0.01
+    secret_latency: float = 0.05
+    search_latency: float = 0.05
+    llm_time_to_first_token: float = 0.3
+    llm_tokens_per_second: float = 80.0
+    answer_tokens: int = 120
+    corpus_size: int = 200
+    seed: int = 7
+
+class FakeCosmosRepository:
+    """
+    In-memory AsyncCosmosRepository. Queries ignore the SQL text: items are filtered on every
+    `@name` parameter (except `@limit`) as an equality on the `name` field, newest first.
+    """
+    def __init__(self, store: dict[str, list[dict]], container_name: str, model_cls: Type[BaseModel], latency: float = 0.0):
+        self.items = store.setdefault(container_name, [])
+        self.container_name = container_name
+        self.model_cls = model_cls
+        self.latency = latency
+
+    async def init_container(self) -> None:
+        await asyncio.sleep(self.latency)
+
+    async def create(self, item: BaseModel) -> BaseModel:
+        await asyncio.sleep(self.latency)
+        self.items.append(item.model_dump())
+        return item
+
+    async def update(self, item: BaseModel) -> BaseModel:
+        return await self.create(item)
+
+    async def upsert_batch(self, items: list[BaseModel], partition_key: str) -> None:
+        await asyncio.sleep(self.latency)
+        self.items.extend(item.model_dump() for item in items)
+
+    async def iter_query(
+        self,
+        query: str,
+        parameters: Optional[list[dict]] = None,
+        partition_key: Optional[str] = None,
+        max_item_count: Optional[int] = None,
+        continuation: Optional[str] = None,
+        projection: Optional[Type[BaseModel]] = None,
+        raw: bool = False,
+    ) -> AsyncIterator[BaseModel | dict]:
+        await asyncio.sleep(self.latency)
+        filters = {param["name"].lstrip("@"): param["value"] for param in parameters or []}
+        limit = filters.pop("limit", None)
+        matches = [item for item in self.items if all(item.get(field) == value for field, value in filters.items())]
+        matches.sort(key=lambda item: item.get("timestamp") or "", reverse=True)
+        for item in matches[:limit]:
+            yield item if raw else (projection or self.model_cls).model_validate(item)
+
+    async def query(self, query: str, parameters: Optional[list[dict]] = None, partition_key: Optional[str] = None) -> list[BaseModel]:
+        return [item async for item in self.iter_query(query, parameters, partition_key=partition_key)]
+
+    async def close(self) -> None:
+        pass
+
+class FakeKeyVaultBackend(SecretBackend):
+    """Serves `values` (Key Vault name -> value), sleeping `latency` seconds per fetch like a vault round trip."""
+    def __init__(self, values: dict[str, str], latency: float = 0.0):
+        self.values = values
+        self.latency = latency
+
+    def get_secret(self, name: str) -> Optional[str]:
+        time.sleep(self.latency)
+        return self.values.get(name)
+
+def fake_secret_values(llm_url: str, search_url: str) -> dict[str, str]:
+    values = {name: f"fake-{name.lower()}" for name in SECRET_NAMES.values()}
+    values.update({
+        "AZURE-AI-SERVICE-ENDPOINT-EASTUS": llm_url,
+        "AZURE-AI-SERVICE-ENDPOINT-EASTUS2": llm_url,
+        "AZURE-AI-SEARCH-SERVICE-ENDPOINT": search_url,
+    })
+    return values
+
+def _words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+def create_search_app(settings: FakeServiceSettings) -> web.Application:
+    """Azure AI Search `docs` endpoint ranking a synthetic corpus by word overlap with `search`."""
+    rng = random.Random(settings.seed)
+    corpus = [
+        {"chunk": _words(rng, 250), "file_name": f"policy_{i}.pdf"}
+        for i in range(settings.corpus_size)
+    ]
+    corpus_words = [set(doc["chunk"].split()) for doc in corpus]
+
+    async def search(request: web.Request) -> web.Response:
+        await asyncio.sleep(settings.search_latency)
+        query_words = set(request.query.get("search", "").lower().split())
+        top = int(request.query.get("$top", "3"))
+        scores = [len(query_words & words) for words in corpus_words]
+        ranked = sorted(range(len(corpus)), key=lambda i: scores[i], reverse=True)[:top]
+        return web.json_response({"value": [{"@search.score": float(scores[i]), **corpus[i]} for i in ranked]})
+
+    app = web.Application()
+    app.router.add_get("/indexes/{index}/docs", search)
+    return app
+
+def _fill_schema(schema: dict, rng: random.Random, answer_tokens: int, name: str = "") -> object:
+    """Generate a value matching a (strict) JSON schema; the `answer` field gets `answer_tokens` words."""
+    kind = schema.get("type")
+    if kind == "object":
+        return {key: _fill_schema(value, rng, answer_tokens, key) for key, value in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_fill_schema(schema.get("items", {}), rng, answer_tokens, name) for _ in range(3)]
+    if kind in ("integer", "number"):
+        return 1
+    if kind == "boolean":
+        return True
+    return _words(rng, answer_tokens if name == "answer" else 12)
+
+def create_openai_app(settings: FakeServiceSettings) -> web.Application:
+    """
+    Azure OpenAI chat completions. Every response waits `llm_time_to_first_token`, then emits
+    completion tokens (one per word) at `llm_tokens_per_second`.
+    """
+    rng = random.Random(settings.seed)
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        deployment = request.match_info["deployment"]
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            content = json.dumps(_fill_schema(response_format["json_schema"]["schema"], rng, settings.answer_tokens))
+        else:
+            content = _words(rng, settings.answer_tokens)
+        # one chunk per word keeps the token rate simple; JSON punctuation rides along
+        pieces = [piece + " " for piece in content.split(" ")]
+        pieces[-1] = pieces[-1].rstrip(" ")
+        prompt_tokens = sum(len(str(message.get("content") or "")) for message in body.get("messages", [])) // 4
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(pieces), "total_tokens": prompt_tokens + len(pieces)}
+        delay_per_token = 1 / settings.llm_tokens_per_second if settings.llm_tokens_per_second else 0
+        completion_id, created = f"chatcmpl-fake-{rng.getrandbits(32):08x}", int(time.time())
+
+        await asyncio.sleep(settings.llm_time_to_first_token)
+        if not body.get("stream"):
+            await asyncio.sleep(delay_per_token * len(pieces))
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": deployment,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content, "refusal": None}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(choices: list, **extra) -> None:
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": deployment, "choices": choices, **extra}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+        for index, piece in enumerate(pieces):
+            delta = {"role": "assistant", "content": piece} if index == 0 else {"content": piece}
+            await send([{"index": 0, "delta": delta, "finish_reason": None}])
+            await asyncio.sleep(delay_per_token)
+        await send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send([], usage=usage)
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post("/openai/deployments/{deployment}/chat/completions", chat_completions)
+    return app
+
+async def start_app(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,226 @@
+"""
+Drive the `employeedesk/chat` handler against local fakes of Cosmos, Azure AI Search,
+Key Vault and Azure OpenAI, and report throughput, latency percentiles and per-stage timings.
+
+Results are written to <output-dir>/<commit>.json so runs can be compared across commits.
+
+Usage:
+    python -m benchmarks.load_test [--conversations 50] [--concurrency 10] [--traces traces.jsonl]
+        [--llm-ttft 0.3] [--llm-tokens-per-second 80] [--search-latency 0.05] [--cosmos-latency 0.01]
+        [--compare <commit or results file>]
+
+A trace line is {"turns": ["first question", "follow-up", ...]}.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+from datetime import datetime, timezone
+from time import perf_counter
+from typing import Optional
+
+import azure.functions as func
+
+from benchmarks.fakes import (
+    FakeCosmosRepository,
+    FakeKeyVaultBackend,
+    FakeServiceSettings,
+    create_openai_app,
+    create_search_app,
+    fake_secret_values,
+    start_app,
+)
+from shared.metrics import Histogram, metrics
+
+DEFAULT_TRACES = [
+    ["How many vacation days do I get?", "And sick leave?", "Who approves it?"],
+    ["How do I reset my VPN password?", "What if that doesn't work?"],
+    ["What is the expense reimbursement policy for travel?", "Does it cover parking?", "How long does payment take?"],
+    ["How do I enroll in dental insurance?"],
+    ["Can I work remotely on Fridays?", "Do I need manager approval for that?"],
+    ["Where do I submit my timesheet?", "And overtime?"],
+]
+
+ORG_ID = "fourthsquare"
+HISTOGRAM_PREFIXES = ("employee_desk.stage_seconds", "cosmos.operation_seconds", "llm.")
+
+def load_traces(path: Optional[str]) -> list[list[str]]:
+    if not path:
+        return DEFAULT_TRACES
+    with open(path, encoding="utf-8") as traces_file:
+        return [json.loads(line)["turns"] for line in traces_file if line.strip()]
+
+def current_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def install_fakes(settings: FakeServiceSettings, llm_url: str, search_url: str) -> dict[str, list[dict]]:
+    """
+    Point the app at the fakes: env-selected endpoints, a fake secret backend and in-memory
+    repositories. Must run before the blueprint is imported.
+    """
+    os.environ["AZURE_AI_SEARCH_ENDPOINT_OVERRIDE"] = search_url
+    os.environ["EMPLOYEE_DESK_CONFIG_WATCH"] = "false"
+    os.environ["EMPLOYEE_DESK_WARM_ORGS"] = ORG_ID
+    # the fake repository doesn't evaluate the email domain query, so users fall back to the default org
+    os.environ["EMPLOYEE_DESK_DEFAULT_ORG"] = ORG_ID
+
+    from shared.secrets import secrets
+    secrets._backend = FakeKeyVaultBackend(fake_secret_values(llm_url, search_url), latency=settings.secret_latency)
+
+    from api.employee_desk import utils
+    from api.employee_desk.schemas import EmployeeConfig
+    from shared.schemas import ChatResponse
+
+    store: dict[str, list[dict]] = {
+        "company_configs": [EmployeeConfig(
+            id=ORG_ID, org_id=ORG_ID, org_name="FourthSquare", query="HR and IT policies",
+            about="FourthSquare HR and IT policies.", index_name=f"{ORG_ID}-index",
+        ).model_dump()],
+    }
+    utils.EmployeeConfigRepository = lambda conn_str: FakeCosmosRepository(store, "company_configs", EmployeeConfig, settings.cosmos_latency)
+    utils.EmployeeChatResponseRepository = lambda conn_str: FakeCosmosRepository(store, "chat_responses", ChatResponse, settings.cosmos_latency)
+    return store
+
+def _chat_request(body: dict) -> func.HttpRequest:
+    return func.HttpRequest(
+        method="POST",
+        url="/api/employeedesk/chat",
+        headers={"Content-Type": "application/json"},
+        body=json.dumps(body).encode("utf-8"),
+    )
+
+def _user_function(decorated):
+    """Unwrap the v2 programming model's FunctionBuilder to the plain handler."""
+    function = getattr(decorated, "_function", None)
+    return function.get_user_function() if function is not None else decorated
+
+async def run_conversation(handler, turns: list[str], user_email: str, latencies: list[float], errors: list[str]) -> None:
+    greeting = await handler(_chat_request({"org_id": ORG_ID, "user_email": user_email, "conversation": {"role": "user", "content": ""}}))
+    conversation_id = json.loads(greeting.get_body())["conversation_id"]
+    for turn in turns:
+        start_time = perf_counter()
+        response = await handler(_chat_request({
+            "org_id": ORG_ID,
+            "user_email": user_email,
+            "conversation_id": conversation_id,
+            "conversation": {"role": "user", "content": turn},
+        }))
+        latencies.append(perf_counter() - start_time)
+        body = json.loads(response.get_body())
+        if response.status_code != 200 or body.get("__lastupdatedby") != "API":
+            errors.append(f"{response.status_code}: {body}")
+
+async def run_load(args: argparse.Namespace) -> dict:
+    settings = FakeServiceSettings(
+        cosmos_latency=args.cosmos_latency,
+        secret_latency=args.secret_latency,
+        search_latency=args.search_latency,
+        llm_time_to_first_token=args.llm_ttft,
+        llm_tokens_per_second=args.llm_tokens_per_second,
+        answer_tokens=args.answer_tokens,
+    )
+    llm_runner = await start_app(create_openai_app(settings), "127.0.0.1", args.llm_port)
+    search_runner = await start_app(create_search_app(settings), "127.0.0.1", args.search_port)
+    store = install_fakes(settings, f"http://127.0.0.1:{args.llm_port}", f"http://127.0.0.1:{args.search_port}")
+
+    from blueprints.employeedesk_bp import employeedesk_chat_request
+    from shared.lifecycle import shutdown
+    handler = _user_function(employeedesk_chat_request)
+    traces = load_traces(args.traces)
+
+    try:
+        # one untimed turn builds the chain and opens the pools
+        await run_conversation(handler, traces[0][:1], "warmup@fourthsquare.com", [], [])
+        metrics.reset()
+
+        latencies: list[float] = []
+        errors: list[str] = []
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def user(index: int) -> None:
+            async with semaphore:
+                await run_conversation(handler, traces[index % len(traces)], f"user{index}@fourthsquare.com", latencies, errors)
+
+        start_time = perf_counter()
+        await asyncio.gather(*(user(index) for index in range(args.conversations)))
+        duration = perf_counter() - start_time
+        snapshot = metrics.snapshot()
+    finally:
+        await shutdown()
+        await llm_runner.cleanup()
+        await search_runner.cleanup()
+
+    latency = Histogram(max_samples=max(len(latencies), 1))
+    for value in latencies:
+        latency.observe(value)
+    return {
+        "commit": current_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "settings": {**vars(settings), "conversations": args.conversations, "concurrency": args.concurrency},
+        "turns": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(len(latencies) / duration, 3) if duration else 0.0,
+        "latency": latency.summary(),
+        "histograms": {key: summary for key, summary in snapshot["histograms"].items() if key.startswith(HISTOGRAM_PREFIXES)},
+        "chatlogs_written": len(store.get("chat_responses", [])),
+    }
+
+def print_report(result: dict) -> None:
+    latency = result["latency"]
+    print(f"commit {result['commit']}: {result['turns']} turns, {result['errors']} errors in {result['duration_seconds']}s")
+    print(f"throughput {result['throughput_rps']} turns/s | p50 {latency['p50']:.3f}s p95 {latency['p95']:.3f}s p99 {latency['p99']:.3f}s")
+    print(f"{'histogram':<60} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for key, summary in sorted(result["histograms"].items()):
+        print(f"{key:<60} {summary['count']:>6} {summary['p50']:>8.3f} {summary['p95']:>8.3f} {summary['p99']:>8.3f}")
+
+def print_comparison(baseline: dict, result: dict) -> None:
+    """Print throughput, end-to-end and per-histogram p50/p95 of `result` against `baseline`."""
+    rows = [("throughput_rps", baseline["throughput_rps"], result["throughput_rps"])]
+    rows += [(f"latency.{q}", baseline["latency"][q], result["latency"][q]) for q in ("p50", "p95", "p99")]
+    for key in sorted(set(baseline["histograms"]) & set(result["histograms"])):
+        rows += [(f"{key}.{q}", baseline["histograms"][key][q], result["histograms"][key][q]) for q in ("p50", "p95")]
+    print(f"\n{'metric':<66} {baseline['commit']:>12} {result['commit']:>12} {'change':>8}")
+    for name, before, after in rows:
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{name:<66} {before:>12.3f} {after:>12.3f} {change:>8}")
+
+def load_baseline(reference: str, output_dir: str) -> dict:
+    path = reference if os.path.exists(reference) else os.path.join(output_dir, f"{reference}.json")
+    with open(path, encoding="utf-8") as baseline_file:
+        return json.load(baseline_file)
+
+def main(args: argparse.Namespace) -> None:
+    result = asyncio.run(run_load(args))
+    print_report(result)
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"{result['commit']}.json")
+    with open(path, "w", encoding="utf-8") as result_file:
+        json.dump(result, result_file, indent=2)
+    print(f"\nSaved {path}")
+    if args.compare:
+        print_comparison(load_baseline(args.compare, args.output_dir), result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50, help="Conversations to replay")
+    parser.add_argument("--concurrency", type=int, default=10, help="Conversations in flight")
+    parser.add_argument("--traces", help="JSONL file of conversation traces")
+    parser.add_argument("--llm-ttft", type=float, default=0.3, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80.0, help="Fake LLM completion token rate")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="Words in each fake answer")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="Fake search latency (s)")
+    parser.add_argument("--cosmos-latency", type=float, default=0.01, help="Fake Cosmos latency per call (s)")
+    parser.add_argument("--secret-latency", type=float, default=0.05, help="Fake Key Vault latency per secret (s)")
+    parser.add_argument("--llm-port", type=int, default=8701)
+    parser.add_argument("--search-port", type=int, default=8702)
+    parser.add_argument("--output-dir", default=os.path.join("benchmarks", "results"), help="Where run results are saved")
+    parser.add_argument("--compare", help="Baseline commit (in --output-dir) or results file to compare against")
+    main(parser.parse_args())
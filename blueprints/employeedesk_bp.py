@@ -2,8 +2,12 @@ import json
 import logging
 import azure.functions as func
 import azure.durable_functions as df
-from api.employee_desk.endpoints import process_chat_request as process_employee_chat
+from azurefunctions.extensions.http.fastapi import Request, StreamingResponse
 from shared.schemas import ChatRequest
+from shared.startup import log_startup_report
+
+# api.employee_desk pulls in langchain, tiktoken and the LLM clients, so it is imported by
+# the handlers on first use (or by the warmup trigger) rather than at function indexing
 
 bp = df.Blueprint()
 
@@ -11,19 +15,22 @@ bp = df.Blueprint()
 @bp.route(route="employeedesk/chat", methods=["POST"])
 async def employeedesk_chat_request(req: func.HttpRequest) -> func.HttpResponse:
     """Handle employee desk chat requests."""
+    from api.employee_desk.endpoints import process_chat_request as process_employee_chat
+    from api.employee_desk.tenants import TenantForbidden
+    from shared.admission import TenantQuotaExceeded
     try:
         logging.info("Python HTTP trigger function processed a request.")
 
         # Get request body
         try:
             req_body = req.get_json()
-            logging.info(f"Request body: {req_body}")
+            logging.debug(f"Request body: {req_body}")
 
             # Convert request to EmployeeChatRequest
             chat_request = ChatRequest(**req_body)
 
             # Process the chat request
-            response = await process_employee_chat(chat_request)
+            response = await process_employee_chat(chat_request, headers=req.headers)
 
             return func.HttpResponse(
                 body=json.dumps(response),
@@ -47,6 +54,22 @@ async def employeedesk_chat_request(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=400
             )
 
+        except TenantForbidden as forbidden_error:
+            logging.warning(str(forbidden_error))
+            return func.HttpResponse(
+                body=json.dumps({"error": str(forbidden_error)}),
+                mimetype="application/json",
+                status_code=403
+            )
+
+        except TenantQuotaExceeded as quota_error:
+            logging.warning(str(quota_error))
+            return func.HttpResponse(
+                body=json.dumps({"error": str(quota_error)}),
+                mimetype="application/json",
+                status_code=429
+            )
+
         except Exception as e:
             logging.error(f"Error processing request: {str(e)}", exc_info=True)
             return func.HttpResponse(
@@ -64,3 +87,154 @@ async def employeedesk_chat_request(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
             status_code=500
         )
+
+@bp.function_name(name="employeedesk_chat_stream_request")
+@bp.route(route="employeedesk/chat/stream", methods=["POST"])
+async def employeedesk_chat_stream_request(req: Request) -> StreamingResponse:
+    """Handle employee desk chat requests, streaming the answer as server-sent events."""
+    from api.employee_desk.endpoints import format_sse, stream_chat_request as stream_employee_chat
+    from api.employee_desk.tenants import TenantForbidden
+    from shared.admission import TenantQuotaExceeded
+    try:
+        req_body = await req.json()
+        chat_request = ChatRequest(**req_body)
+        events = stream_employee_chat(chat_request, headers=req.headers)
+        # pull the first event here so validation errors still map to a 400
+        first_event = await events.__anext__()
+
+    except json.JSONDecodeError as json_error:
+        logging.error(f"Error parsing JSON: {str(json_error)}")
+        return StreamingResponse(
+            iter([format_sse("error", {"error": "Invalid JSON format"})]),
+            media_type="text/event-stream",
+            status_code=400
+        )
+
+    except ValueError as value_error:
+        logging.error(f"Invalid request format: {str(value_error)}")
+        return StreamingResponse(
+            iter([format_sse("error", {"error": str(value_error)})]),
+            media_type="text/event-stream",
+            status_code=400
+        )
+
+    except TenantForbidden as forbidden_error:
+        logging.warning(str(forbidden_error))
+        return StreamingResponse(
+            iter([format_sse("error", {"error": str(forbidden_error)})]),
+            media_type="text/event-stream",
+            status_code=403
+        )
+
+    except TenantQuotaExceeded as quota_error:
+        logging.warning(str(quota_error))
+        return StreamingResponse(
+            iter([format_sse("error", {"error": str(quota_error)})]),
+            media_type="text/event-stream",
+            status_code=429
+        )
+
+    async def event_stream():
+        yield first_event
+        async for event in events:
+            yield event
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@bp.function_name(name="employeedesk_batch_request")
+@bp.route(route="employeedesk/batch", methods=["POST"])
+async def employeedesk_batch_request(req: Request) -> StreamingResponse:
+    """
+    Answer a JSONL body of questions, streaming one JSON result per line.
+
+    Nothing is checkpointed: after an interrupted response, re-send the items that have no
+    result yet (resuming from a checkpoint is only offered by the batch CLI).
+    """
+    from api.employee_desk.batch import BATCH_CONCURRENCY, parse_batch_items, run_tenant_batch
+    from api.employee_desk.tenants import ORG_ID_HEADER, TenantForbidden, resolve_tenant
+    from shared.admission import TenantQuotaExceeded
+    try:
+        body = (await req.body()).decode("utf-8")
+        items = parse_batch_items(body.splitlines())
+        requested_org_id = req.query_params.get("org_id") or req.headers.get(ORG_ID_HEADER)
+        # every item's user must belong to the batch's org
+        org_ids = {await resolve_tenant(user_email, requested_org_id) for user_email in {item.user_email for item in items}}
+        if len(org_ids) != 1:
+            raise ValueError("A batch must hold the questions of a single org")
+        org_id = org_ids.pop()
+        try:
+            concurrency = int(req.query_params.get("concurrency", BATCH_CONCURRENCY))
+        except ValueError:
+            raise ValueError(f"concurrency must be an integer, got {req.query_params.get('concurrency')!r}")
+        results = run_tenant_batch(items, org_id=org_id, concurrency=concurrency)
+        # pull the first result here so quota errors still map to a 429
+        first_result = await anext(results, None)
+
+    except ValueError as value_error:
+        logging.error(f"Invalid batch request: {str(value_error)}")
+        return StreamingResponse(
+            iter([json.dumps({"error": str(value_error)}) + "\n"]),
+            media_type="application/x-ndjson",
+            status_code=400
+        )
+
+    except TenantForbidden as forbidden_error:
+        logging.warning(str(forbidden_error))
+        return StreamingResponse(
+            iter([json.dumps({"error": str(forbidden_error)}) + "\n"]),
+            media_type="application/x-ndjson",
+            status_code=403
+        )
+
+    except TenantQuotaExceeded as quota_error:
+        logging.warning(str(quota_error))
+        return StreamingResponse(
+            iter([json.dumps({"error": str(quota_error)}) + "\n"]),
+            media_type="application/x-ndjson",
+            status_code=429
+        )
+
+    async def result_stream():
+        if first_result is None:
+            return
+        yield json.dumps(first_result) + "\n"
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@bp.function_name(name="employeedesk_warmup")
+@bp.warm_up_trigger(arg_name="warmup")
+async def employeedesk_warmup(warmup) -> None:
+    """Prefetch secrets, load the tokenizer, pre-build the chains and open pools on a new instance."""
+    from api.employee_desk.warmup import warm_up_employee_desk
+    logging.info("Employee desk warmup invoked")
+    await warm_up_employee_desk()
+    log_startup_report()
+
+@bp.function_name(name="employeedesk_config_changed")
+@bp.cosmos_db_trigger(
+    arg_name="documents",
+    connection="AzureCosmosDbConnectionString",
+    database_name="employee_desk",
+    container_name="company_configs",
+    lease_container_name="leases",
+    create_lease_container_if_not_exists=True,
+)
+async def employeedesk_config_changed(documents: func.DocumentList) -> None:
+    """Invalidate cached configs, chains and search results for orgs whose company_configs document changed."""
+    from api.employee_desk.chains import invalidate_employee_desk_chain
+    from api.employee_desk.retrievers import invalidate_retrieval_cache
+    from api.employee_desk.utils import invalidate_employee_config
+    for document in documents:
+        org_id = document.get("org_id")
+        logging.info(f"Company config changed for org_id {org_id}")
+        invalidate_employee_config(org_id)
+        invalidate_employee_desk_chain(org_id)
+        # an ingestion run bumps index_version after changing the org's index
+        if document.get("index_name"):
+            invalidate_retrieval_cache(document.get("index_name"))
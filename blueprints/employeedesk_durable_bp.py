@@ -0,0 +1,177 @@
+import json
+import logging
+from time import time
+from uuid import uuid4
+import azure.functions as func
+import azure.durable_functions as df
+from shared.schemas import ChatRequest
+
+bp = df.Blueprint()
+
+@bp.function_name(name="employeedesk_chat_async_request")
+@bp.route(route="employeedesk/chat/async", methods=["POST"])
+@bp.durable_client_input(client_name="client")
+async def employeedesk_chat_async_request(req: func.HttpRequest, client: df.DurableOrchestrationClient) -> func.HttpResponse:
+    """
+    Start an employee desk chat turn as a durable orchestration.
+
+    Returns 202 with the status query URLs; pass `?wait=<seconds>` to wait that long for
+    the result before falling back to the 202. Greetings are answered directly with 200,
+    orgs over their quota get a 429.
+    """
+    from api.employee_desk.endpoints import greeting_response, validate_chat_request
+    from api.employee_desk.tenants import TenantForbidden, admit_tenant, resolve_org_id
+    from shared.admission import TenantQuotaExceeded
+    try:
+        chat_request = ChatRequest(**req.get_json())
+        query = validate_chat_request(chat_request)
+        org_id = await resolve_org_id(chat_request, req.headers)
+
+    except json.JSONDecodeError as json_error:
+        logging.error(f"Error parsing JSON: {str(json_error)}")
+        return func.HttpResponse(
+            body=json.dumps({"error": "Invalid JSON format"}),
+            mimetype="application/json",
+            status_code=400
+        )
+
+    except ValueError as value_error:
+        logging.error(f"Invalid request format: {str(value_error)}")
+        return func.HttpResponse(
+            body=json.dumps({"error": str(value_error)}),
+            mimetype="application/json",
+            status_code=400
+        )
+
+    except TenantForbidden as forbidden_error:
+        logging.warning(str(forbidden_error))
+        return func.HttpResponse(
+            body=json.dumps({"error": str(forbidden_error)}),
+            mimetype="application/json",
+            status_code=403
+        )
+
+    if not isinstance(chat_request.conversation_id,str) or chat_request.conversation_id.strip()=='':
+        greeting = greeting_response(str(uuid4()), "Conversation Initialized")
+    elif query == '':
+        greeting = greeting_response(chat_request.conversation_id, "Conversation Continuation")
+    else:
+        greeting = None
+    if greeting is not None:
+        return func.HttpResponse(body=json.dumps(greeting), mimetype="application/json", status_code=200)
+
+    try:
+        # the orchestration's model activities take their own slots; this checks the quota up front
+        async with admit_tenant(org_id):
+            instance_id = await client.start_new(
+                "employeedesk_chat_orchestrator",
+                client_input={"chat_request": chat_request.model_dump(), "query": query, "org_id": org_id, "start_time": time()},
+            )
+
+    except TenantQuotaExceeded as quota_error:
+        logging.warning(str(quota_error))
+        return func.HttpResponse(
+            body=json.dumps({"error": str(quota_error)}),
+            mimetype="application/json",
+            status_code=429
+        )
+    logging.info(f"Started employee desk orchestration {instance_id}")
+
+    wait = req.params.get("wait")
+    if wait:
+        return await client.wait_for_completion_or_create_check_status_response(
+            req, instance_id, timeout_in_milliseconds=int(float(wait) * 1000)
+        )
+    return client.create_check_status_response(req, instance_id)
+
+@bp.orchestration_trigger(context_name="context")
+def employeedesk_chat_orchestrator(context: df.DurableOrchestrationContext):
+    """
+    Memory and speculative retrieval of the raw query fan out first; the query is then
+    rewritten (only when the rewrite gate asks for it), re-retrieved if it changed,
+    routed, answered and persisted.
+    """
+    from api.employee_desk.durable import merge_usage
+    from api.employee_desk.endpoints import error_response
+    payload: dict = context.get_input()
+    org_id, query = payload["org_id"], payload["query"]
+    chat_request: dict = payload["chat_request"]
+
+    try:
+        memory_result, speculative_result = yield context.task_all([
+            context.call_activity("employeedesk_memory_activity", {"org_id": org_id, "conversation_id": chat_request["conversation_id"]}),
+            context.call_activity("employeedesk_retrieve_activity", {"org_id": org_id, "search_query": query}),
+        ])
+        memory = memory_result["output"]
+        results = {"GetEmployeeMemory": memory_result, "SpeculativeRetrieval": speculative_result}
+
+        rewrite_result = yield context.call_activity(
+            "employeedesk_rewrite_activity", {"org_id": org_id, "query": query, "memory": memory}
+        )
+        search_query = rewrite_result["output"]
+        results["RewriteQuery"] = rewrite_result
+
+        if search_query == query:
+            retrieved = speculative_result["output"]
+        else:
+            retrieve_result = yield context.call_activity(
+                "employeedesk_retrieve_activity", {"org_id": org_id, "search_query": search_query}
+            )
+            retrieved = retrieve_result["output"]
+            results["GetRelevantItems"] = retrieve_result
+
+        state = {"query": query, "memory": memory, "search_query": search_query, **retrieved}
+        generate_result = yield context.call_activity("employeedesk_generate_activity", {"org_id": org_id, "state": state})
+        results["GenerateResponse"] = generate_result
+
+        chain_response = {
+            **state,
+            "conversation_id": chat_request["conversation_id"],
+            "user_email": chat_request.get("user_email"),
+            "org_id": org_id,
+            **generate_result["output"],
+        }
+        response_data = yield context.call_activity("employeedesk_persist_activity", {
+            "chain_response": chain_response,
+            "chat_request": chat_request,
+            "usage": merge_usage(*(result["usage"] for result in results.values())),
+            "start_time": payload["start_time"],
+            "stage_timings": {stage: result["seconds"] for stage, result in results.items()},
+            "stage_tokens": {stage: result["usage"]["total_tokens"] for stage, result in results.items() if result["usage"]["total_tokens"]},
+        })
+        return response_data
+
+    except Exception as e:
+        if not context.is_replaying:
+            logging.error(f"Employee desk orchestration failed: {str(e)}")
+        return error_response(chat_request["conversation_id"])
+
+@bp.activity_trigger(input_name="payload")
+async def employeedesk_memory_activity(payload: dict) -> dict:
+    """Load the conversation memory window."""
+    from api.employee_desk.durable import run_stage
+    return await run_stage(payload["org_id"], "memory", {"conversation_id": payload["conversation_id"]})
+
+@bp.activity_trigger(input_name="payload")
+async def employeedesk_rewrite_activity(payload: dict) -> dict:
+    """Rewrite the query into a standalone search query when it depends on memory."""
+    from api.employee_desk.durable import run_stage
+    return await run_stage(payload["org_id"], "rewrite", {"query": payload["query"], "memory": payload["memory"]})
+
+@bp.activity_trigger(input_name="payload")
+async def employeedesk_retrieve_activity(payload: dict) -> dict:
+    """Retrieve and pack the context for a search query."""
+    from api.employee_desk.durable import run_stage
+    return await run_stage(payload["org_id"], "retrieve", payload["search_query"])
+
+@bp.activity_trigger(input_name="payload")
+async def employeedesk_generate_activity(payload: dict) -> dict:
+    """Route the turn to a deployment and generate the answer."""
+    from api.employee_desk.durable import generate_response
+    return await generate_response(payload["org_id"], payload["state"])
+
+@bp.activity_trigger(input_name="payload")
+async def employeedesk_persist_activity(payload: dict) -> dict:
+    """Queue the finished turn for Cosmos and return the chat API payload."""
+    from api.employee_desk.durable import persist_chat_response
+    return await persist_chat_response(**payload)
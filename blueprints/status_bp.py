@@ -3,6 +3,8 @@ import logging
 
 import azure.durable_functions as df
 import azure.functions as func
+from shared.metrics import metrics
+from shared.startup import get_startup_report, is_ready
 
 bp = df.Blueprint()
 
@@ -13,13 +15,27 @@ async def status(req: func.HttpRequest) -> func.HttpResponse:
     name = req.params.get("name")
     logging.info(f"Name: {name}")
 
+    # ?probe=readiness answers 503 until warmup (or the first chain build) has finished, for load balancer readiness checks
+    ready = is_ready()
     response_body = json.dumps({
         "status": "healthy",
-        "message": "Service is running"
+        "message": "Service is running",
+        "ready": ready,
+        "startup": get_startup_report(),
     })
 
     return func.HttpResponse(
         body=response_body,
         mimetype="application/json",
+        status_code=503 if req.params.get("probe") == "readiness" and not ready else 200
+    )
+
+@bp.function_name(name="metrics")
+@bp.route(route="v1/metrics", methods=["GET"])
+async def metrics_snapshot(req: func.HttpRequest) -> func.HttpResponse:
+    """Return this worker's in-process counters, gauges and p50/p95/p99 histograms."""
+    return func.HttpResponse(
+        body=json.dumps(metrics.snapshot()),
+        mimetype="application/json",
         status_code=200
     )
@@ -1,15 +1,28 @@
 import logging
 import azure.functions as func
-from blueprints.status_bp import bp as status_bp
-from blueprints.employeedesk_bp import bp as employeedesk_bp
+from shared.startup import WARMUP_TRIGGER_AVAILABLE, log_startup_report, mark_ready, startup_phase
+from shared.tracing import configure_tracing
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
+configure_tracing()
+
+with startup_phase("import:status_bp"):
+    from blueprints.status_bp import bp as status_bp
+with startup_phase("import:employeedesk_bp"):
+    from blueprints.employeedesk_bp import bp as employeedesk_bp
+with startup_phase("import:employeedesk_durable_bp"):
+    from blueprints.employeedesk_durable_bp import bp as employeedesk_durable_bp
 
 app = func.FunctionApp(http_auth_level=func.AuthLevel.FUNCTION)
 
 # Register blueprints
 app.register_functions(status_bp)
 app.register_functions(employeedesk_bp)
+app.register_functions(employeedesk_durable_bp)
+
+if not WARMUP_TRIGGER_AVAILABLE:
+    mark_ready()
+log_startup_report()
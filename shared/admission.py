@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+from time import monotonic
+from typing import AsyncIterator, Optional
+
+from shared.metrics import metrics
+from shared.tokens import count_tokens
+
+DEFAULT_COMPLETION_TOKENS = int(os.getenv("LLM_DEFAULT_COMPLETION_TOKENS", "500"))
+
+def _deployment_env(prefix: str, deployment: str) -> Optional[str]:
+    return os.getenv(prefix + deployment.upper().replace("-", "_").replace(".", "_"))
+
+class TokenBucket:
+    """Refills continuously at `rate_per_minute`, holding at most one minute's worth."""
+    def __init__(self, rate_per_minute: float):
+        self.capacity = rate_per_minute
+        self.rate_per_second = rate_per_minute / 60
+        self.tokens = rate_per_minute
+        self.updated_at = monotonic()
+
+    def _refill(self) -> None:
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (0 if they already are)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate_per_second)
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+class DeploymentAdmission:
+    """Request/min and token/min buckets plus a retry-after block for one deployment."""
+    def __init__(self, deployment: str, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.deployment = deployment
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0
+        self.waiting = 0
+        # callers are admitted one at a time, in arrival order
+        self._lock = asyncio.Lock()
+
+    def _wait_time(self, estimated_tokens: int) -> float:
+        wait = self.blocked_until - monotonic()
+        if self.requests:
+            wait = max(wait, self.requests.time_until(1))
+        if self.tokens:
+            wait = max(wait, self.tokens.time_until(estimated_tokens))
+        return wait
+
+    async def admit(self, estimated_tokens: int) -> float:
+        """Wait until the request fits both buckets; returns the seconds spent waiting."""
+        start_time = monotonic()
+        self.waiting += 1
+        metrics.set_gauge("llm.admission_queue_depth", self.waiting, deployment=self.deployment)
+        try:
+            async with self._lock:
+                while (wait := self._wait_time(estimated_tokens)) > 0:
+                    await asyncio.sleep(wait)
+                if self.requests:
+                    self.requests.consume(1)
+                if self.tokens:
+                    self.tokens.consume(estimated_tokens)
+        finally:
+            self.waiting -= 1
+            metrics.set_gauge("llm.admission_queue_depth", self.waiting, deployment=self.deployment)
+        waited = monotonic() - start_time
+        metrics.observe("llm.admission_wait_seconds", waited, deployment=self.deployment)
+        return waited
+
+    def block(self, seconds: float) -> None:
+        """Hold back every caller for `seconds`, e.g. from a 429's retry-after."""
+        self.blocked_until = max(self.blocked_until, monotonic() + seconds)
+
+class AdmissionController:
+    """
+    Shared admission control for every LLM deployment of the worker.
+
+    Limits come from LLM_RPM_<DEPLOYMENT> / LLM_TPM_<DEPLOYMENT> (unset or 0 means unlimited),
+    so they can be set just under the deployment's Azure quota.
+    """
+    def __init__(self):
+        self._deployments: dict[str, DeploymentAdmission] = {}
+
+    def get(self, deployment: str) -> DeploymentAdmission:
+        if deployment not in self._deployments:
+            self._deployments[deployment] = DeploymentAdmission(
+                deployment,
+                requests_per_minute=float(_deployment_env("LLM_RPM_", deployment) or 0),
+                tokens_per_minute=float(_deployment_env("LLM_TPM_", deployment) or 0),
+            )
+        return self._deployments[deployment]
+
+    async def admit(self, deployment: str, estimated_tokens: int) -> float:
+        return await self.get(deployment).admit(estimated_tokens)
+
+    def on_retry_after(self, deployment: str, seconds: float) -> None:
+        metrics.increment("llm.retry_after_blocks", deployment=deployment)
+        self.get(deployment).block(seconds)
+
+class TenantQuotaExceeded(Exception):
+    """A tenant's request could not be admitted within the allowed wait."""
+
+class TenantLimits:
+    """Concurrency slots and a post-paid tokens/min bucket for one tenant (0 means unlimited)."""
+    def __init__(self, org_id: str, max_concurrency: int = 0, tokens_per_minute: float = 0):
+        self.org_id = org_id
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.in_flight = 0
+
+class TenantAdmission:
+    """
+    Per-tenant fairness in front of the shared deployments: each tenant gets its own
+    concurrency slots and token bucket, so a noisy tenant queues (and is eventually
+    rejected) on its own limits instead of starving the others.
+
+    Tokens are charged after each request with the actual usage; while a tenant's bucket
+    is in debt its next requests wait until it refills.
+    """
+    def __init__(self, max_wait: float = 10.0):
+        self.max_wait = max_wait
+        self._tenants: dict[str, TenantLimits] = {}
+
+    def get(self, org_id: str, max_concurrency: int = 0, tokens_per_minute: float = 0) -> TenantLimits:
+        limits = self._tenants.get(org_id)
+        if limits is None or (limits.max_concurrency, limits.tokens_per_minute) != (max_concurrency, tokens_per_minute):
+            limits = TenantLimits(org_id, max_concurrency, tokens_per_minute)
+            self._tenants[org_id] = limits
+        return limits
+
+    def _reject(self, org_id: str, reason: str) -> TenantQuotaExceeded:
+        metrics.increment("tenant.throttled", org_id=org_id, reason=reason)
+        return TenantQuotaExceeded(f"Org {org_id} is over its {reason} quota, retry later")
+
+    @asynccontextmanager
+    async def admit(self, org_id: str, max_concurrency: int = 0, tokens_per_minute: float = 0) -> AsyncIterator[TenantLimits]:
+        """
+        Hold one of the tenant's slots for the duration of the block.
+
+        Raises:
+            TenantQuotaExceeded: If the tenant can't be admitted within `max_wait` seconds
+        """
+        limits = self.get(org_id, max_concurrency, tokens_per_minute)
+        deadline = monotonic() + self.max_wait
+        if limits.tokens:
+            wait = limits.tokens.time_until(1)
+            if wait > self.max_wait:
+                raise self._reject(org_id, "tokens")
+            await asyncio.sleep(wait)
+        if limits.slots:
+            try:
+                await asyncio.wait_for(limits.slots.acquire(), timeout=max(deadline - monotonic(), 0.01))
+            except asyncio.TimeoutError:
+                raise self._reject(org_id, "concurrency")
+        limits.in_flight += 1
+        metrics.set_gauge("tenant.in_flight", limits.in_flight, org_id=org_id)
+        try:
+            yield limits
+        finally:
+            limits.in_flight -= 1
+            metrics.set_gauge("tenant.in_flight", limits.in_flight, org_id=org_id)
+            if limits.slots:
+                limits.slots.release()
+
+    def charge(self, org_id: str, tokens: int) -> None:
+        """Debit the tokens a finished request actually used."""
+        limits = self._tenants.get(org_id)
+        if limits is not None and limits.tokens:
+            limits.tokens.consume(tokens)
+
+def estimate_request_tokens(body: bytes) -> int:
+    """
+    Estimate the tokens a chat completion request will count against TPM:
+    prompt tokens of every message plus the requested (or default) completion size.
+    """
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return DEFAULT_COMPLETION_TOKENS
+    prompt = "".join(
+        content if isinstance(content, str) else json.dumps(content)
+        for content in (message.get("content") or "" for message in payload.get("messages", []))
+    )
+    completion = payload.get("max_completion_tokens") or payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return count_tokens(prompt) + completion
+
+admission_controller = AdmissionController()
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from typing import Awaitable, Callable, Hashable, Optional
+
+import numpy as np
+
+from shared.caches import AsyncTTLCache
+from shared.metrics import metrics
+
+EmbedFn = Callable[[str], Awaitable[list[float]]]
+
+def normalize_query(query: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivially different phrasings share a key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+class AnswerCache:
+    """
+    Cache of generated answers keyed by (org_id, normalized search query, retrieved context ids).
+
+    Exact matches are served from an LRU+TTL cache. When an `embed` coroutine is given,
+    a local in-memory vector index is also searched: an answer is reused if a cached query
+    for the same org and the same context ids has cosine similarity >= `similarity_threshold`.
+    The query embedding computed by `lookup` is handed back so `store` doesn't embed again.
+
+    The vector index holds at most `maxsize` (org, context ids) groups, least recently used
+    evicted first, and drops the rows of evicted or expired answers whenever a group is used.
+    """
+    def __init__(
+        self,
+        maxsize: int = 2048,
+        ttl: Optional[float] = 3600.0,
+        embed: Optional[EmbedFn] = None,
+        similarity_threshold: float = 0.95,
+        name: str = "answer_cache",
+    ):
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.name = name
+        self._answers: AsyncTTLCache[dict] = AsyncTTLCache(maxsize=maxsize, ttl=ttl)
+        # per (org_id, context key): cache keys and the matrix of their unit-norm query embeddings, LRU first
+        self._vectors: "OrderedDict[tuple, tuple[list[Hashable], np.ndarray]]" = OrderedDict()
+        # stores running off the response path, referenced until they finish
+        self._pending_stores: set[asyncio.Task] = set()
+
+    @staticmethod
+    def _context_key(context_id: list[str] | None) -> tuple[str, ...]:
+        return tuple(sorted(context_id or []))
+
+    def _live_group(self, group: tuple) -> Optional[tuple[list[Hashable], np.ndarray]]:
+        """The group's rows whose answers are still cached; a group without any is dropped."""
+        entry = self._vectors.get(group)
+        if entry is None:
+            return None
+        keys, matrix = entry
+        live = [i for i, cached_key in enumerate(keys) if cached_key in self._answers]
+        if not live:
+            del self._vectors[group]
+            return None
+        if len(live) < len(keys):
+            entry = self._vectors[group] = ([keys[i] for i in live], matrix[live])
+        self._vectors.move_to_end(group)
+        return entry
+
+    async def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(await self.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def lookup(self, org_id: str, search_query: str, context_id: list[str] | None) -> tuple[Optional[dict], Optional[np.ndarray]]:
+        """
+        Return a cached answer, trying an exact key first and then the vector index.
+
+        Returns:
+            tuple: (cached answer or None, the query embedding if one was computed, for `store`)
+        """
+        context_key = self._context_key(context_id)
+        cached = self._answers.get((org_id, normalize_query(search_query), context_key))
+        if cached is not None:
+            metrics.increment(f"{self.name}.hits", match="exact")
+            return cached, None
+
+        vector = None
+        group = self._live_group((org_id, context_key)) if self.embed is not None else None
+        if group is not None:
+            keys, matrix = group
+            vector = await self._embed(search_query)
+            similarities = matrix @ vector
+            for index in np.argsort(similarities)[::-1]:
+                if similarities[index] < self.similarity_threshold:
+                    break
+                cached = self._answers.get(keys[index])
+                if cached is not None:
+                    metrics.increment(f"{self.name}.hits", match="semantic")
+                    return cached, vector
+
+        metrics.increment(f"{self.name}.misses")
+        return None, vector
+
+    async def store(
+        self,
+        org_id: str,
+        search_query: str,
+        context_id: list[str] | None,
+        answer: dict,
+        vector: Optional[np.ndarray] = None,
+    ) -> None:
+        """Cache an answer; `vector` is the query embedding returned by `lookup`, embedded here when missing."""
+        context_key = self._context_key(context_id)
+        key = (org_id, normalize_query(search_query), context_key)
+        is_new = key not in self._answers
+        self._answers.set(key, answer)
+        if self.embed is None or not is_new:
+            return
+
+        if vector is None:
+            vector = await self._embed(search_query)
+        group = (org_id, context_key)
+        keys, matrix = self._live_group(group) or ([], np.empty((0, vector.shape[0]), dtype=np.float32))
+        self._vectors[group] = (keys + [key], np.vstack([matrix, vector[None, :]]))
+        self._vectors.move_to_end(group)
+        # every live answer belongs to one group, so more groups than answers means dead ones
+        while len(self._vectors) > self._answers.maxsize:
+            self._vectors.popitem(last=False)
+
+    def store_in_background(
+        self,
+        org_id: str,
+        search_query: str,
+        context_id: list[str] | None,
+        answer: dict,
+        vector: Optional[np.ndarray] = None,
+    ) -> None:
+        """Run `store` as a task so a needed embedding call doesn't delay the response."""
+        async def store() -> None:
+            try:
+                await self.store(org_id, search_query, context_id, answer, vector=vector)
+            except Exception as e:
+                logging.warning(f"{self.name} could not store an answer: {e}")
+                metrics.increment(f"{self.name}.store_errors")
+        task = asyncio.create_task(store())
+        self._pending_stores.add(task)
+        task.add_done_callback(self._pending_stores.discard)
+
+    def invalidate(self, org_id: Optional[str] = None) -> None:
+        """Drop cached answers for an org, or all answers when org_id is None."""
+        if org_id is None:
+            self._answers.invalidate()
+            self._vectors.clear()
+            return
+        for vector_key in [vector_key for vector_key in self._vectors if vector_key[0] == org_id]:
+            keys, _ = self._vectors.pop(vector_key)
+            for key in keys:
+                self._answers.invalidate(key)
+        for key in [key for key in self._answers.keys() if key[0] == org_id]:
+            self._answers.invalidate(key)
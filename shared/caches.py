@@ -0,0 +1,85 @@
+import asyncio
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+class AsyncTTLCache(Generic[V]):
+    """
+    Async in-process cache with LRU eviction and a per-entry TTL.
+
+    `get_or_load` runs the loader at most once per key at a time: concurrent
+    callers missing on the same key wait on the same build instead of
+    starting their own.
+    """
+    def __init__(self, maxsize: int = 128, ttl: Optional[float] = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple[float, V]]" = OrderedDict()
+        self._locks: dict[Hashable, asyncio.Lock] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> list[Hashable]:
+        """Snapshot of the current keys, least recently used first (may include expired ones)."""
+        return list(self._entries)
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """Return the cached value for `key`, or None if missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at and expires_at < monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = monotonic() + ttl if ttl else 0.0
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[V]]) -> V:
+        """
+        Return the cached value for `key`, building it with `loader` on a miss.
+
+        Args:
+            key: Cache key
+            loader: Zero-argument coroutine function producing the value
+
+        Returns:
+            The cached or freshly loaded value
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                # another caller may have filled the entry while we waited
+                value = self.get(key)
+                if value is None:
+                    value = await loader()
+                    self.set(key, value)
+                return value
+        finally:
+            if not lock.locked() and self._locks.get(key) is lock:
+                self._locks.pop(key, None)
+
+    def invalidate(self, key: Any = None) -> None:
+        """Drop one entry, or every entry when `key` is None."""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
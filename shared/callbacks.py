@@ -0,0 +1,105 @@
+from time import perf_counter
+from typing import Any, Iterable, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from opentelemetry import trace
+
+from shared.metrics import metrics
+from shared.tracing import tracer
+
+def _total_tokens(response: Any) -> int:
+    """Total tokens of an LLMResult, from the provider's token_usage or the messages' usage_metadata."""
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage.get("total_tokens"):
+        return usage["total_tokens"]
+    total = 0
+    for generations in response.generations:
+        for generation in generations:
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            total += usage_metadata.get("total_tokens", 0)
+    return total
+
+class StageTimingCallbackHandler(BaseCallbackHandler):
+    """
+    Records wall-clock duration and LLM token usage of named runnables (chains and
+    retrievers) for one invocation, and wraps each of them in an OpenTelemetry span.
+
+    Only runs whose `run_name` is in `stage_names` are timed. A stage that runs more than
+    once in the same invocation is reported as `name`, `name#2`, ... Every duration is also
+    observed in the `<metric_prefix>.stage_seconds{stage=...}` histogram. Tokens of an LLM
+    call are attributed to its nearest enclosing stage in `token_counts`.
+    """
+    run_inline = True
+
+    def __init__(self, stage_names: Iterable[str], metric_prefix: str = "chain"):
+        self.stage_names = set(stage_names)
+        self.metric_prefix = metric_prefix
+        self.timings: dict[str, float] = {}
+        self.token_counts: dict[str, int] = {}
+        self._starts: dict[UUID, tuple[str, float, trace.Span]] = {}
+        self._parents: dict[UUID, Optional[UUID]] = {}
+
+    def _nearest_stage(self, run_id: Optional[UUID]) -> Optional[UUID]:
+        while run_id is not None and run_id not in self._starts:
+            run_id = self._parents.get(run_id)
+        return run_id
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: Optional[str]) -> None:
+        self._parents[run_id] = parent_run_id
+        if name in self.stage_names:
+            parent = self._nearest_stage(parent_run_id)
+            context = trace.set_span_in_context(self._starts[parent][2]) if parent is not None else None
+            span = tracer.start_span(name, context=context)
+            self._starts[run_id] = (name, perf_counter(), span)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        name, start_time, span = started
+        duration = perf_counter() - start_time
+        if error is not None:
+            span.record_exception(error)
+            span.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+        span.end()
+        key, occurrence = name, 1
+        while key in self.timings:
+            occurrence += 1
+            key = f"{name}#{occurrence}"
+        self.timings[key] = round(duration, 4)
+        metrics.observe(f"{self.metric_prefix}.stage_seconds", duration, stage=name)
+
+    def on_chain_start(self, serialized: Optional[dict[str, Any]], inputs: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, kwargs.get("name"))
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized: Optional[dict[str, Any]], query: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._start(run_id, parent_run_id, kwargs.get("name"))
+
+    def on_retriever_end(self, documents: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id)
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized: Optional[dict[str, Any]], messages: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._parents[run_id] = parent_run_id
+
+    def on_llm_start(self, serialized: Optional[dict[str, Any]], prompts: Any, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._parents[run_id] = parent_run_id
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        stage = self._nearest_stage(self._parents.get(run_id))
+        tokens = _total_tokens(response)
+        if stage is None or not tokens:
+            return
+        name = self._starts[stage][0]
+        self.token_counts[name] = self.token_counts.get(name, 0) + tokens
+        self._starts[stage][2].set_attribute("llm.total_tokens", self.token_counts[name])
+        metrics.observe(f"{self.metric_prefix}.stage_tokens", tokens, stage=name)
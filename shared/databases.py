@@ -1,21 +1,59 @@
+import asyncio
 from abc import ABC
-from typing import Generic, TypeVar, Type, List, Optional
+from typing import Any, AsyncIterator, Generic, TypeVar, Type, List, Optional, Tuple
 from pydantic import BaseModel
+from azure.core import MatchConditions
 from azure.cosmos.aio import CosmosClient
 from azure.cosmos import PartitionKey, exceptions, ContainerProxy
 
+from shared.lifecycle import on_shutdown
+from shared.metrics import metrics
+from shared.tracing import traced
+
 T = TypeVar("T", bound=BaseModel)
+P = TypeVar("P", bound=BaseModel)
+
+# Process-wide pools: one client per connection string, one bootstrapped proxy per container
+_clients: dict[str, CosmosClient] = {}
+_containers: dict[Tuple[str, str, str], ContainerProxy] = {}
+_container_locks: dict[Tuple[str, str, str], asyncio.Lock] = {}
+
+def projection_clause(model_cls: Type[BaseModel], alias: str = "c") -> str:
+    """Select list for exactly the fields of `model_cls`, e.g. `c.id, c.org_id`, instead of `SELECT *`."""
+    return ", ".join(f"{alias}.{field}" for field in model_cls.model_fields)
+
+def get_cosmos_client(connection_string: str) -> CosmosClient:
+    """Return the pooled CosmosClient for a connection string, creating it on first use."""
+    client = _clients.get(connection_string)
+    if client is None:
+        client = CosmosClient.from_connection_string(connection_string)
+        _clients[connection_string] = client
+        metrics.increment("cosmos.clients_created")
+    else:
+        metrics.increment("cosmos.client_reuses")
+    return client
+
+@on_shutdown
+async def close_cosmos_clients() -> None:
+    """Close every pooled client. Registered as an app shutdown hook."""
+    clients = list(_clients.values())
+    _clients.clear()
+    _containers.clear()
+    _container_locks.clear()
+    for client in clients:
+        await client.close()
 
 class AsyncCosmosRepository(Generic[T], ABC):
     """
     Async generic Cosmos “repository”:
-     - connects via connection string
-     - optionally bootstraps database+container
+     - connects via a pooled client shared by every repository with the same connection string
+     - optionally bootstraps database+container, once per process
      - exposes async create/read/update/delete/query
     """
     def __init__(self,connection_string: str,database_name: str,container_name: str,model_cls: Type[T],partition_key_path: str = "/id",create_if_not_exists: bool = False):
         # note: don't await in __init__; client is ready to use
-        self.client = CosmosClient.from_connection_string(connection_string)
+        self.connection_string = connection_string
+        self.client = get_cosmos_client(connection_string)
         self.database_name = database_name
         self.container_name = container_name
         self.partition_key_path = partition_key_path
@@ -24,31 +62,56 @@ class AsyncCosmosRepository(Generic[T], ABC):
         self.container: Optional[ContainerProxy] = None
 
     async def init_container(self):
-        """Call this once before using CRUD methods (e.g. at app startup)."""
-        if self.create_if_not_exists:
-            # ensure DB exists
-            await self.client.create_database_if_not_exists(id=self.database_name)
-            db = self.client.get_database_client(self.database_name)
-            # ensure container exists
-            await db.create_container_if_not_exists(
-                id=self.container_name,
-                partition_key=PartitionKey(path=self.partition_key_path),
-            )
-        self.container = self.client.get_database_client(self.database_name).get_container_client(self.container_name)
+        """Attach the pooled container proxy, bootstrapping it on the first call in the process."""
+        key = (self.connection_string, self.database_name, self.container_name)
+        container = _containers.get(key)
+        if container is None:
+            async with _container_locks.setdefault(key, asyncio.Lock()):
+                container = _containers.get(key)
+                if container is None:
+                    if self.create_if_not_exists:
+                        # ensure DB exists
+                        await self.client.create_database_if_not_exists(id=self.database_name)
+                        db = self.client.get_database_client(self.database_name)
+                        # ensure container exists
+                        await db.create_container_if_not_exists(
+                            id=self.container_name,
+                            partition_key=PartitionKey(path=self.partition_key_path),
+                        )
+                    container = self.client.get_database_client(self.database_name).get_container_client(self.container_name)
+                    _containers[key] = container
+                    metrics.increment("cosmos.container_bootstraps", container=self.container_name)
+        else:
+            metrics.increment("cosmos.container_reuses", container=self.container_name)
+        self.container = container
 
     async def create(self, item: T) -> T:
         if not self.container:
             await self.init_container()
-        created_raw = await self.container.create_item(item.model_dump())
-        await self.close()
+        with traced("cosmos.create", "cosmos.operation_seconds", operation="create", container=self.container_name):
+            created_raw = await self.container.create_item(item.model_dump())
         return self.model_cls.model_validate(created_raw)
 
+    async def upsert_batch(self, items: List[T], partition_key: str) -> None:
+        """
+        Upsert items sharing one partition key in a single transactional batch.
+
+        Cosmos caps a batch at 100 operations; callers are expected to chunk.
+        """
+        if not self.container:
+            await self.init_container()
+        with traced("cosmos.upsert_batch", "cosmos.operation_seconds", operation="upsert_batch", container=self.container_name) as span:
+            span.set_attribute("cosmos.batch_size", len(items))
+            await self.container.execute_item_batch(
+                batch_operations=[("upsert", (item.model_dump(),)) for item in items],
+                partition_key=partition_key,
+            )
+
     async def get(self, id: str, partition_key: str) -> Optional[T]:
         if not self.container:
             await self.init_container()
         try:
             raw = await self.container.read_item(id, partition_key)
-            await self.close()
             return self.model_cls.model_validate(raw)
         except exceptions.CosmosResourceNotFoundError:
             return None
@@ -56,32 +119,143 @@ class AsyncCosmosRepository(Generic[T], ABC):
     async def update(self, item: T) -> T:
         if not self.container:
             await self.init_container()
-        upserted = await self.container.upsert_item(item.model_dump())
-        await self.close()
+        with traced("cosmos.upsert", "cosmos.operation_seconds", operation="upsert", container=self.container_name):
+            upserted = await self.container.upsert_item(item.model_dump())
         return self.model_cls.model_validate(upserted)
 
-    async def delete(self, id: str, partition_key: str) -> None:
+    async def get_with_etag(self, id: str, partition_key: str) -> Tuple[Optional[T], Optional[str]]:
+        """Read an item along with its etag, for a later conditional `patch`."""
         if not self.container:
             await self.init_container()
-        await self.container.delete_item(id, partition_key)
-        await self.close()
+        try:
+            raw = await self.container.read_item(id, partition_key)
+        except exceptions.CosmosResourceNotFoundError:
+            return None, None
+        return self.model_cls.model_validate(raw), raw.get("_etag")
 
-    async def query(self,query: str,parameters: List[dict] = None) -> List[T]:
+    async def patch(self, id: str, partition_key: str, operations: List[dict], etag: Optional[str] = None) -> T:
+        """
+        Apply partial-update operations, e.g. `[{"op": "set", "path": "/index_version", "value": ...}]`,
+        leaving every other field of the stored item as is.
+
+        Raises:
+            CosmosAccessConditionFailedError: If `etag` is given and the item changed since it was read
+        """
         if not self.container:
             await self.init_container()
+        condition: dict[str, Any] = {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag else {}
+        with traced("cosmos.patch", "cosmos.operation_seconds", operation="patch", container=self.container_name):
+            patched = await self.container.patch_item(id, partition_key, patch_operations=operations, **condition)
+        return self.model_cls.model_validate(patched)
+
+    async def delete(self, id: str, partition_key: str) -> None:
+        if not self.container:
+            await self.init_container()
+        with traced("cosmos.delete", "cosmos.operation_seconds", operation="delete", container=self.container_name):
+            await self.container.delete_item(id, partition_key)
+
+    def _query_pages(self, query: str, parameters: Optional[List[dict]], partition_key: Optional[str], max_item_count: Optional[int], continuation: Optional[str]):
         # Pass everything except the query itself as keyword args
-        docs_iter = self.container.query_items(
+        query_kwargs: dict[str, Any] = {}
+        if partition_key is not None:
+            query_kwargs["partition_key"] = partition_key
+        if max_item_count is not None:
+            query_kwargs["max_item_count"] = max_item_count
+        return self.container.query_items(
             query=query,
-            parameters=parameters or []
-        )
+            parameters=parameters or [],
+            **query_kwargs
+        ).by_page(continuation)
+
+    async def iter_query(
+        self,
+        query: str,
+        parameters: Optional[List[dict]] = None,
+        partition_key: Optional[str] = None,
+        max_item_count: Optional[int] = None,
+        continuation: Optional[str] = None,
+        projection: Optional[Type[P]] = None,
+        raw: bool = False,
+    ) -> AsyncIterator[T | P | dict]:
+        """
+        Stream query results one page at a time instead of materializing them. Each page
+        fetch is traced on its own, so spans measure Cosmos rather than the consumer.
+
+        Args:
+            query: Parameterized SQL query
+            parameters: Query parameters
+            partition_key: Scope the query to one partition (avoids a cross-partition fan-out)
+            max_item_count: Page size requested from Cosmos
+            continuation: Continuation token to resume from, as returned by `query_page`
+            projection: Lightweight model to validate into instead of the repository model;
+                pair it with a query selecting only its fields (see `projection_clause`)
+            raw: Yield the documents as dicts, skipping pydantic validation
+
+        Yields:
+            Validated models, or dicts when `raw` is set
+        """
+        if not self.container:
+            await self.init_container()
+        model_cls = projection or self.model_cls
+        pages = self._query_pages(query, parameters, partition_key, max_item_count, continuation)
+        while True:
+            # one span per page fetch; none is held open while the caller consumes the page
+            with traced("cosmos.iter_query", "cosmos.operation_seconds", operation="iter_query", container=self.container_name) as span:
+                page = await anext(pages, None)
+                docs = [doc async for doc in page] if page is not None else []
+                span.set_attribute("cosmos.page_items", len(docs))
+            if page is None:
+                return
+            for doc in docs:
+                yield doc if raw else model_cls.model_validate(doc)
+
+    async def query_page(
+        self,
+        query: str,
+        parameters: Optional[List[dict]] = None,
+        partition_key: Optional[str] = None,
+        max_item_count: int = 100,
+        continuation: Optional[str] = None,
+        projection: Optional[Type[P]] = None,
+        raw: bool = False,
+    ) -> Tuple[List[T | P | dict], Optional[str]]:
+        """
+        Read a single page of results.
+
+        Returns:
+            (items, continuation token for the next page, or None after the last page)
+        """
+        if not self.container:
+            await self.init_container()
+        model_cls = projection or self.model_cls
+        pages = self._query_pages(query, parameters, partition_key, max_item_count, continuation)
+        items: list = []
+        with traced("cosmos.query_page", "cosmos.operation_seconds", operation="query_page", container=self.container_name):
+            async for page in pages:
+                async for doc in page:
+                    items.append(doc if raw else model_cls.model_validate(doc))
+                break
+        return items, pages.continuation_token
+
+    async def query(self,query: str,parameters: List[dict] = None,partition_key: Optional[str] = None) -> List[T]:
+        return [item async for item in self.iter_query(query, parameters, partition_key=partition_key)]
 
-        results: List[T] = []
-        # query_items returns an async iterator
-        async for doc in docs_iter:
-            results.append(self.model_cls.model_validate(doc))
-        await self.close()
-        return results
+    async def read_change_feed(self, continuation: Optional[str] = None) -> Tuple[List[T], Optional[str]]:
+        """
+        Read the container's change feed from `continuation` (or from now on the first call).
+        """
+        if not self.container:
+            await self.init_container()
+        feed_kwargs = {"continuation": continuation} if continuation else {"start_time": "Now"}
+        changes: List[T] = []
+        async for doc in self.container.query_items_change_feed(**feed_kwargs):
+            changes.append(self.model_cls.model_validate(doc))
+        continuation = self.container.client_connection.last_response_headers.get("etag", continuation)
+        return changes, continuation
 
     async def close(self) -> None:
-        """Call this when you’re completely done with the client."""
-        await self.client.close()
\ No newline at end of file
+        """
+        Detach this repository from its container. The pooled client stays open for other
+        repositories and is closed by `close_cosmos_clients` at app shutdown.
+        """
+        self.container = None
\ No newline at end of file
@@ -0,0 +1,292 @@
+import json
+import math
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from threading import RLock
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"\w+")
+RRF_K = 60
+
+def tokenize(text: str) -> list[str]:
+    """Lowercased word tokens used by the BM25 index."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+@dataclass
+class IndexedChunk:
+    """One searchable chunk: `chunk` is the text, everything else is returned as Document metadata."""
+    id: str
+    chunk: str
+    file_name: str
+    metadata: dict = field(default_factory=dict)
+    # row of the chunk's embedding in the vector file, -1 when it was indexed without one
+    row: int = -1
+
+class BM25Index:
+    """In-memory BM25 (Okapi) inverted index with incremental add/remove."""
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[str, int]] = {}
+        self.doc_terms: dict[str, list[str]] = {}
+        self.doc_lengths: dict[str, int] = {}
+        self.total_length = 0
+
+    def add(self, doc_id: str, text: str) -> None:
+        self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        length = sum(counts.values())
+        self.doc_terms[doc_id] = list(counts)
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id: str) -> None:
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(doc_id):
+            del self.postings[term][doc_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int) -> list[tuple[str, float]]:
+        if not self.doc_lengths:
+            return []
+        doc_count = len(self.doc_lengths)
+        average_length = self.total_length / doc_count or 1.0
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (doc_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, frequency in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[str]], k: int = RRF_K) -> list[tuple[str, float]]:
+    """Fuse ranked id lists: score(id) = sum of 1 / (k + rank) over the lists it appears in."""
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+class HybridIndex:
+    """
+    On-disk hybrid (BM25 + dense) index for small corpora such as an org's policy documents.
+
+    A directory holds:
+     - `chunks.jsonl`: append-only log of upserts and deletes, replayed on open
+     - `vectors.f32`: unit-norm float32 embeddings, one row per upserted chunk, read through a memmap
+       (`vectors.<generation>.f32` once compacted)
+     - `index.json`: the embedding dimension
+
+    Updates append to both files, so other processes pick them up with `refresh()` without
+    reloading the whole index; there must be a single writer per directory. Rows of replaced
+    or deleted chunks stay in the vector file until `compact()` rewrites both files as the
+    next generation: a new vector file, and a new log (a new inode) that starts with the
+    generation, so readers replay it from the start against the matching vectors.
+    Searches fuse the BM25 and cosine rankings with reciprocal-rank fusion.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.chunks: dict[str, IndexedChunk] = {}
+        self.bm25 = BM25Index()
+        self.dim: Optional[int] = None
+        self.generation = 0
+        self._vectors: Optional[np.memmap] = None
+        self._log_offset = 0
+        self._log_inode: Optional[int] = None
+        self._lock = RLock()
+        os.makedirs(path, exist_ok=True)
+        self.refresh()
+
+    @property
+    def _log_path(self) -> str:
+        return os.path.join(self.path, "chunks.jsonl")
+
+    @property
+    def _meta_path(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    def _generation_vectors_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors.{generation}.f32" if generation else "vectors.f32")
+
+    @property
+    def _vectors_path(self) -> str:
+        return self._generation_vectors_path(self.generation)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def refresh(self) -> bool:
+        """Replay log entries written since the last refresh (e.g. by an ingestion run). Returns True if any were applied."""
+        with self._lock:
+            if self.dim is None and os.path.exists(self._meta_path):
+                # the first embeddings may have been written by another process since the last refresh
+                with open(self._meta_path, encoding="utf-8") as meta_file:
+                    self.dim = json.load(meta_file).get("dim")
+            if not os.path.exists(self._log_path):
+                return False
+            stat = os.stat(self._log_path)
+            if stat.st_ino != self._log_inode or stat.st_size < self._log_offset:
+                # first open, or the log was compacted into a new file: replay it from the start
+                self.chunks.clear()
+                self.bm25 = BM25Index()
+                self.generation = 0
+                self._log_offset = 0
+                self._log_inode = stat.st_ino
+            elif stat.st_size == self._log_offset:
+                if self._vectors is None:
+                    self._open_vectors()
+                return False
+            with open(self._log_path, "rb") as log_file:
+                log_file.seek(self._log_offset)
+                for line in log_file:
+                    # a partially written last line is picked up by the next refresh
+                    if not line.endswith(b"\n"):
+                        break
+                    self._apply(json.loads(line))
+                    self._log_offset += len(line)
+            self._open_vectors()
+            return True
+
+    def _apply(self, entry: dict) -> None:
+        if entry["op"] == "generation":
+            self.generation = entry["generation"]
+            return
+        if entry["op"] == "delete":
+            self.chunks.pop(entry["id"], None)
+            self.bm25.remove(entry["id"])
+            return
+        chunk = IndexedChunk(
+            id=entry["id"], chunk=entry["chunk"], file_name=entry["file_name"],
+            metadata=entry.get("metadata") or {}, row=entry.get("row", -1),
+        )
+        self.chunks[chunk.id] = chunk
+        self.bm25.add(chunk.id, f"{chunk.file_name} {chunk.chunk}")
+
+    def _open_vectors(self) -> None:
+        self._vectors = None
+        if not self.dim or not os.path.exists(self._vectors_path):
+            return
+        rows = os.path.getsize(self._vectors_path) // (4 * self.dim)
+        if rows:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def _vector_rows(self) -> int:
+        return os.path.getsize(self._vectors_path) // (4 * self.dim) if self.dim and os.path.exists(self._vectors_path) else 0
+
+    def upsert(self, chunks: Sequence[IndexedChunk], vectors: Optional[Sequence[Sequence[float]]] = None) -> None:
+        """Add or replace chunks, with one embedding per chunk when `vectors` is given."""
+        with self._lock:
+            self.refresh()
+            rows = -1
+            if vectors is not None:
+                matrix = np.asarray(vectors, dtype=np.float32)
+                if matrix.shape[0] != len(chunks):
+                    raise ValueError(f"Got {matrix.shape[0]} vectors for {len(chunks)} chunks")
+                if self.dim is None:
+                    self.dim = int(matrix.shape[1])
+                    with open(self._meta_path + ".tmp", "w", encoding="utf-8") as meta_file:
+                        json.dump({"dim": self.dim}, meta_file)
+                    os.replace(self._meta_path + ".tmp", self._meta_path)
+                elif matrix.shape[1] != self.dim:
+                    raise ValueError(f"Vectors have dimension {matrix.shape[1]}, the index uses {self.dim}")
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix = matrix / np.where(norms == 0, 1, norms)
+                rows = self._vector_rows()
+                with open(self._vectors_path, "ab") as vectors_file:
+                    vectors_file.write(matrix.tobytes())
+            with open(self._log_path, "a", encoding="utf-8") as log_file:
+                for offset, chunk in enumerate(chunks):
+                    chunk.row = rows + offset if rows >= 0 else -1
+                    log_file.write(json.dumps({
+                        "op": "upsert", "id": chunk.id, "chunk": chunk.chunk, "file_name": chunk.file_name,
+                        "metadata": chunk.metadata, "row": chunk.row,
+                    }) + "\n")
+            self.refresh()
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            self.refresh()
+            with open(self._log_path, "a", encoding="utf-8") as log_file:
+                for doc_id in ids:
+                    log_file.write(json.dumps({"op": "delete", "id": doc_id}) + "\n")
+            self.refresh()
+
+    def compact(self) -> None:
+        """Rewrite the log and vector file with only the live chunks, as the next generation."""
+        with self._lock:
+            self.refresh()
+            live = list(self.chunks.values())
+            vectors = self._vectors
+            old_vectors_path = self._vectors_path
+            generation = self.generation + 1
+            vectors_path = self._generation_vectors_path(generation)
+            log_tmp, vectors_tmp = self._log_path + ".tmp", vectors_path + ".tmp"
+            next_row = 0
+            with open(log_tmp, "w", encoding="utf-8") as log_file, open(vectors_tmp, "wb") as vectors_file:
+                log_file.write(json.dumps({"op": "generation", "generation": generation}) + "\n")
+                for chunk in live:
+                    row = -1
+                    if vectors is not None and 0 <= chunk.row < vectors.shape[0]:
+                        vectors_file.write(np.asarray(vectors[chunk.row]).tobytes())
+                        row, next_row = next_row, next_row + 1
+                    log_file.write(json.dumps({
+                        "op": "upsert", "id": chunk.id, "chunk": chunk.chunk, "file_name": chunk.file_name,
+                        "metadata": chunk.metadata, "row": row,
+                    }) + "\n")
+            # the new vectors are in place before the log that points at them
+            os.replace(vectors_tmp, vectors_path)
+            os.replace(log_tmp, self._log_path)
+            self._vectors = None
+            self.refresh()
+            try:
+                # readers still mapping the old generation keep their open mapping
+                os.remove(old_vectors_path)
+            except OSError:
+                pass
+
+    def dead_rows(self) -> int:
+        """Vector rows no live chunk points at; worth a `compact()` once they outnumber the live ones."""
+        with self._lock:
+            return self._vector_rows() - sum(1 for chunk in self.chunks.values() if chunk.row >= 0)
+
+    def _dense_search(self, query_vector: Sequence[float], limit: int) -> list[tuple[str, float]]:
+        if self._vectors is None:
+            return []
+        vector = np.asarray(query_vector, dtype=np.float32)
+        if vector.shape[0] != self.dim:
+            return []
+        norm = np.linalg.norm(vector)
+        similarities = np.asarray(self._vectors @ (vector / norm if norm else vector))
+        live = {chunk.row: chunk.id for chunk in self.chunks.values() if 0 <= chunk.row < similarities.shape[0]}
+        if not live:
+            return []
+        rows = np.fromiter(live.keys(), dtype=np.int64)
+        scores = similarities[rows]
+        order = np.argsort(scores)[::-1][:limit]
+        return [(live[int(rows[i])], float(scores[i])) for i in order]
+
+    def search(self, query: str, top_k: int, query_vector: Optional[Sequence[float]] = None, candidates: Optional[int] = None) -> list[tuple[IndexedChunk, float]]:
+        """
+        Return the `top_k` best chunks for a query with their fused scores. Each ranking
+        contributes its best `candidates` (default 4 * top_k, at least 20) chunks to the fusion.
+        """
+        limit = candidates or max(top_k * 4, 20)
+        with self._lock:
+            rankings = [[doc_id for doc_id, _ in self.bm25.search(query, limit)]]
+            if query_vector is not None:
+                rankings.append([doc_id for doc_id, _ in self._dense_search(query_vector, limit)])
+            fused = reciprocal_rank_fusion(ranking for ranking in rankings if ranking)
+            return [(self.chunks[doc_id], score) for doc_id, score in fused[:top_k]]
@@ -0,0 +1,361 @@
+"""
+Building blocks for ingesting documents into a search index:
+
+ - sources list documents (with a content hash when the store provides one) and read them:
+   DiskSource for a local directory, BlobSource for an Azure Blob container (or Azurite)
+ - chunk_text splits a document into token-bounded chunks with the query-time encoder
+ - embed_texts embeds chunks in batches with bounded concurrency
+ - sinks upsert and delete chunks: LocalIndexSink (HybridIndex) and AzureSearchSink
+ - IngestManifest remembers each document's content hash and chunk ids, so `ingest`
+   only re-processes documents whose content changed and drops chunks of removed ones
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional, Sequence
+
+from shared.hybrid_index import HybridIndex, IndexedChunk
+from shared.metrics import metrics
+from shared.tokens import DEFAULT_ENCODING, get_encoder
+
+CHUNK_TOKENS = int(os.getenv("INGESTION_CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("INGESTION_CHUNK_OVERLAP_TOKENS", "64"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("INGESTION_EMBEDDING_BATCH_SIZE", "64"))
+INGESTION_CONCURRENCY = int(os.getenv("INGESTION_CONCURRENCY", "4"))
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown")
+
+EmbedDocumentsFn = Callable[[list[str]], Awaitable[list[list[float]]]]
+
+@dataclass
+class SourceEntry:
+    name: str
+    # hash reported by the store (e.g. a blob's Content-MD5); None means hash the downloaded content
+    content_hash: Optional[str] = None
+
+class DocumentSource(ABC):
+    @abstractmethod
+    async def list(self) -> list[SourceEntry]:
+        ...
+
+    @abstractmethod
+    async def read(self, name: str) -> bytes:
+        ...
+
+    def owns(self, name: str) -> bool:
+        """Whether a document of the manifest falls under this source; only those are deleted when unlisted."""
+        return True
+
+    async def close(self) -> None:
+        pass
+
+class DiskSource(DocumentSource):
+    """Text documents under a local directory, named by their path relative to `root`."""
+    def __init__(self, root: str, extensions: Sequence[str] = TEXT_EXTENSIONS):
+        self.root = root
+        self.extensions = tuple(extensions)
+
+    def _walk(self) -> list[SourceEntry]:
+        # a mistyped root would otherwise list nothing
+        if not os.path.isdir(self.root):
+            raise FileNotFoundError(f"Document directory {self.root} doesn't exist")
+        entries = []
+        for directory, _, file_names in os.walk(self.root):
+            for file_name in sorted(file_names):
+                if file_name.lower().endswith(self.extensions):
+                    path = os.path.relpath(os.path.join(directory, file_name), self.root)
+                    entries.append(SourceEntry(name=path.replace(os.sep, "/")))
+        return entries
+
+    async def list(self) -> list[SourceEntry]:
+        return await asyncio.to_thread(self._walk)
+
+    async def read(self, name: str) -> bytes:
+        def read_file() -> bytes:
+            with open(os.path.join(self.root, name), "rb") as source_file:
+                return source_file.read()
+        return await asyncio.to_thread(read_file)
+
+class BlobSource(DocumentSource):
+    """
+    Text blobs of an Azure Blob Storage container; works against Azurite with
+    connection string "UseDevelopmentStorage=true". Unchanged blobs are skipped
+    from their Content-MD5 without being downloaded.
+    """
+    def __init__(self, connection_string: str, container_name: str, prefix: str = "", extensions: Sequence[str] = TEXT_EXTENSIONS):
+        from azure.storage.blob.aio import ContainerClient
+        self.client = ContainerClient.from_connection_string(connection_string, container_name)
+        self.prefix = prefix
+        self.extensions = tuple(extensions)
+
+    async def list(self) -> list[SourceEntry]:
+        entries = []
+        async for blob in self.client.list_blobs(name_starts_with=self.prefix or None):
+            if not blob.name.lower().endswith(self.extensions):
+                continue
+            md5 = blob.content_settings.content_md5 if blob.content_settings else None
+            entries.append(SourceEntry(name=blob.name, content_hash=bytes(md5).hex() if md5 else None))
+        return entries
+
+    async def read(self, name: str) -> bytes:
+        downloader = await self.client.download_blob(name)
+        return await downloader.readall()
+
+    def owns(self, name: str) -> bool:
+        return name.startswith(self.prefix)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, encoding_name: str = DEFAULT_ENCODING) -> list[tuple[str, int]]:
+    """
+    Split text into chunks of at most `max_tokens` tokens with the encoder used at query time.
+
+    Paragraphs are packed whole while they fit; a paragraph longer than `max_tokens` is cut
+    into token windows overlapping by `overlap_tokens`.
+
+    Returns:
+        list: (chunk text, token count) pairs
+    """
+    encoder = get_encoder(encoding_name)
+    step = max(max_tokens - overlap_tokens, 1)
+    chunks: list[str] = []
+    current: list[str] = []
+    current_tokens = 0
+
+    def flush() -> None:
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n\n".join(current))
+        current, current_tokens = [], 0
+
+    for paragraph in (part.strip() for part in re.split(r"\n\s*\n", text)):
+        if not paragraph:
+            continue
+        tokens = encoder.encode(paragraph)
+        if len(tokens) > max_tokens:
+            flush()
+            for start in range(0, len(tokens), step):
+                chunks.append(encoder.decode(tokens[start:start + max_tokens]))
+                if start + max_tokens >= len(tokens):
+                    break
+            continue
+        # +2 for the paragraph separator
+        if current and current_tokens + len(tokens) + 2 > max_tokens:
+            flush()
+        current.append(paragraph)
+        current_tokens += len(tokens) + 2
+    flush()
+    return [(chunk, len(encoder.encode(chunk))) for chunk in chunks]
+
+async def embed_texts(texts: list[str], embed_documents: EmbedDocumentsFn, semaphore: asyncio.Semaphore, batch_size: int = EMBEDDING_BATCH_SIZE) -> list[list[float]]:
+    """Embed texts in batches of `batch_size`, running at most as many batches at once as `semaphore` allows."""
+    async def embed_batch(batch: list[str]) -> list[list[float]]:
+        async with semaphore:
+            return await embed_documents(batch)
+
+    batches = await asyncio.gather(*(embed_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)))
+    return [vector for batch in batches for vector in batch]
+
+class IndexSink(ABC):
+    # whether chunks should be embedded before `upsert`
+    wants_vectors: bool = True
+
+    @abstractmethod
+    async def upsert(self, chunks: list[IndexedChunk], vectors: Optional[list[list[float]]]) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, ids: list[str]) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+class LocalIndexSink(IndexSink):
+    def __init__(self, index: HybridIndex):
+        self.index = index
+
+    async def upsert(self, chunks: list[IndexedChunk], vectors: Optional[list[list[float]]]) -> None:
+        await asyncio.to_thread(self.index.upsert, chunks, vectors)
+
+    async def delete(self, ids: list[str]) -> None:
+        await asyncio.to_thread(self.index.delete, ids)
+
+    async def close(self) -> None:
+        # rewrite the vector file once replaced chunks outnumber the live ones
+        if self.index.dead_rows() > len(self.index):
+            await asyncio.to_thread(self.index.compact)
+
+def raise_for_failures(results: list, action: str) -> None:
+    """
+    Raise when any IndexingResult of a batch failed: Azure AI Search reports per-document
+    errors (throttling, schema mismatches) in the results instead of failing the request.
+    """
+    failed = [f"{result.key} ({result.status_code}: {result.error_message})" for result in results if not result.succeeded]
+    if failed:
+        raise RuntimeError(f"Azure AI Search {action} failed for {len(failed)} documents: {', '.join(failed)}")
+
+class AzureSearchSink(IndexSink):
+    """
+    Upserts chunks as `id`, `chunk`, `file_name` and `token_count` fields (plus `vector_field`
+    when set) into an existing Azure AI Search index.
+    """
+    def __init__(self, endpoint: str, index_name: str, api_key: str, vector_field: Optional[str] = None, batch_size: int = 500):
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents.aio import SearchClient
+        self.client = SearchClient(endpoint=endpoint, index_name=index_name, credential=AzureKeyCredential(api_key))
+        self.vector_field = vector_field
+        self.wants_vectors = bool(vector_field)
+        self.batch_size = batch_size
+
+    async def upsert(self, chunks: list[IndexedChunk], vectors: Optional[list[list[float]]]) -> None:
+        documents = []
+        for position, chunk in enumerate(chunks):
+            document = {"id": chunk.id, "chunk": chunk.chunk, "file_name": chunk.file_name, "token_count": chunk.metadata.get("token_count")}
+            if self.vector_field and vectors is not None:
+                document[self.vector_field] = vectors[position]
+            documents.append(document)
+        for start in range(0, len(documents), self.batch_size):
+            raise_for_failures(await self.client.merge_or_upload_documents(documents[start:start + self.batch_size]), "upsert")
+
+    async def delete(self, ids: list[str]) -> None:
+        for start in range(0, len(ids), self.batch_size):
+            raise_for_failures(await self.client.delete_documents([{"id": doc_id} for doc_id in ids[start:start + self.batch_size]]), "delete")
+
+    async def close(self) -> None:
+        await self.client.close()
+
+class IngestManifest:
+    """JSON file of document name -> {"hash", "chunk_ids"} for the documents already in the index."""
+    def __init__(self, path: str):
+        self.path = path
+        self.documents: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as manifest_file:
+                self.documents = json.load(manifest_file)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf-8") as manifest_file:
+            json.dump(self.documents, manifest_file, indent=1, sort_keys=True)
+        os.replace(self.path + ".tmp", self.path)
+
+@dataclass
+class IngestStats:
+    added: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    deleted: int = 0
+    failed: list[str] = field(default_factory=list)
+    chunks: int = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.deleted)
+
+def chunk_id(document_name: str, position: int) -> str:
+    """Index key of a document's chunk; Azure AI Search keys allow letters, digits, '_', '-' and '='."""
+    return f"{hashlib.sha1(document_name.encode('utf-8')).hexdigest()}-{position}"
+
+async def ingest(
+    source: DocumentSource,
+    sink: IndexSink,
+    manifest: IngestManifest,
+    embed_documents: Optional[EmbedDocumentsFn] = None,
+    max_tokens: int = CHUNK_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    concurrency: int = INGESTION_CONCURRENCY,
+    allow_empty_source: bool = False,
+) -> IngestStats:
+    """
+    Bring the index in line with the source: new and changed documents are chunked, embedded
+    (when `embed_documents` is given and the sink takes vectors) and upserted, chunks of
+    removed documents are deleted. The manifest is saved after every document, so an
+    interrupted run resumes where it stopped.
+
+    The manifest covers the whole index, so only documents the source `owns` (e.g. under
+    its blob prefix) are deleted when missing from the listing.
+
+    Raises:
+        ValueError: If the source lists no documents while the manifest holds some of its
+            documents, unless `allow_empty_source` confirms they should all be deleted
+    """
+    stats = IngestStats()
+    document_semaphore = asyncio.Semaphore(concurrency)
+    embedding_semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(entry: SourceEntry) -> None:
+        known = manifest.documents.get(entry.name)
+        if known and entry.content_hash and known["hash"] == entry.content_hash:
+            stats.unchanged += 1
+            return
+        async with document_semaphore:
+            try:
+                content = await source.read(entry.name)
+                content_hash = entry.content_hash or hashlib.sha256(content).hexdigest()
+                if known and known["hash"] == content_hash:
+                    stats.unchanged += 1
+                    return
+                pieces = await asyncio.to_thread(chunk_text, content.decode("utf-8", errors="replace"), max_tokens, overlap_tokens)
+                chunks = [
+                    IndexedChunk(
+                        id=chunk_id(entry.name, position), chunk=text, file_name=entry.name,
+                        metadata={"token_count": token_count, "content_hash": content_hash},
+                    )
+                    for position, (text, token_count) in enumerate(pieces)
+                ]
+                vectors = None
+                if embed_documents is not None and sink.wants_vectors and chunks:
+                    vectors = await embed_texts([chunk.chunk for chunk in chunks], embed_documents, embedding_semaphore)
+                if chunks:
+                    await sink.upsert(chunks, vectors)
+                stale_ids = sorted(set(known["chunk_ids"]) - {chunk.id for chunk in chunks}) if known else []
+                if stale_ids:
+                    await sink.delete(stale_ids)
+            except Exception as e:
+                logging.error(f"Failed to ingest {entry.name}: {e}", exc_info=True)
+                stats.failed.append(entry.name)
+                metrics.increment("ingestion.documents", status="failed")
+                return
+            manifest.documents[entry.name] = {"hash": content_hash, "chunk_ids": [chunk.id for chunk in chunks]}
+            manifest.save()
+            stats.chunks += len(chunks)
+            if known:
+                stats.updated += 1
+            else:
+                stats.added += 1
+            metrics.increment("ingestion.documents", status="updated" if known else "added")
+            metrics.increment("ingestion.chunks", len(chunks))
+
+    try:
+        entries = await source.list()
+        owned = {name for name in manifest.documents if source.owns(name)}
+        if not entries and owned and not allow_empty_source:
+            raise ValueError(
+                f"The source listed no documents; refusing to delete the {len(owned)} documents "
+                "ingested from it (pass allow_empty_source=True to delete them)"
+            )
+        await asyncio.gather(*(process(entry) for entry in entries))
+        listed = {entry.name for entry in entries}
+        for name in sorted(owned - listed):
+            try:
+                await sink.delete(manifest.documents[name]["chunk_ids"])
+            except Exception as e:
+                # kept in the manifest, so the next run retries the delete
+                logging.error(f"Failed to delete {name}: {e}", exc_info=True)
+                stats.failed.append(name)
+                metrics.increment("ingestion.documents", status="failed")
+                continue
+            del manifest.documents[name]
+            manifest.save()
+            stats.deleted += 1
+            metrics.increment("ingestion.documents", status="deleted")
+    finally:
+        await sink.close()
+        await source.close()
+    return stats
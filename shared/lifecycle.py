@@ -0,0 +1,57 @@
+import asyncio
+import atexit
+import logging
+from typing import Awaitable, Callable
+
+ShutdownHook = Callable[[], Awaitable[None]]
+ExitHook = Callable[[], None]
+
+_shutdown_hooks: list[ShutdownHook] = []
+_exit_hooks: list[ExitHook] = []
+
+def on_shutdown(hook: ShutdownHook) -> ShutdownHook:
+    """Register a coroutine function to run once when the app shuts down. Usable as a decorator."""
+    if hook not in _shutdown_hooks:
+        _shutdown_hooks.append(hook)
+    return hook
+
+def on_exit(hook: ExitHook) -> ExitHook:
+    """
+    Register a plain function to run at interpreter exit, before the shutdown hooks.
+
+    By then the worker's event loop is gone, and the shutdown hooks run on a fresh one
+    where tasks and queues of the old loop can't be awaited; work that must survive
+    the exit (e.g. persisting queued writes) belongs here and must not need a loop.
+    """
+    if hook not in _exit_hooks:
+        _exit_hooks.append(hook)
+    return hook
+
+async def shutdown() -> None:
+    """
+    Run the registered shutdown hooks, most recently registered first.
+
+    Errors are logged so one failing hook doesn't stop the others.
+    """
+    while _shutdown_hooks:
+        hook = _shutdown_hooks.pop()
+        try:
+            await hook()
+        except Exception as e:
+            logging.warning(f"Error running shutdown hook {getattr(hook, '__name__', hook)}: {e}")
+
+def _shutdown_at_exit() -> None:
+    while _exit_hooks:
+        hook = _exit_hooks.pop()
+        try:
+            hook()
+        except Exception as e:
+            logging.warning(f"Error running exit hook {getattr(hook, '__name__', hook)}: {e}")
+    if not _shutdown_hooks:
+        return
+    try:
+        asyncio.run(shutdown())
+    except Exception as e:
+        logging.warning(f"Error during app shutdown: {e}")
+
+atexit.register(_shutdown_at_exit)
@@ -1,44 +1,369 @@
-from langchain_openai import AzureChatOpenAI
+import asyncio
+import os
+import re
+from collections import deque
+from functools import lru_cache
+from threading import Lock
+from time import monotonic
+from typing import Callable, Optional
+
+import httpx
+from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
+from pydantic import BaseModel, Field
+
+from shared.admission import admission_controller, estimate_request_tokens
+from shared.lifecycle import on_shutdown
+from shared.metrics import metrics
 from shared.secrets import secrets
 
 AZURE_OPENAI_API_VERSION = "2025-03-01-preview"
 TEMPERATURE = 0.01
 MAX_RETRIES = 2
+EMBEDDING_DEPLOYMENT = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "")
+DEFAULT_MODEL_NAME = os.getenv("DEFAULT_MODEL", "gpt-4o-mini")
+DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
 
-gpt_4_1_nano = AzureChatOpenAI(
-    azure_endpoint=secrets.azure_ai_service_endpoint_eastus2, 
-    azure_deployment="gpt-4.1-nano", 
-    api_version=AZURE_OPENAI_API_VERSION,
-    api_key=secrets.azure_ai_service_api_key_eastus2,
-    max_retries=MAX_RETRIES,
-    temperature=TEMPERATURE
-)
+class ModelSpec(BaseModel):
+    deployment: str = Field(description="Azure OpenAI deployment name")
+    region: str = Field(description="Region whose endpoint/key serve the deployment")
 
-gpt_4_1_mini = AzureChatOpenAI(
-    azure_endpoint=secrets.azure_ai_service_endpoint_eastus2, 
-    azure_deployment="gpt-4.1-mini",
-    api_version=AZURE_OPENAI_API_VERSION, 
-    api_key=secrets.azure_ai_service_api_key_eastus2,
-    max_retries=MAX_RETRIES,
-    temperature=TEMPERATURE,
-)
+# region -> secret attributes for its endpoint and API key
+REGION_SECRETS: dict[str, tuple[str, str]] = {
+    "eastus": ("azure_ai_service_endpoint_eastus", "azure_ai_service_api_key_eastus"),
+    "eastus2": ("azure_ai_service_endpoint_eastus2", "azure_ai_service_api_key_eastus2"),
+}
 
-gpt_4_1 = AzureChatOpenAI(
-    azure_endpoint=secrets.azure_ai_service_endpoint_eastus2, 
-    azure_deployment="gpt-4.1", 
-    api_version=AZURE_OPENAI_API_VERSION,
-    api_key=secrets.azure_ai_service_api_key_eastus2,
-    max_retries=MAX_RETRIES,
-    temperature=TEMPERATURE,
-)
+MODEL_SPECS: dict[str, ModelSpec] = {
+    "gpt-4.1-nano": ModelSpec(deployment="gpt-4.1-nano", region="eastus2"),
+    "gpt-4.1-mini": ModelSpec(deployment="gpt-4.1-mini", region="eastus2"),
+    "gpt-4.1": ModelSpec(deployment="gpt-4.1", region="eastus2"),
+    "gpt-4o-mini": ModelSpec(deployment="gpt-4o-mini", region="eastus"),
+}
+
+# Deployment used by each chain stage; override per stage with MODEL_<STAGE> or per org in EmployeeConfig.models
+STAGE_MODELS: dict[str, str] = {
+    "query_rewriter": os.getenv("MODEL_QUERY_REWRITER", "gpt-4.1-nano"),
+    "query_response": os.getenv("MODEL_QUERY_RESPONSE", DEFAULT_MODEL_NAME),
+}
 
-gpt_4o_mini = AzureChatOpenAI(
-    azure_endpoint=secrets.azure_ai_service_endpoint_eastus, 
-    azure_deployment="gpt-4o-mini",
-    api_version=AZURE_OPENAI_API_VERSION,
-    api_key=secrets.azure_ai_service_api_key_eastus,
-    max_retries=MAX_RETRIES,
-    temperature=TEMPERATURE,
+# Hedged requests go to a replica of the same deployment in another region. LLM_HEDGE_REPLICAS
+# lists the deployments that have one as `<deployment>=<region>` pairs, e.g.
+# "gpt-4o-mini=eastus2,gpt-4.1=eastus"; deployments without a replica are never hedged.
+HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_TARGETS: dict[str, str] = dict(
+    pair.strip().split("=", 1) for pair in os.getenv("LLM_HEDGE_REPLICAS", "").split(",") if "=" in pair
 )
 
-default_model = gpt_4o_mini
\ No newline at end of file
+# deployment -> (name the replica is admitted and tracked under, endpoint, deployment, api key) of its hedge target
+HedgeResolver = Callable[[str], Optional[tuple[str, str, str, str]]]
+
+_DEPLOYMENT_PATH = re.compile(r"/openai/deployments/([^/]+)/")
+
+def deployment_from_url(url: httpx.URL) -> Optional[str]:
+    match = _DEPLOYMENT_PATH.search(url.path)
+    return match.group(1) if match else None
+
+def max_concurrency_for(deployment: str) -> int:
+    """Concurrent requests allowed per deployment; override with LLM_MAX_CONCURRENCY_<DEPLOYMENT>."""
+    env_value = os.getenv("LLM_MAX_CONCURRENCY_" + deployment.upper().replace("-", "_").replace(".", "_").replace("@", "_"))
+    return int(env_value) if env_value else DEFAULT_MAX_CONCURRENCY
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """Seconds to wait from `retry-after-ms` / `retry-after` headers, if present."""
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+class DeploymentStats:
+    """Live latency and throttling statistics for one deployment."""
+    def __init__(self, max_samples: int = 200, throttle_cooldown: float = 30.0):
+        self.latencies: deque[float] = deque(maxlen=max_samples)
+        self.ewma_latency: Optional[float] = None
+        self.requests = 0
+        self.throttled = 0
+        self.throttled_until = 0.0
+        self.throttle_cooldown = throttle_cooldown
+
+    def record(self, latency: float, status_code: int, retry_after: Optional[float] = None) -> None:
+        self.requests += 1
+        if status_code == 429:
+            self.throttled += 1
+            self.throttled_until = max(self.throttled_until, monotonic() + (retry_after or self.throttle_cooldown))
+            return
+        self.latencies.append(latency)
+        self.ewma_latency = latency if self.ewma_latency is None else 0.8 * self.ewma_latency + 0.2 * latency
+
+    @property
+    def is_throttled(self) -> bool:
+        return monotonic() < self.throttled_until
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+# deployment name -> live statistics, fed by DeploymentLimitedTransport
+deployment_stats: dict[str, DeploymentStats] = {}
+
+def get_deployment_stats(deployment: str) -> DeploymentStats:
+    if deployment not in deployment_stats:
+        deployment_stats[deployment] = DeploymentStats()
+    return deployment_stats[deployment]
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body that releases a concurrency slot once it has been fully read or closed."""
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+class DeploymentLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    Pooled HTTP transport shared by the Azure OpenAI clients. Per deployment (taken from
+    the `/openai/deployments/<name>/` request path) it:
+     - admits requests through the shared token-bucket AdmissionController
+     - caps in-flight requests
+     - records latency-to-headers and 429s in `deployment_stats`, and blocks the
+       deployment's admission for the response's retry-after
+     - optionally hedges: once a request outlives the deployment's latency percentile,
+       the same request is sent to the deployment's replica in another region; the first
+       2xx response wins
+    """
+    def __init__(self, max_connections: int = 200, hedge_resolver: Optional[HedgeResolver] = None):
+        self._transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self.hedge_resolver = hedge_resolver
+
+    def _semaphore(self, deployment: str) -> asyncio.Semaphore:
+        if deployment not in self._semaphores:
+            self._semaphores[deployment] = asyncio.Semaphore(max_concurrency_for(deployment))
+        return self._semaphores[deployment]
+
+    async def _send(self, request: httpx.Request, deployment: str) -> httpx.Response:
+        # tokenizing the whole prompt is CPU work on the event loop, only needed to charge a TPM bucket
+        estimated_tokens = estimate_request_tokens(await request.aread()) if admission_controller.get(deployment).tokens else 0
+        await admission_controller.admit(deployment, estimated_tokens)
+        semaphore = self._semaphore(deployment)
+        await semaphore.acquire()
+        metrics.increment("llm.requests", deployment=deployment)
+        start_time = monotonic()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+        latency = monotonic() - start_time
+        retry_after = parse_retry_after(response.headers)
+        get_deployment_stats(deployment).record(latency, response.status_code, retry_after)
+        metrics.observe("llm.latency_seconds", latency, deployment=deployment)
+        if response.status_code == 429:
+            metrics.increment("llm.throttled", deployment=deployment)
+            admission_controller.on_retry_after(deployment, retry_after or get_deployment_stats(deployment).throttle_cooldown)
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_ReleasingStream(response.stream, semaphore.release),
+            extensions=response.extensions,
+        )
+
+    def _hedge_delay(self, deployment: str) -> Optional[float]:
+        stats = get_deployment_stats(deployment)
+        if not self.hedge_resolver or len(stats.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return stats.latency_percentile(HEDGE_PERCENTILE)
+
+    def _hedge_request(self, request: httpx.Request, deployment: str) -> Optional[tuple[httpx.Request, str]]:
+        target = self.hedge_resolver(deployment) if self.hedge_resolver else None
+        if target is None:
+            return None
+        alternate, endpoint, replica_deployment, api_key = target
+        base_url = httpx.URL(endpoint)
+        url = request.url.copy_with(
+            scheme=base_url.scheme,
+            host=base_url.host,
+            port=base_url.port,
+            path=request.url.path.replace(f"/deployments/{deployment}/", f"/deployments/{replica_deployment}/"),
+        )
+        headers = request.headers.copy()
+        headers.pop("host", None)
+        headers["api-key"] = api_key
+        return httpx.Request(request.method, url, headers=headers, content=request.content, extensions=request.extensions), alternate
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        deployment = deployment_from_url(request.url)
+        if deployment is None:
+            return await self._transport.handle_async_request(request)
+
+        hedge_delay = self._hedge_delay(deployment)
+        if hedge_delay is None:
+            return await self._send(request, deployment)
+
+        # the hedge re-sends the body, so it must be buffered
+        await request.aread()
+        primary = asyncio.create_task(self._send(request, deployment))
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        hedge = None if done else self._hedge_request(request, deployment)
+        if hedge is None:
+            return await primary
+
+        hedge_request, alternate = hedge
+        metrics.increment("llm.hedged", deployment=deployment, target=alternate)
+        secondary = asyncio.create_task(self._send(hedge_request, alternate))
+        pending = {primary, secondary}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # only a successful response wins; a 429/5xx or an error waits for the other attempt
+            winner = next((task for task in done if _succeeded(task)), None)
+            if winner is not None:
+                for task in {primary, secondary}:
+                    if task is not winner:
+                        _discard_response(task)
+                if winner is secondary:
+                    metrics.increment("llm.hedge_wins", deployment=deployment, target=alternate)
+                return winner.result()
+        # both attempts failed: surface the primary's response or error, so the client's retry handling applies
+        _discard_response(secondary)
+        return primary.result()
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+def _succeeded(task: asyncio.Task) -> bool:
+    return not task.cancelled() and task.exception() is None and task.result().is_success
+
+def _discard_response(task: asyncio.Task) -> None:
+    """Cancel a losing hedge attempt, closing its response (and concurrency slot) if it already arrived."""
+    def close_response(finished: asyncio.Task) -> None:
+        if not finished.cancelled() and finished.exception() is None:
+            asyncio.ensure_future(finished.result().aclose())
+    if task.done():
+        close_response(task)
+    else:
+        task.cancel()
+        task.add_done_callback(close_response)
+
+class ModelRegistry:
+    """
+    Builds AzureChatOpenAI clients on first use. All deployments of one region share a
+    single async HTTP client, and every client sends through one pooled transport, so
+    connections are reused across models and admission control sees all traffic.
+    """
+    def __init__(self, specs: dict[str, ModelSpec]):
+        self.specs = specs
+        self._models: dict[str, AzureChatOpenAI] = {}
+        self._http_clients: dict[str, httpx.AsyncClient] = {}
+        self._lock = Lock()
+        self.transport = DeploymentLimitedTransport(hedge_resolver=self.hedge_target if HEDGE_ENABLED else None)
+
+    def hedge_target(self, deployment: str) -> Optional[tuple[str, str, str, str]]:
+        """The same deployment in its HEDGE_TARGETS region, or None when it has no replica elsewhere."""
+        region = HEDGE_TARGETS.get(deployment)
+        spec = next((spec for spec in self.specs.values() if spec.deployment == deployment), None)
+        if spec is None or region is None or region == spec.region or region not in REGION_SECRETS:
+            return None
+        endpoint_attr, api_key_attr = REGION_SECRETS[region]
+        return f"{deployment}@{region}", getattr(secrets, endpoint_attr), deployment, getattr(secrets, api_key_attr)
+
+    def get_http_client(self, region: str) -> httpx.AsyncClient:
+        if region not in self._http_clients:
+            self._http_clients[region] = httpx.AsyncClient(
+                transport=self.transport,
+                timeout=httpx.Timeout(60.0, connect=5.0),
+            )
+        return self._http_clients[region]
+
+    def get(self, name: str) -> AzureChatOpenAI:
+        """
+        Return the chat model for a deployment name.
+
+        Raises:
+            ValueError: If the name isn't in MODEL_SPECS
+        """
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        if name not in self.specs:
+            raise ValueError(f"Unknown model: {name}")
+        with self._lock:
+            if name not in self._models:
+                spec = self.specs[name]
+                endpoint_attr, api_key_attr = REGION_SECRETS[spec.region]
+                self._models[name] = AzureChatOpenAI(
+                    azure_endpoint=getattr(secrets, endpoint_attr),
+                    azure_deployment=spec.deployment,
+                    api_version=AZURE_OPENAI_API_VERSION,
+                    api_key=getattr(secrets, api_key_attr),
+                    max_retries=MAX_RETRIES,
+                    temperature=TEMPERATURE,
+                    stream_usage=True,
+                    http_async_client=self.get_http_client(spec.region),
+                )
+            return self._models[name]
+
+    async def aclose(self) -> None:
+        clients = list(self._http_clients.values())
+        self._http_clients.clear()
+        self._models.clear()
+        for client in clients:
+            await client.aclose()
+        await self.transport.aclose()
+
+model_registry = ModelRegistry(MODEL_SPECS)
+on_shutdown(model_registry.aclose)
+
+def get_model(name: str = DEFAULT_MODEL_NAME) -> AzureChatOpenAI:
+    return model_registry.get(name)
+
+def get_stage_model_name(stage: str, overrides: Optional[dict[str, str]] = None) -> str:
+    """Deployment name for a chain stage, preferring per-org overrides over STAGE_MODELS."""
+    return (overrides or {}).get(stage) or STAGE_MODELS.get(stage) or DEFAULT_MODEL_NAME
+
+def get_stage_model(stage: str, overrides: Optional[dict[str, str]] = None) -> AzureChatOpenAI:
+    return get_model(get_stage_model_name(stage, overrides))
+
+# Module attributes kept for existing imports; each client is only built when first accessed
+_LEGACY_MODEL_NAMES = {
+    "gpt_4_1_nano": "gpt-4.1-nano",
+    "gpt_4_1_mini": "gpt-4.1-mini",
+    "gpt_4_1": "gpt-4.1",
+    "gpt_4o_mini": "gpt-4o-mini",
+    "default_model": DEFAULT_MODEL_NAME,
+}
+
+def __getattr__(name: str):
+    if name in _LEGACY_MODEL_NAMES:
+        return get_model(_LEGACY_MODEL_NAMES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@lru_cache(maxsize=1)
+def get_embedding_model() -> AzureOpenAIEmbeddings | None:
+    """Return the embedding client, or None when AZURE_OPENAI_EMBEDDING_DEPLOYMENT isn't set."""
+    if not EMBEDDING_DEPLOYMENT:
+        return None
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=secrets.azure_ai_service_endpoint_eastus2,
+        azure_deployment=EMBEDDING_DEPLOYMENT,
+        api_version=AZURE_OPENAI_API_VERSION,
+        api_key=secrets.azure_ai_service_api_key_eastus2,
+        max_retries=MAX_RETRIES,
+        http_async_client=model_registry.get_http_client("eastus2"),
+    )
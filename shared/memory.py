@@ -0,0 +1,179 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Optional
+from urllib.parse import urlparse
+
+from shared.caches import AsyncTTLCache
+from shared.tokens import count_tokens
+
+Turn = dict[str, str]
+
+class MemoryBackend(ABC):
+    """
+    Per-conversation sliding window of turns ({"query": ..., "answer": ...}, oldest first).
+
+    `get` returns None on a miss so callers can tell "not cached" from "no history yet".
+    """
+    def __init__(self, window_size: int = 10, ttl: Optional[float] = 3600.0):
+        self.window_size = window_size
+        self.ttl = ttl
+
+    @abstractmethod
+    async def get(self, conversation_id: str) -> Optional[list[Turn]]:
+        ...
+
+    @abstractmethod
+    async def set(self, conversation_id: str, turns: list[Turn]) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, conversation_id: str) -> None:
+        ...
+
+    async def append(self, conversation_id: str, turn: Turn) -> None:
+        """
+        Write-through a new turn. Only windows already in the cache are extended; a missing
+        window is loaded from Cosmos on the next read instead of starting from a partial history.
+        """
+        turns = await self.get(conversation_id)
+        if turns is not None:
+            await self.set(conversation_id, turns + [turn])
+
+    async def close(self) -> None:
+        pass
+
+class InProcessMemoryBackend(MemoryBackend):
+    """Memory windows held in a worker-local LRU+TTL cache."""
+    def __init__(self, window_size: int = 10, ttl: Optional[float] = 3600.0, maxsize: int = 10000):
+        super().__init__(window_size=window_size, ttl=ttl)
+        self._windows: AsyncTTLCache[list[Turn]] = AsyncTTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def get(self, conversation_id: str) -> Optional[list[Turn]]:
+        turns = self._windows.get(conversation_id)
+        return list(turns) if turns is not None else None
+
+    async def set(self, conversation_id: str, turns: list[Turn]) -> None:
+        self._windows.set(conversation_id, list(turns[-self.window_size:]))
+
+    async def delete(self, conversation_id: str) -> None:
+        self._windows.invalidate(conversation_id)
+
+class RespClient:
+    """
+    Minimal Redis-protocol (RESP2) client over one asyncio connection, enough for
+    GET/SET/DEL. Works against Redis or any RESP-compatible local stand-in.
+    """
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.db:
+            await self._send("SELECT", str(self.db))
+
+    async def _read_reply(self):
+        line = (await self._reader.readline()).rstrip(b"\r\n")
+        if not line:
+            raise ConnectionError("Connection closed by server")
+        kind, payload = line[:1], line[1:]
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise RuntimeError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        if kind == b"*":
+            length = int(payload)
+            return None if length == -1 else [await self._read_reply() for _ in range(length)]
+        raise RuntimeError(f"Unexpected RESP reply: {line!r}")
+
+    async def _send(self, *args: str):
+        encoded = [arg.encode() for arg in args]
+        command = b"*%d\r\n" % len(encoded) + b"".join(b"$%d\r\n%s\r\n" % (len(arg), arg) for arg in encoded)
+        self._writer.write(command)
+        await self._writer.drain()
+        return await self._read_reply()
+
+    async def execute(self, *args: str):
+        async with self._lock:
+            if self._writer is None or self._writer.is_closing():
+                await self._connect()
+            try:
+                return await self._send(*args)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # one reconnect attempt for connections dropped while idle
+                await self._connect()
+                return await self._send(*args)
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+class RedisMemoryBackend(MemoryBackend):
+    """Memory windows stored as JSON strings under `<prefix><conversation_id>` in a Redis-protocol store."""
+    def __init__(self, url: str, window_size: int = 10, ttl: Optional[float] = 3600.0, prefix: str = "employee_desk:memory:"):
+        super().__init__(window_size=window_size, ttl=ttl)
+        self.client = RespClient(url)
+        self.prefix = prefix
+
+    async def get(self, conversation_id: str) -> Optional[list[Turn]]:
+        raw = await self.client.execute("GET", self.prefix + conversation_id)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, conversation_id: str, turns: list[Turn]) -> None:
+        args = ["SET", self.prefix + conversation_id, json.dumps(turns[-self.window_size:])]
+        if self.ttl:
+            args += ["EX", str(int(self.ttl))]
+        await self.client.execute(*args)
+
+    async def delete(self, conversation_id: str) -> None:
+        await self.client.execute("DEL", self.prefix + conversation_id)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+def create_memory_backend(backend: str, window_size: int = 10, ttl: Optional[float] = 3600.0, redis_url: Optional[str] = None) -> MemoryBackend:
+    """
+    Build a memory backend by name ("inprocess" or "redis").
+
+    Raises:
+        ValueError: If the backend name is unknown or redis is chosen without a URL
+    """
+    if backend == "inprocess":
+        return InProcessMemoryBackend(window_size=window_size, ttl=ttl)
+    if backend == "redis":
+        if not redis_url:
+            raise ValueError("A redis URL is required for the redis memory backend")
+        return RedisMemoryBackend(url=redis_url, window_size=window_size, ttl=ttl)
+    raise ValueError(f"Unknown memory backend: {backend}")
+
+def trim_turns_to_budget(turns: list[Turn], token_budget: Optional[int]) -> list[Turn]:
+    """Keep the most recent turns whose combined query+answer tokens fit in `token_budget`."""
+    if not token_budget:
+        return turns
+    kept: list[Turn] = []
+    used_tokens = 0
+    for turn in reversed(turns):
+        turn_tokens = count_tokens(turn.get("query") or "") + count_tokens(turn.get("answer") or "")
+        if used_tokens + turn_tokens > token_budget:
+            break
+        kept.append(turn)
+        used_tokens += turn_tokens
+    return list(reversed(kept))
@@ -0,0 +1,83 @@
+import threading
+from collections import defaultdict, deque
+
+def _metric_key(name: str, labels: dict) -> str:
+    if not labels:
+        return name
+    label_str = ",".join(f"{key}={labels[key]}" for key in sorted(labels))
+    return f"{name}{{{label_str}}}"
+
+class Histogram:
+    """Keeps the most recent `max_samples` observations to report percentiles."""
+    def __init__(self, max_samples: int = 2048):
+        self.samples: deque[float] = deque(maxlen=max_samples)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+        return ordered[index]
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics store:
+     - counters only go up (`increment`)
+     - gauges hold the last value set (`set_gauge`)
+     - histograms summarise recent observations as p50/p95/p99 (`observe`)
+    Labels are folded into the metric key, e.g. `cosmos.client_reuses{container=chat_responses}`.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, float] = defaultdict(float)
+        self._gauges: dict[str, float] = {}
+        self._histograms: dict[str, Histogram] = defaultdict(Histogram)
+
+    def increment(self, name: str, value: float = 1.0, **labels) -> None:
+        with self._lock:
+            self._counters[_metric_key(name, labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[_metric_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._histograms[_metric_key(name, labels)].observe(value)
+
+    def get(self, name: str, **labels) -> float:
+        key = _metric_key(name, labels)
+        with self._lock:
+            return self._counters.get(key, self._gauges.get(key, 0.0))
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {key: histogram.summary() for key, histogram in self._histograms.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+metrics = MetricsRegistry()
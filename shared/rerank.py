@@ -0,0 +1,138 @@
+import asyncio
+import importlib.util
+import math
+import os
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Callable, Optional
+
+from langchain_core.documents import Document
+
+from shared.hybrid_index import BM25Index, tokenize
+
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Candidates scoring below this fraction of the best one are never selected
+MIN_RELATIVE_RELEVANCE = float(os.getenv("RERANK_MIN_RELATIVE_RELEVANCE", "0.25"))
+# Candidates this similar (token Jaccard) to an already selected one are skipped as near-duplicates
+DUPLICATE_SIMILARITY = float(os.getenv("RERANK_DUPLICATE_SIMILARITY", "0.85"))
+
+class Reranker(ABC):
+    """Scores candidate documents for a query; higher is more relevant, normalized to [0, 1]."""
+    @abstractmethod
+    async def score(self, query: str, docs: list[Document]) -> list[float]:
+        ...
+
+class LexicalReranker(Reranker):
+    """
+    BM25 over the candidate set blended with the first-stage rank, so documents the search
+    engine ranked high keep some credit when the query shares few words with them.
+    """
+    def __init__(self, rank_weight: float = 0.5):
+        self.rank_weight = rank_weight
+
+    async def score(self, query: str, docs: list[Document]) -> list[float]:
+        if not docs:
+            return []
+        index = BM25Index()
+        for position, doc in enumerate(docs):
+            index.add(str(position), f"{doc.metadata.get('file_name', '')} {doc.page_content}")
+        lexical = dict(index.search(query, len(docs)))
+        best = max(lexical.values(), default=0.0) or 1.0
+        return [
+            (1 - self.rank_weight) * lexical.get(str(position), 0.0) / best + self.rank_weight * (1 - position / len(docs))
+            for position in range(len(docs))
+        ]
+
+@lru_cache(maxsize=None)
+def _load_cross_encoder(model_name: str):
+    # sentence-transformers is only needed when the cross-encoder is selected
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(model_name)
+
+class CrossEncoderReranker(Reranker):
+    """Local cross-encoder (sentence-transformers) scoring (query, chunk) pairs, squashed with a sigmoid."""
+    def __init__(self, model_name: str = CROSS_ENCODER_MODEL):
+        if importlib.util.find_spec("sentence_transformers") is None:
+            raise ImportError("The cross-encoder reranker needs the sentence-transformers package")
+        self.model_name = model_name
+
+    async def score(self, query: str, docs: list[Document]) -> list[float]:
+        if not docs:
+            return []
+        def predict() -> list[float]:
+            logits = _load_cross_encoder(self.model_name).predict([(query, doc.page_content) for doc in docs])
+            return [1 / (1 + math.exp(-float(logit))) for logit in logits]
+        return await asyncio.to_thread(predict)
+
+def get_reranker(name: str) -> Optional[Reranker]:
+    """Reranker by name: "lexical", "cross-encoder", or None for "none"."""
+    if name == "lexical":
+        return LexicalReranker()
+    if name == "cross-encoder":
+        return CrossEncoderReranker()
+    if name in ("", "none"):
+        return None
+    raise ValueError(f"Unknown reranker {name!r}")
+
+def _jaccard(left: set[str], right: set[str]) -> float:
+    union = left | right
+    return len(left & right) / len(union) if union else 0.0
+
+def select_documents(
+    docs: list[Document],
+    scores: list[float],
+    token_budget: int,
+    count_tokens: Callable[[Document], int],
+    mmr_lambda: Optional[float] = None,
+    min_relative_relevance: float = MIN_RELATIVE_RELEVANCE,
+    duplicate_similarity: float = DUPLICATE_SIMILARITY,
+    max_documents: Optional[int] = None,
+) -> list[Document]:
+    """
+    Pick the subset of reranked candidates that fits `token_budget`, greedily by relevance per token,
+    stopping at `max_documents` when it is set.
+
+    With `mmr_lambda` set, a candidate's relevance is traded against its highest token
+    similarity to the documents already picked (maximal marginal relevance). Near-duplicates
+    and candidates far below the best score are skipped either way. The most relevant
+    candidate that fits is picked first so a single long, highly relevant chunk isn't
+    crowded out by short ones.
+
+    Returns:
+        list: Selected documents, most relevant first
+    """
+    if not docs:
+        return []
+    best = max(scores)
+    candidates = [
+        (position, score) for position, score in enumerate(scores)
+        if best <= 0 or score >= min_relative_relevance * best
+    ]
+    tokens = {position: max(count_tokens(docs[position]), 1) for position, _ in candidates}
+    terms = {position: set(tokenize(docs[position].page_content)) for position, _ in candidates}
+    selected: list[tuple[int, float]] = []
+    used_tokens = 0
+
+    def max_similarity(position: int) -> float:
+        return max((_jaccard(terms[position], terms[chosen]) for chosen, _ in selected), default=0.0)
+
+    def value(item: tuple[int, float]) -> float:
+        position, score = item
+        if mmr_lambda is not None:
+            score = mmr_lambda * score - (1 - mmr_lambda) * max_similarity(position)
+        return max(score, 0.0) / tokens[position]
+
+    remaining = sorted(candidates, key=lambda item: item[1], reverse=True)
+    while remaining and (max_documents is None or len(selected) < max_documents):
+        # the most relevant candidate that fits goes first, then the best relevance per token
+        pick = remaining[0] if not selected else max(remaining, key=value)
+        remaining.remove(pick)
+        position = pick[0]
+        if used_tokens + tokens[position] > token_budget:
+            continue
+        if selected and max_similarity(position) >= duplicate_similarity:
+            continue
+        selected.append(pick)
+        used_tokens += tokens[position]
+
+    return [docs[position] for position, _ in sorted(selected, key=lambda item: item[1], reverse=True)]
@@ -0,0 +1,88 @@
+import os
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from shared.llms import MODEL_SPECS, get_deployment_stats
+from shared.metrics import metrics
+from shared.tokens import count_tokens
+
+# Deployments per tier in order of preference. Later entries are failovers: they
+# live in the other region (or a neighbouring tier) and take over while the
+# preferred deployment is throttling.
+ROUTING_TIERS: dict[str, list[str]] = {
+    "small": ["gpt-4.1-nano", "gpt-4o-mini", "gpt-4.1-mini"],
+    "medium": ["gpt-4o-mini", "gpt-4.1-mini", "gpt-4.1-nano"],
+    "large": ["gpt-4.1", "gpt-4.1-mini", "gpt-4o-mini"],
+}
+
+SMALL_QUERY_TOKENS = int(os.getenv("ROUTER_SMALL_QUERY_TOKENS", "16"))
+SMALL_CONTEXT_TOKENS = int(os.getenv("ROUTER_SMALL_CONTEXT_TOKENS", "800"))
+LARGE_QUERY_TOKENS = int(os.getenv("ROUTER_LARGE_QUERY_TOKENS", "80"))
+LARGE_CONTEXT_TOKENS = int(os.getenv("ROUTER_LARGE_CONTEXT_TOKENS", "3000"))
+LARGE_MEMORY_TURNS = int(os.getenv("ROUTER_LARGE_MEMORY_TURNS", "4"))
+# Prefer a later candidate of the tier when the preferred one is this much slower (EWMA)
+LATENCY_SLACK = float(os.getenv("ROUTER_LATENCY_SLACK", "1.5"))
+
+class RoutingDecision(BaseModel):
+    model_name: str = Field(description="Deployment chosen to answer")
+    tier: str = Field(description="Complexity tier of the query")
+    reason: str = Field(description="Why this deployment was picked (preferred, latency, failover, all_throttled)")
+
+class ModelRouter:
+    """
+    Picks the answering deployment from query length, context size and memory depth,
+    then adjusts for live per-deployment latency and 429s recorded by shared.llms.
+    """
+    def __init__(self, tiers: dict[str, list[str]] = ROUTING_TIERS):
+        self.tiers = {tier: [name for name in names if name in MODEL_SPECS] for tier, names in tiers.items()}
+
+    def model_names(self) -> set[str]:
+        """Every deployment a route can pick."""
+        return {name for names in self.tiers.values() for name in names}
+
+    def choose_tier(self, query_tokens: int, context_tokens: int, memory_turns: int) -> str:
+        if query_tokens >= LARGE_QUERY_TOKENS or context_tokens >= LARGE_CONTEXT_TOKENS or memory_turns >= LARGE_MEMORY_TURNS:
+            return "large"
+        if query_tokens <= SMALL_QUERY_TOKENS and context_tokens <= SMALL_CONTEXT_TOKENS and memory_turns == 0:
+            return "small"
+        return "medium"
+
+    def pick(self, tier: str) -> RoutingDecision:
+        candidates = self.tiers[tier]
+        available = [name for name in candidates if not get_deployment_stats(MODEL_SPECS[name].deployment).is_throttled]
+        if not available:
+            # everything is throttling: take whichever is due to recover first
+            model_name = min(candidates, key=lambda name: get_deployment_stats(MODEL_SPECS[name].deployment).throttled_until)
+            return RoutingDecision(model_name=model_name, tier=tier, reason="all_throttled")
+
+        preferred = available[0]
+        if preferred != candidates[0]:
+            return RoutingDecision(model_name=preferred, tier=tier, reason="failover")
+
+        preferred_latency = get_deployment_stats(MODEL_SPECS[preferred].deployment).ewma_latency
+        for name in available[1:2]:
+            alternative_latency = get_deployment_stats(MODEL_SPECS[name].deployment).ewma_latency
+            if preferred_latency and alternative_latency and preferred_latency > LATENCY_SLACK * alternative_latency:
+                return RoutingDecision(model_name=name, tier=tier, reason="latency")
+        return RoutingDecision(model_name=preferred, tier=tier, reason="preferred")
+
+    def route(self, query: str, context: str, memory: Optional[list[dict]] = None) -> RoutingDecision:
+        """
+        Choose a deployment for one turn and record the decision in shared.metrics.
+
+        Args:
+            query: User query (or rewritten search query)
+            context: Packed retrieval context
+            memory: Conversation memory messages (user/assistant pairs)
+        """
+        tier = self.choose_tier(
+            query_tokens=count_tokens(query or ""),
+            context_tokens=count_tokens(context or ""),
+            memory_turns=len(memory or []) // 2,
+        )
+        decision = self.pick(tier)
+        metrics.increment("router.decisions", model=decision.model_name, tier=decision.tier, reason=decision.reason)
+        return decision
+
+model_router = ModelRouter()
@@ -1,6 +1,7 @@
 from pydantic import BaseModel,Field,ConfigDict
 
 class ChatRequest(BaseModel):
+    org_id:str | None = Field(default=None,description="Tenant (organization) the request is for")
     user_email:str | None = Field(default=None,description="User email")
     conversation_id:str | None = Field(default=None,description="Conversation ID")
     conversation:dict | None = Field(default=None,description="Conversation logs")
@@ -11,12 +12,14 @@ class ChatResponse(BaseModel):
     answer: str | None = Field(default=None,description="Response generated by the LLM")
     followup_questions: list[str] | None = Field(default=None,description="Follow-up questions generated by the LLM")
     conversation_id: str | None = Field(default=None,description="Conversation ID from the frontend")
+    org_id: str | None = Field(default=None,description="Tenant (organization) that served the query")
     user_email: str | None = Field(default=None,description= "User Email who is sending the request from Frontend")
     class_label:str | None = Field(default=None,description="Classification label of the user query")
     subclass_label: str | None = Field(default=None,description="Subclass label of the user query")
     context_id: list[str] | None = Field(default=[],description="ID of the top-k relevant documents used to answer")
     search_query: str | None = Field(default=None,description="Modified user query used for retrieving relevant documents")
     total_time: float | None = Field(default=None,description="Total time taken to process the query",gt=0)
+    time_to_first_token: float | None = Field(default=None,description="Time until the first answer token was streamed",ge=0)
     prompt_tokens: int | None = Field(default=None,description="Input token length",gt=0)
     completion_tokens: int | None = Field(default=None,description="Output token length",gt=0)
     total_tokens: int | None = Field(default=None,description="Input + output tokens",gt=0)
@@ -25,4 +28,6 @@ class ChatResponse(BaseModel):
     timestamp: str | None = Field(default=None,description="Timestamp at which the answer is sent back")
     context: str | None = Field(default=None,description="Concatenated context for debug")
     memory: list[dict] | None = Field(default=None,description="Memory of the conversation")
+    stage_timings: dict[str,float] | None = Field(default=None,description="Seconds spent in each named chain stage")
+    stage_tokens: dict[str,int] | None = Field(default=None,description="LLM tokens used by each named chain stage")
     model_config = ConfigDict(extra='ignore')
\ No newline at end of file
@@ -1,26 +1,178 @@
+import asyncio
+import json
+import logging
 import os
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Iterable, Optional
+
 from dotenv import load_dotenv
-from azure.identity import DefaultAzureCredential
-from azure.keyvault.secrets import SecretClient
 load_dotenv()
 
+# attribute name -> Key Vault secret name
+SECRET_NAMES: dict[str, str] = {
+    "azure_cosmos_db_connection_string": "AZURE-COSMOS-DB-CONNECTION-STRING",
+    "azure_storage_account_connection_string": "AZURE-STORAGE-ACCOUNT-CONNECTION-STRING",
+    "azure_storage_account_name": "AZURE-STORAGE-ACCOUNT-NAME",
+    "azure_storage_account_key": "AZURE-STORAGE-ACCOUNT-KEY",
+    "azure_ai_search_service_name": "AZURE-AI-SEARCH-SERVICE-NAME",
+    "azure_ai_search_service_endpoint": "AZURE-AI-SEARCH-SERVICE-ENDPOINT",
+    "azure_ai_search_api_key": "AZURE-AI-SEARCH-API-KEY",
+    "azure_ai_service_endpoint_eastus": "AZURE-AI-SERVICE-ENDPOINT-EASTUS",
+    "azure_ai_service_api_key_eastus": "AZURE-AI-SERVICE-API-KEY-EASTUS",
+    "azure_ai_service_endpoint_eastus2": "AZURE-AI-SERVICE-ENDPOINT-EASTUS2",
+    "azure_ai_service_api_key_eastus2": "AZURE-AI-SERVICE-API-KEY-EASTUS2",
+    "tavily_api_key": "TAVILY-API-KEY",
+}
+
+class SecretBackend(ABC):
+    @abstractmethod
+    def get_secret(self, name: str) -> Optional[str]:
+        ...
+
+class KeyVaultSecretBackend(SecretBackend):
+    """Azure Key Vault; the credential and client are only created on the first fetch."""
+    def __init__(self, vault_url: str):
+        self.vault_url = vault_url
+        self._client = None
+        self._lock = Lock()
+
+    def _get_client(self):
+        with self._lock:
+            if self._client is None:
+                from azure.identity import DefaultAzureCredential
+                from azure.keyvault.secrets import SecretClient
+                self._client = SecretClient(vault_url=self.vault_url, credential=DefaultAzureCredential())
+            return self._client
+
+    def get_secret(self, name: str) -> Optional[str]:
+        return self._get_client().get_secret(name).value
+
+class EnvSecretBackend(SecretBackend):
+    """Reads `AZURE-COSMOS-DB-CONNECTION-STRING` from the `AZURE_COSMOS_DB_CONNECTION_STRING` env var."""
+    def get_secret(self, name: str) -> Optional[str]:
+        return os.getenv(name.replace("-", "_"))
+
+class FileSecretBackend(SecretBackend):
+    """Reads secrets from a local JSON file of {"SECRET-NAME": "value"}."""
+    def __init__(self, path: str):
+        with open(path, encoding="utf-8") as secrets_file:
+            self._values: dict[str, str] = json.load(secrets_file)
+
+    def get_secret(self, name: str) -> Optional[str]:
+        return self._values.get(name)
+
+def create_secret_backend() -> SecretBackend:
+    """
+    Pick the backend from SECRETS_BACKEND ("keyvault", "env" or "file").
+    Defaults to Key Vault when AZURE_KEYVAULT_URL is set, else environment variables.
+    """
+    backend = os.getenv("SECRETS_BACKEND") or ("keyvault" if os.getenv("AZURE_KEYVAULT_URL") else "env")
+    if backend == "keyvault":
+        return KeyVaultSecretBackend(vault_url=os.getenv("AZURE_KEYVAULT_URL"))
+    if backend == "file":
+        return FileSecretBackend(path=os.getenv("SECRETS_FILE", "secrets.local.json"))
+    if backend == "env":
+        return EnvSecretBackend()
+    raise ValueError(f"Unknown SECRETS_BACKEND: {backend}")
+
 class Secrets:
-    def __init__(self):
-        client = SecretClient(
-            vault_url=os.getenv("AZURE_KEYVAULT_URL"),
-            credential=DefaultAzureCredential()
-        )
-        self.azure_cosmos_db_connection_string = client.get_secret("AZURE-COSMOS-DB-CONNECTION-STRING").value
-        self.azure_storage_account_connection_string = client.get_secret("AZURE-STORAGE-ACCOUNT-CONNECTION-STRING").value
-        self.azure_storage_account_name = client.get_secret("AZURE-STORAGE-ACCOUNT-NAME").value
-        self.azure_storage_account_key = client.get_secret("AZURE-STORAGE-ACCOUNT-KEY").value
-        self.azure_ai_search_service_name = client.get_secret("AZURE-AI-SEARCH-SERVICE-NAME").value
-        self.azure_ai_search_service_endpoint = client.get_secret("AZURE-AI-SEARCH-SERVICE-ENDPOINT").value
-        self.azure_ai_search_api_key = client.get_secret("AZURE-AI-SEARCH-API-KEY").value
-        self.azure_ai_service_endpoint_eastus = client.get_secret("AZURE-AI-SERVICE-ENDPOINT-EASTUS").value
-        self.azure_ai_service_api_key_eastus = client.get_secret("AZURE-AI-SERVICE-API-KEY-EASTUS").value
-        self.azure_ai_service_endpoint_eastus2 = client.get_secret("AZURE-AI-SERVICE-ENDPOINT-EASTUS2").value
-        self.azure_ai_service_api_key_eastus2 = client.get_secret("AZURE-AI-SERVICE-API-KEY-EASTUS2").value
-        self.tavily_api_key = client.get_secret("TAVILY-API-KEY").value
-        
-secrets = Secrets()
\ No newline at end of file
+    """
+    Lazily resolved secrets: each attribute in SECRET_NAMES is fetched on first access
+    and kept for `ttl` seconds. After that the cached value is still returned while a
+    background refresh runs. `prefetch` fetches several secrets concurrently.
+
+    Concurrent fetches of one secret share a single backend call. Attribute access blocks
+    on a miss, so async code resolves secrets with `aget`/`aprefetch` first, which fetch on
+    the thread pool instead of the event loop.
+    """
+    def __init__(self, backend: Optional[SecretBackend] = None, ttl: float = 3600.0, max_workers: int = 8):
+        self._backend = backend
+        self.ttl = ttl
+        self._values: dict[str, tuple[float, Optional[str]]] = {}
+        self._refreshing: set[str] = set()
+        # secret name -> fetch in progress, shared by every caller that misses meanwhile
+        self._inflight: dict[str, Future] = {}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="secrets")
+        # seconds spent fetching each secret, for the startup breakdown
+        self.fetch_timings: dict[str, float] = {}
+
+    @property
+    def backend(self) -> SecretBackend:
+        if self._backend is None:
+            self._backend = create_secret_backend()
+        return self._backend
+
+    def __getattr__(self, attr: str) -> Optional[str]:
+        if attr in SECRET_NAMES:
+            return self.get(SECRET_NAMES[attr])
+        raise AttributeError(attr)
+
+    def _fetch(self, name: str) -> Optional[str]:
+        with self._lock:
+            future = self._inflight.get(name)
+            owner = future is None
+            if owner:
+                future = self._inflight[name] = Future()
+        if not owner:
+            return future.result()
+        start_time = perf_counter()
+        try:
+            value = self.backend.get_secret(name)
+        except BaseException as e:
+            with self._lock:
+                del self._inflight[name]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._values[name] = (monotonic() + self.ttl, value)
+            self.fetch_timings[name] = round(perf_counter() - start_time, 4)
+            del self._inflight[name]
+        future.set_result(value)
+        return value
+
+    def _refresh(self, name: str) -> None:
+        try:
+            self._fetch(name)
+        except Exception as e:
+            logging.warning(f"Background refresh of secret {name} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+    def get(self, name: str) -> Optional[str]:
+        """Return a secret by its Key Vault name, fetching it on first use."""
+        with self._lock:
+            cached = self._values.get(name)
+            if cached is not None and cached[0] < monotonic() and name not in self._refreshing:
+                self._refreshing.add(name)
+                self._executor.submit(self._refresh, name)
+        if cached is not None:
+            return cached[1]
+        return self._fetch(name)
+
+    def prefetch(self, attrs: Optional[Iterable[str]] = None) -> None:
+        """Fetch the given secret attributes (default: all) concurrently on the thread pool."""
+        names = [SECRET_NAMES[attr] for attr in (attrs or SECRET_NAMES)]
+        missing = [name for name in names if name not in self._values]
+        for future in [self._executor.submit(self._fetch, name) for name in missing]:
+            future.result()
+
+    async def aget(self, attr: str) -> Optional[str]:
+        """Async attribute access: a cached value is returned directly, a miss is fetched on the thread pool."""
+        name = SECRET_NAMES[attr]
+        if name in self._values:
+            return self.get(name)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, name)
+
+    async def aprefetch(self, attrs: Optional[Iterable[str]] = None) -> None:
+        """Async wrapper around `prefetch` that doesn't block the event loop; a no-op once all are cached."""
+        attrs = list(attrs) if attrs else None
+        if all(SECRET_NAMES[attr] in self._values for attr in (attrs or SECRET_NAMES)):
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.prefetch, attrs)
+
+secrets = Secrets(ttl=float(os.getenv("SECRETS_TTL", "3600")))
@@ -0,0 +1,36 @@
+import logging
+import os
+from contextlib import contextmanager
+from time import perf_counter
+
+# phase name -> seconds, in the order the phases ran
+startup_timings: dict[str, float] = {}
+# set once warmup has finished, or the first chain was built; reported by v1/status for readiness probes
+_ready = False
+# The warmup trigger only fires on the Elastic Premium plan; elsewhere the app marks itself
+# ready once loaded, since nothing else would before a first request
+WARMUP_TRIGGER_AVAILABLE = os.getenv("WEBSITE_SKU", "") == "ElasticPremium"
+
+def mark_ready() -> None:
+    global _ready
+    _ready = True
+
+def is_ready() -> bool:
+    return _ready
+
+@contextmanager
+def startup_phase(name: str):
+    """Time one phase of worker startup (an import, a prefetch, ...)."""
+    start_time = perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = round(perf_counter() - start_time, 4)
+
+def get_startup_report() -> dict:
+    """Readiness, startup phase timings and the time spent fetching each secret so far."""
+    from shared.secrets import secrets
+    return {"ready": _ready, "phases": dict(startup_timings), "secrets": dict(secrets.fetch_timings)}
+
+def log_startup_report() -> None:
+    logging.info(f"Startup breakdown: {get_startup_report()}")
@@ -0,0 +1,126 @@
+import hashlib
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+
+from tiktoken import Encoding, get_encoding
+
+DEFAULT_ENCODING = "cl100k_base"
+DEFAULT_TOKEN_LIMIT = 3600
+# tiktoken's BPE cache shipped with the app (populate with `python -m shared.tokens`), so
+# workers parse a local file instead of downloading the encoding on the first request
+BUNDLED_TIKTOKEN_CACHE_DIR = os.path.join(os.path.dirname(__file__), "assets", "tiktoken")
+
+# Context budget per deployment; override with TOKEN_LIMIT_<DEPLOYMENT> (e.g. TOKEN_LIMIT_GPT_4_1=8000)
+MODEL_TOKEN_LIMITS: dict[str, int] = {
+    "gpt-4.1-nano": DEFAULT_TOKEN_LIMIT,
+    "gpt-4.1-mini": DEFAULT_TOKEN_LIMIT,
+    "gpt-4.1": DEFAULT_TOKEN_LIMIT,
+    "gpt-4o-mini": DEFAULT_TOKEN_LIMIT,
+}
+
+def use_bundled_encodings() -> None:
+    """Point tiktoken at the bundled BPE cache unless TIKTOKEN_CACHE_DIR is already set."""
+    if "TIKTOKEN_CACHE_DIR" in os.environ or not os.path.isdir(BUNDLED_TIKTOKEN_CACHE_DIR):
+        return
+    if any(name != ".gitkeep" for name in os.listdir(BUNDLED_TIKTOKEN_CACHE_DIR)):
+        os.environ["TIKTOKEN_CACHE_DIR"] = BUNDLED_TIKTOKEN_CACHE_DIR
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding_name: str = DEFAULT_ENCODING) -> Encoding:
+    """Load a tiktoken encoding once per process, from the bundled cache when it is populated."""
+    use_bundled_encodings()
+    return get_encoding(encoding_name)
+
+def get_token_limit(model_name: str | None) -> int:
+    """Return the context token budget for a deployment name."""
+    if model_name:
+        env_value = os.getenv("TOKEN_LIMIT_" + model_name.upper().replace("-", "_").replace(".", "_"))
+        if env_value:
+            return int(env_value)
+    return MODEL_TOKEN_LIMITS.get(model_name or "", DEFAULT_TOKEN_LIMIT)
+
+class TokenCounter:
+    """
+    Token counter with an LRU cache keyed by the SHA-1 of the text, so a chunk that
+    shows up again (same policy section retrieved for another query) is only encoded once.
+    """
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, maxsize: int = 4096):
+        self.encoding_name = encoding_name
+        self.maxsize = maxsize
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = Lock()
+
+    def count(self, text: str) -> int:
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+        num_tokens = len(get_encoder(self.encoding_name).encode(text))
+        with self._lock:
+            self._counts[key] = num_tokens
+            if len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+        return num_tokens
+
+token_counter = TokenCounter()
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of `text` with the shared cached counter."""
+    return token_counter.count(text)
+
+def truncate_to_tokens(text: str, max_tokens: int, encoding_name: str = DEFAULT_ENCODING) -> str:
+    """Cut `text` down to at most `max_tokens` tokens."""
+    encoder = get_encoder(encoding_name)
+    return encoder.decode(encoder.encode(text)[:max(max_tokens, 0)])
+
+class TokenBudgetPacker:
+    """
+    Greedily packs text pieces into a fixed token budget, counting each piece once.
+
+    A piece that doesn't fit is truncated to the remaining space when truncation is
+    enabled and at least `min_truncated_tokens` remain; otherwise it is skipped and
+    later (possibly smaller) pieces are still tried.
+    """
+    def __init__(self, token_limit: int = DEFAULT_TOKEN_LIMIT, truncate: bool = False, min_truncated_tokens: int = 64):
+        self.token_limit = token_limit
+        self.truncate = truncate
+        self.min_truncated_tokens = min_truncated_tokens
+        self.used_tokens = 0
+
+    @property
+    def remaining_tokens(self) -> int:
+        return self.token_limit - self.used_tokens
+
+    def reserve(self, text: str) -> None:
+        """Count `text` against the budget unconditionally (e.g. a fixed header)."""
+        self.used_tokens += count_tokens(text)
+
+    def add(self, text: str, num_tokens: int | None = None) -> str | None:
+        """
+        Try to add a piece to the budget.
+
+        Args:
+            text: Piece to add
+            num_tokens: Precomputed token count for `text`, if known
+
+        Returns:
+            The text as added (possibly truncated), or None if it was skipped
+        """
+        num_tokens = count_tokens(text) if num_tokens is None else num_tokens
+        if self.used_tokens + num_tokens < self.token_limit:
+            self.used_tokens += num_tokens
+            return text
+        if self.truncate and self.remaining_tokens - 1 >= self.min_truncated_tokens:
+            truncated = truncate_to_tokens(text, self.remaining_tokens - 1)
+            self.used_tokens += count_tokens(truncated)
+            return truncated
+        return None
+
+if __name__ == "__main__":
+    # Download the default encoding into the bundled cache; run before packaging the app
+    os.environ["TIKTOKEN_CACHE_DIR"] = BUNDLED_TIKTOKEN_CACHE_DIR
+    get_encoder(DEFAULT_ENCODING)
+    print(f"Cached {DEFAULT_ENCODING} in {BUNDLED_TIKTOKEN_CACHE_DIR}")
@@ -0,0 +1,38 @@
+import os
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Iterator, Optional
+
+from opentelemetry import trace
+
+from shared.metrics import metrics
+
+tracer = trace.get_tracer("employee_desk")
+
+def configure_tracing() -> None:
+    """
+    Install an SDK tracer provider exporting to the console when OTEL_TRACES_EXPORTER=console.
+    Otherwise spans go to whichever provider the host configured (a no-op by default).
+    """
+    if os.getenv("OTEL_TRACES_EXPORTER", "").lower() != "console":
+        return
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "employee_desk")}))
+    provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter()))
+    trace.set_tracer_provider(provider)
+
+@contextmanager
+def traced(span_name: str, metric_name: Optional[str] = None, **attributes: str) -> Iterator[trace.Span]:
+    """
+    Run the block inside a span; when `metric_name` is given its duration is also observed
+    in that histogram, labelled with `attributes`.
+    """
+    start_time = perf_counter()
+    try:
+        with tracer.start_as_current_span(span_name, attributes=attributes) as span:
+            yield span
+    finally:
+        if metric_name:
+            metrics.observe(metric_name, perf_counter() - start_time, **attributes)
@@ -1,11 +1,14 @@
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from tiktoken import get_encoding
 from langchain.schema import Document
 
 from shared.schemas import ChatResponse
 from shared.databases import AsyncCosmosRepository
+from shared.memory import MemoryBackend, trim_turns_to_budget
+from shared.metrics import metrics
+from shared.rerank import Reranker, select_documents
+from shared.tokens import DEFAULT_TOKEN_LIMIT, TokenBudgetPacker, count_tokens
 
 async def create_chatlog(repo: AsyncCosmosRepository, chat_response:ChatResponse) -> bool:
 
@@ -17,20 +20,53 @@ async def create_chatlog(repo: AsyncCosmosRepository, chat_response:ChatResponse
 
     return True
 
-async def get_memory(repo:AsyncCosmosRepository,conversation_id:str,limit:int=5) -> dict[str,list]:
+async def get_memory(repo:AsyncCosmosRepository,conversation_id:str,limit:int=5,cache:Optional[MemoryBackend]=None,token_budget:Optional[int]=None) -> dict[str,list]:
+    """
+    Return the conversation memory as alternating user/assistant messages.
+
+    The window is served from `cache` when present; Cosmos is only read on a miss, with a
+    parameterized, projected query scoped to the conversation's partition.
+
+    Args:
+        repo: Chat response repository (partitioned by conversation_id)
+        conversation_id: The ID of the conversation
+        limit: Maximum number of turns to load
+        cache: Optional memory window backend
+        token_budget: Optional cap on the combined tokens of the returned turns
+    """
+    turns = await cache.get(conversation_id) if cache else None
+    if turns is None:
+        metrics.increment("memory_cache.misses")
+        chatlogs = [chatlog async for chatlog in repo.iter_query(
+            "SELECT TOP @limit c.query, c.answer FROM c WHERE c.conversation_id = @conversation_id ORDER BY c.timestamp DESC",
+            [{"name": "@limit", "value": limit}, {"name": "@conversation_id", "value": conversation_id}],
+            partition_key=conversation_id,
+            raw=True,
+        )]
+        turns = [{"query": chatlog.get("query"), "answer": chatlog.get("answer")} for chatlog in reversed(chatlogs)]
+        if cache:
+            await cache.set(conversation_id, turns)
+    else:
+        metrics.increment("memory_cache.hits")
 
     memory = []
-    chatlogs = await repo.query(f"SELECT TOP {limit} c.query,c.answer FROM c WHERE c.conversation_id = '{conversation_id}' ORDER BY c.timestamp DESC")
-    chatlogs = reversed(chatlogs)
-    for chatlog in chatlogs:
-        memory.append({"role": 'user', "content": chatlog.query})
-        memory.append({"role": 'assistant', "content": chatlog.answer})
+    for turn in trim_turns_to_budget(turns[-limit:], token_budget):
+        memory.append({"role": 'user', "content": turn["query"]})
+        memory.append({"role": 'assistant', "content": turn["answer"]})
     
     return {"memory":memory}
 
+async def append_memory(cache:MemoryBackend,chat_response:ChatResponse) -> None:
+    """Write a persisted turn through to the memory cache."""
+    try:
+        await cache.append(chat_response.conversation_id, {"query": chat_response.query, "answer": chat_response.answer})
+    except Exception as e:
+        logging.error(f"Error updating memory cache: {e}")
+
 async def calculate_tokens(string: str) -> int:
     """
     Calculates the number of tokens in the provided string using the 'cl100k_base' encoding.
+    The encoding is loaded once and counts are cached per string hash (see shared.tokens).
 
     Parameters:
         string (str): The input string for which tokens need to be calculated.
@@ -42,19 +78,61 @@ async def calculate_tokens(string: str) -> int:
         >>> calculate_tokens("This is a sample string.")
         5
     """
-    encoding = get_encoding('cl100k_base')
-    num_tokens = len(encoding.encode(string))
+    return count_tokens(string)
 
-    return num_tokens
+def source_token_count(doc: Document) -> int:
+    """Tokens `doc` takes as a context source, using the token_count stored at ingestion when there is one."""
+    token_count = doc.metadata.get("token_count")
+    body_tokens = token_count + 1 if token_count is not None else count_tokens(f'{doc.page_content}\n')
+    return count_tokens(f'\nSource 10: {doc.metadata.get("file_name", "")}\n\n') + body_tokens
 
-async def modify_relevant_items(docs: List[Document], about: str, catalog: str = "") -> Dict[str, Any]:
+async def rerank_relevant_items(
+    query: str,
+    docs: List[Document],
+    about: str,
+    reranker: Reranker,
+    catalog: str = "",
+    token_limit: int = DEFAULT_TOKEN_LIMIT,
+    mmr_lambda: Optional[float] = None,
+    max_documents: Optional[int] = None,
+) -> List[Document]:
+    """
+    Rerank over-fetched candidates and keep the subset that fits the context budget.
+    
+    Args:
+        query: Search query the candidates were retrieved for
+        docs: Candidate documents in search order
+        about: About information, packed ahead of the documents
+        reranker: Scorer for the candidates
+        catalog: Optional catalog information
+        token_limit: Token budget for the whole context
+        mmr_lambda: Relevance/diversity trade-off; None ranks on relevance alone
+        max_documents: Most documents selected, however much budget is left; None for no cap
+        
+    Returns:
+        list: Selected documents, most relevant first, for `modify_relevant_items`
+    """
+    scores = await reranker.score(query, docs)
+    # a few tokens of slack for the header estimate in source_token_count
+    budget = token_limit - count_tokens(f'Source 1: \n\n{about}{catalog}\n\n') - 8
+    selected = select_documents(docs, scores, budget, source_token_count, mmr_lambda=mmr_lambda, max_documents=max_documents)
+    metrics.observe("retrieval.candidate_documents", len(docs))
+    metrics.observe("retrieval.selected_documents", len(selected))
+    return selected
+
+async def modify_relevant_items(docs: List[Document], about: str, catalog: str = "", token_limit: int = DEFAULT_TOKEN_LIMIT, truncate: bool = False) -> Dict[str, Any]:
     """
     Format relevant documents into a context string with source information.
     
+    Each source is tokenized once and packed against the remaining budget instead of
+    re-tokenizing the whole context for every document.
+    
     Args:
         docs: List of document objects
         about: About information for the context
         catalog: Optional catalog information
+        token_limit: Token budget for the whole context
+        truncate: Cut a source that doesn't fit down to the remaining budget instead of dropping it
         
     Returns:
         dict: Contains formatted context and source IDs
@@ -62,11 +140,17 @@ async def modify_relevant_items(docs: List[Document], about: str, catalog: str =
     context: str = f'Source 1: \n\n{about}{catalog}\n\n'
     source_num: int = 2
     context_id: List[str] = []
-    TOKEN_LIMIT = 3600
+    packer = TokenBudgetPacker(token_limit=token_limit, truncate=truncate)
+    packer.reserve(context)
     
     for doc in docs:
-        if await calculate_tokens(context + doc.page_content) < TOKEN_LIMIT:
-            context += f'\nSource {source_num}: {doc.metadata["file_name"]}\n\n{doc.page_content}\n'
+        header = f'\nSource {source_num}: {doc.metadata["file_name"]}\n\n'
+        # chunks indexed by the ingestion pipeline carry their token count, so only the header is encoded
+        token_count = doc.metadata.get("token_count")
+        num_tokens = count_tokens(header) + token_count + 1 if token_count is not None else None
+        source = packer.add(f'{header}{doc.page_content}\n', num_tokens=num_tokens)
+        if source is not None:
+            context += source
             source_num += 1
             context_id.append(doc.metadata['file_name'])
 
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from time import monotonic
+from typing import Callable, Generic, Optional, TypeVar
+
+from pydantic import BaseModel
+
+from shared.databases import AsyncCosmosRepository
+from shared.metrics import metrics
+
+T = TypeVar("T", bound=BaseModel)
+
+COSMOS_MAX_BATCH_OPERATIONS = 100
+
+class WriteBehindWriter(Generic[T]):
+    """
+    Async write-behind queue in front of an AsyncCosmosRepository:
+     - `enqueue` returns as soon as the item is queued, off the response path
+     - a background task groups queued items by partition key and upserts them
+       with Cosmos transactional batches
+     - the queue is bounded; when it stays full past `enqueue_timeout`, or when
+       Cosmos is unavailable, items are appended to a local JSONL spill file and
+       replayed later
+     - `drain` flushes everything still queued when the app shuts down on its own loop;
+       `spill_pending` saves it to the spill file synchronously, for interpreter exit
+    """
+    def __init__(
+        self,
+        repo_factory: Callable[[], AsyncCosmosRepository[T]],
+        partition_key: Callable[[T], str],
+        model_cls: type[T],
+        spill_path: str,
+        max_queue_size: int = 1000,
+        max_batch_size: int = COSMOS_MAX_BATCH_OPERATIONS,
+        flush_interval: float = 0.5,
+        enqueue_timeout: float = 0.05,
+        spill_replay_interval: float = 60.0,
+        name: str = "write_behind",
+    ):
+        self.repo_factory = repo_factory
+        self.partition_key = partition_key
+        self.model_cls = model_cls
+        self.spill_path = spill_path
+        self.max_queue_size = max_queue_size
+        self.max_batch_size = min(max_batch_size, COSMOS_MAX_BATCH_OPERATIONS)
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.spill_replay_interval = spill_replay_interval
+        self.name = name
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: list[T] = []
+        self._closing = False
+        self._last_replay = 0.0
+
+    def _ensure_started(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.max_queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def enqueue(self, item: T) -> bool:
+        """
+        Queue an item for persistence.
+
+        Returns:
+            bool: True if queued, False if it went to the spill file instead
+        """
+        if self._closing:
+            self._spill([item])
+            return False
+        self._ensure_started()
+        try:
+            await asyncio.wait_for(self._queue.put(item), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{self.name} queue full, spilling item to {self.spill_path}")
+            metrics.increment(f"{self.name}.backpressure_spills")
+            self._spill([item])
+            return False
+        metrics.increment(f"{self.name}.enqueued")
+        metrics.set_gauge(f"{self.name}.queue_depth", self._queue.qsize())
+        return True
+
+    async def _next_batch(self) -> list[T]:
+        batch = [await self._queue.get()]
+        deadline = monotonic() + self.flush_interval
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            self._inflight = batch
+            try:
+                await self._flush(batch)
+            finally:
+                self._inflight = []
+                for _ in batch:
+                    self._queue.task_done()
+                metrics.set_gauge(f"{self.name}.queue_depth", self._queue.qsize())
+
+    async def _flush(self, items: list[T]) -> None:
+        partitions: dict[str, list[T]] = defaultdict(list)
+        for item in items:
+            partitions[self.partition_key(item)].append(item)
+
+        repo = self.repo_factory()
+        flushed_all = True
+        for partition_key, partition_items in partitions.items():
+            for start in range(0, len(partition_items), self.max_batch_size):
+                chunk = partition_items[start:start + self.max_batch_size]
+                try:
+                    await repo.upsert_batch(chunk, partition_key=partition_key)
+                    metrics.increment(f"{self.name}.written", len(chunk))
+                except Exception as e:
+                    flushed_all = False
+                    logging.error(f"{self.name} batch write failed, spilling {len(chunk)} items: {e}")
+                    metrics.increment(f"{self.name}.failed_batches")
+                    self._spill(chunk)
+
+        if flushed_all and not self._closing and monotonic() - self._last_replay > self.spill_replay_interval:
+            await self._replay_spill()
+
+    def _spill(self, items: list[T]) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                for item in items:
+                    spill_file.write(item.model_dump_json() + "\n")
+            metrics.increment(f"{self.name}.spilled", len(items))
+        except OSError as e:
+            logging.error(f"{self.name} could not write spill file {self.spill_path}: {e}")
+
+    async def _replay_spill(self) -> None:
+        """Re-queue items from the spill file. The file is moved aside first so a failed replay re-spills cleanly."""
+        self._last_replay = monotonic()
+        if not os.path.exists(self.spill_path):
+            return
+        replay_path = f"{self.spill_path}.replay"
+        try:
+            os.replace(self.spill_path, replay_path)
+            with open(replay_path, encoding="utf-8") as replay_file:
+                items = [self.model_cls.model_validate(json.loads(line)) for line in replay_file if line.strip()]
+            os.remove(replay_path)
+        except (OSError, ValueError) as e:
+            logging.error(f"{self.name} could not replay spill file {self.spill_path}: {e}")
+            return
+        logging.info(f"{self.name} replaying {len(items)} spilled items")
+        for item in items:
+            if self._queue.full():
+                self._spill([item])
+            else:
+                self._queue.put_nowait(item)
+
+    async def drain(self) -> None:
+        """Stop accepting items, flush everything still queued and stop the background task."""
+        self._closing = True
+        if self._task is None:
+            return
+        if not self._task.done():
+            await self._queue.join()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def spill_pending(self) -> None:
+        """
+        Stop accepting items and append everything not yet written, including the batch
+        being flushed, to the spill file without needing the event loop. Items of that
+        batch may already be in Cosmos; replaying them is an idempotent upsert.
+        """
+        self._closing = True
+        pending = list(self._inflight)
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        if pending:
+            logging.warning(f"{self.name} spilling {len(pending)} unwritten items at exit to {self.spill_path}")
+            self._spill(pending)
+        # the background task belongs to a loop that no longer runs; `drain` has nothing left to wait for
+        self._inflight = []
+        self._task = None
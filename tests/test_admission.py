@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from shared import admission
+from shared.admission import DeploymentAdmission, TenantAdmission, TenantQuotaExceeded, TokenBucket
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(admission, "monotonic", clock)
+    return clock
+
+def test_bucket_starts_full_and_refills_at_its_rate(clock):
+    bucket = TokenBucket(rate_per_minute=600)
+    assert bucket.time_until(600) == 0
+
+    bucket.consume(600)
+    assert bucket.time_until(60) == pytest.approx(6)
+
+    clock.now += 3
+    assert bucket.time_until(60) == pytest.approx(3)
+    clock.now += 3
+    assert bucket.time_until(60) == 0
+
+def test_bucket_never_holds_more_than_a_minute(clock):
+    bucket = TokenBucket(rate_per_minute=60)
+    clock.now += 600
+
+    bucket.consume(60)
+
+    assert bucket.time_until(1) == pytest.approx(1)
+
+def test_oversized_requests_wait_for_a_full_bucket_instead_of_forever(clock):
+    bucket = TokenBucket(rate_per_minute=60)
+    bucket.consume(30)
+
+    # more than the capacity is treated as the whole bucket
+    assert bucket.time_until(10_000) == pytest.approx(30)
+    bucket.consume(10_000)
+    assert bucket.tokens == pytest.approx(-30)
+
+def test_deployment_admission_waits_out_the_request_bucket_and_retry_after():
+    deployment = DeploymentAdmission("gpt-4.1-mini", requests_per_minute=600)
+    deployment.requests.tokens = 0
+
+    async def admit():
+        return await deployment.admit(estimated_tokens=100)
+
+    # one request every 0.1s
+    assert asyncio.run(admit()) == pytest.approx(0.1, abs=0.05)
+
+    deployment.block(0.2)
+    assert asyncio.run(admit()) >= 0.15
+
+def test_tenant_over_its_concurrency_is_rejected_without_blocking_other_tenants():
+    tenants = TenantAdmission(max_wait=0.05)
+
+    async def run():
+        async with tenants.admit("noisy", max_concurrency=1) as limits:
+            assert limits.in_flight == 1
+            with pytest.raises(TenantQuotaExceeded):
+                async with tenants.admit("noisy", max_concurrency=1):
+                    pass
+            async with tenants.admit("quiet", max_concurrency=1) as quiet_limits:
+                assert quiet_limits.in_flight == 1
+        # the slot is released with the block
+        async with tenants.admit("noisy", max_concurrency=1) as limits:
+            assert limits.in_flight == 1
+
+    asyncio.run(run())
+
+def test_tenant_in_token_debt_is_rejected_until_the_bucket_refills(clock):
+    tenants = TenantAdmission(max_wait=5)
+
+    async def admit(org_id: str) -> None:
+        async with tenants.admit(org_id, tokens_per_minute=60):
+            pass
+
+    asyncio.run(admit("noisy"))
+    tenants.charge("noisy", 60)
+    tenants.charge("noisy", 60)
+    with pytest.raises(TenantQuotaExceeded):
+        asyncio.run(admit("noisy"))
+    asyncio.run(admit("quiet"))
+
+    clock.now += 61
+    asyncio.run(admit("noisy"))
+
+def test_changed_limits_replace_the_tenant_state():
+    tenants = TenantAdmission()
+
+    limits = tenants.get("org", max_concurrency=2)
+
+    assert tenants.get("org", max_concurrency=2) is limits
+    assert tenants.get("org", max_concurrency=4).max_concurrency == 4
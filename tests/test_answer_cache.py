@@ -0,0 +1,115 @@
+import asyncio
+
+from shared import caches
+from shared.answer_cache import AnswerCache, normalize_query
+
+VECTORS = {
+    "how many vacation days do i get": [1.0, 0.0, 0.0],
+    "how many vacation days do i have": [0.99, 0.1, 0.0],
+    "how do i reset my vpn password": [0.0, 1.0, 0.0],
+}
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls: list[str] = []
+
+    async def __call__(self, text: str) -> list[float]:
+        self.calls.append(text)
+        return VECTORS[normalize_query(text)]
+
+ANSWER = {"answer": "25 days.", "followup_questions": []}
+
+def test_normalized_query_hits_the_exact_cache():
+    cache = AnswerCache()
+
+    async def run():
+        await cache.store("org", "How many vacation days do I get?", ["doc2", "doc1"], ANSWER)
+        return await cache.lookup("org", "  how many VACATION days do i get ", ["doc1", "doc2"])
+
+    assert asyncio.run(run()) == (ANSWER, None)
+
+def test_exact_cache_is_scoped_by_org_and_context():
+    cache = AnswerCache()
+
+    async def run():
+        await cache.store("org", "How many vacation days do I get?", ["doc1"], ANSWER)
+        other_org = await cache.lookup("other", "How many vacation days do I get?", ["doc1"])
+        other_context = await cache.lookup("org", "How many vacation days do I get?", ["doc3"])
+        return other_org, other_context
+
+    assert asyncio.run(run()) == ((None, None), (None, None))
+
+def test_similar_query_with_the_same_context_is_a_semantic_hit():
+    embed = FakeEmbeddings()
+    cache = AnswerCache(embed=embed, similarity_threshold=0.95)
+
+    async def run():
+        _, vector = await cache.lookup("org", "How many vacation days do I get?", ["doc1"])
+        await cache.store("org", "How many vacation days do I get?", ["doc1"], ANSWER, vector=vector)
+        similar = await cache.lookup("org", "How many vacation days do I have?", ["doc1"])
+        unrelated = await cache.lookup("org", "How do I reset my VPN password?", ["doc1"])
+        return similar, unrelated
+
+    (similar, similar_vector), (unrelated, _) = asyncio.run(run())
+
+    assert similar == ANSWER
+    assert similar_vector is not None
+    assert unrelated is None
+    # the first lookup had no rows to compare against, so the query was only embedded by store
+    assert embed.calls == ["How many vacation days do I get?", "How many vacation days do I have?", "How do I reset my VPN password?"]
+
+def test_store_reuses_the_lookup_embedding():
+    embed = FakeEmbeddings()
+    cache = AnswerCache(embed=embed)
+
+    async def run():
+        await cache.store("org", "How many vacation days do I get?", ["doc1"], ANSWER)
+        _, vector = await cache.lookup("org", "How do I reset my VPN password?", ["doc1"])
+        await cache.store("org", "How do I reset my VPN password?", ["doc1"], ANSWER, vector=vector)
+
+    asyncio.run(run())
+
+    assert embed.calls == ["How many vacation days do I get?", "How do I reset my VPN password?"]
+
+def test_invalidate_drops_the_org_answers_and_vectors():
+    cache = AnswerCache(embed=FakeEmbeddings())
+
+    async def run():
+        await cache.store("org", "How many vacation days do I get?", ["doc1"], ANSWER)
+        await cache.store("other", "How many vacation days do I get?", ["doc1"], ANSWER)
+        cache.invalidate("org")
+        return (
+            await cache.lookup("org", "How many vacation days do I have?", ["doc1"]),
+            await cache.lookup("other", "How many vacation days do I get?", ["doc1"]),
+        )
+
+    (dropped, _), (kept, _) = asyncio.run(run())
+
+    assert dropped is None
+    assert kept == ANSWER
+
+def test_vector_index_keeps_at_most_maxsize_groups():
+    cache = AnswerCache(maxsize=2, embed=FakeEmbeddings())
+
+    async def run():
+        for context_id in (["doc1"], ["doc2"], ["doc3"]):
+            await cache.store("org", "How many vacation days do I get?", context_id, ANSWER)
+
+    asyncio.run(run())
+
+    assert list(cache._vectors) == [("org", ("doc2",)), ("org", ("doc3",))]
+
+def test_lookup_drops_groups_whose_answers_expired(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caches, "monotonic", lambda: now[0])
+    embed = FakeEmbeddings()
+    cache = AnswerCache(ttl=10, embed=embed)
+
+    async def run():
+        await cache.store("org", "How many vacation days do I get?", ["doc1"], ANSWER)
+        now[0] += 11
+        return await cache.lookup("org", "How many vacation days do I have?", ["doc1"])
+
+    assert asyncio.run(run()) == (None, None)
+    assert cache._vectors == {}
+    assert embed.calls == ["How many vacation days do I get?"]
@@ -0,0 +1,90 @@
+import os
+
+import pytest
+
+from shared.hybrid_index import BM25Index, HybridIndex, IndexedChunk, reciprocal_rank_fusion
+
+def make_chunk(doc_id: str, text: str) -> IndexedChunk:
+    return IndexedChunk(id=doc_id, chunk=text, file_name=f"{doc_id}.md")
+
+def test_bm25_ranks_matching_and_rarer_terms_first():
+    index = BM25Index()
+    index.add("vacation", "vacation policy: request vacation days from your manager")
+    index.add("payroll", "payroll runs monthly; contact your manager about payroll")
+    index.add("laptop", "laptop and vpn setup for remote work")
+
+    ranked = [doc_id for doc_id, _ in index.search("vacation manager", 10)]
+
+    assert ranked[0] == "vacation"
+    assert "laptop" not in ranked
+
+def test_bm25_remove_drops_the_document_and_its_postings():
+    index = BM25Index()
+    index.add("a", "expense reimbursement")
+    index.add("b", "travel expense")
+    index.remove("a")
+
+    assert [doc_id for doc_id, _ in index.search("reimbursement", 10)] == []
+    assert [doc_id for doc_id, _ in index.search("expense", 10)] == ["b"]
+    assert index.total_length == 2
+
+def test_reciprocal_rank_fusion_prefers_ids_ranked_by_both_lists():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "d"]], k=60)
+
+    assert [doc_id for doc_id, _ in fused] == ["c", "b", "a", "d"]
+    assert dict(fused)["b"] == pytest.approx(2 / 62)
+    assert dict(fused)["d"] == pytest.approx(1 / 63)
+
+def test_search_fuses_lexical_and_dense_rankings(tmp_path):
+    index = HybridIndex(str(tmp_path))
+    index.upsert(
+        [make_chunk("leave", "sick leave and vacation"), make_chunk("vpn", "vpn password reset"), make_chunk("badge", "office badge")],
+        vectors=[[1, 0, 0], [0, 1, 0], [0, 0, 1]],
+    )
+
+    # lexically "vpn", semantically "badge": both outrank the chunk matching neither
+    results = [chunk.id for chunk, _ in index.search("vpn", top_k=3, query_vector=[0, 0, 1])]
+
+    assert set(results[:2]) == {"vpn", "badge"}
+
+def test_refresh_picks_up_appends_from_another_instance(tmp_path):
+    writer = HybridIndex(str(tmp_path))
+    writer.upsert([make_chunk("a", "holiday calendar")], vectors=[[1, 0]])
+    reader = HybridIndex(str(tmp_path))
+
+    writer.upsert([make_chunk("b", "overtime timesheet")], vectors=[[0, 1]])
+    writer.delete(["a"])
+
+    assert reader.refresh() is True
+    assert set(reader.chunks) == {"b"}
+    assert [chunk.id for chunk, _ in reader.search("overtime", top_k=1, query_vector=[0, 1])] == ["b"]
+    assert reader.refresh() is False
+
+def test_refresh_reads_the_dimension_written_after_open(tmp_path):
+    reader = HybridIndex(str(tmp_path))
+    writer = HybridIndex(str(tmp_path))
+    writer.upsert([make_chunk("a", "dental insurance")], vectors=[[0.6, 0.8]])
+
+    reader.refresh()
+
+    assert reader.dim == 2
+    assert [chunk.id for chunk, _ in reader.search("unrelated", top_k=1, query_vector=[0.6, 0.8])] == ["a"]
+
+def test_refresh_after_compact_replays_against_the_new_vectors(tmp_path):
+    writer = HybridIndex(str(tmp_path))
+    writer.upsert([make_chunk("a", "parking"), make_chunk("b", "training")], vectors=[[1, 0], [0, 1]])
+    writer.upsert([make_chunk("a", "parking permits")], vectors=[[0, 1]])
+    reader = HybridIndex(str(tmp_path))
+    assert writer.dead_rows() == 1
+
+    writer.compact()
+    # grow the compacted log past the reader's old offset, so its size alone can't reveal the compaction
+    writer.upsert([make_chunk(f"c{i}", "retirement plan " * 20) for i in range(5)], vectors=[[1, 0]] * 5)
+
+    assert reader.refresh() is True
+    assert reader.generation == writer.generation == 1
+    assert writer.dead_rows() == 0
+    assert reader.chunks["a"].chunk == "parking permits"
+    assert reader.chunks["a"].row == writer.chunks["a"].row
+    assert [chunk.id for chunk, _ in reader.search("nothing", top_k=1, query_vector=[0, 1], candidates=1)][0] in {"a", "b"}
+    assert not os.path.exists(tmp_path / "vectors.f32")
@@ -0,0 +1,126 @@
+import asyncio
+import math
+import random
+
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fakes import WORDS
+from shared.hybrid_index import HybridIndex
+from shared.ingestion import AzureSearchSink, DocumentSource, IngestManifest, LocalIndexSink, SourceEntry, chunk_id, chunk_text, ingest
+from shared.tokens import get_encoder
+
+class MemorySource(DocumentSource):
+    """Documents held in a dict, listed under `prefix` like a blob container."""
+    def __init__(self, documents: dict[str, str], prefix: str = ""):
+        self.documents = documents
+        self.prefix = prefix
+
+    async def list(self) -> list[SourceEntry]:
+        return [SourceEntry(name=name) for name in sorted(self.documents) if name.startswith(self.prefix)]
+
+    async def read(self, name: str) -> bytes:
+        return self.documents[name].encode("utf-8")
+
+    def owns(self, name: str) -> bool:
+        return name.startswith(self.prefix)
+
+def run_ingest(tmp_path, source: DocumentSource, **kwargs):
+    index = HybridIndex(str(tmp_path / "index"))
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    stats = asyncio.run(ingest(source, LocalIndexSink(index), manifest, **kwargs))
+    return stats, index, manifest
+
+def paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+def test_short_paragraphs_are_packed_into_one_chunk():
+    expected = "Vacation requests need approval.\n\nSick days don't."
+
+    chunks = chunk_text("Vacation requests need approval.\n\nSick days don't.\n\n\n", max_tokens=64, overlap_tokens=8)
+
+    assert chunks == [(expected, len(get_encoder().encode(expected)))]
+
+def test_blank_text_has_no_chunks():
+    assert chunk_text(" \n\n \n", max_tokens=64, overlap_tokens=8) == []
+
+def test_paragraphs_that_fit_are_never_split():
+    rng = random.Random(1)
+    paragraphs = [paragraph(rng, 20) for _ in range(12)]
+
+    chunks = chunk_text("\n\n".join(paragraphs), max_tokens=64, overlap_tokens=8)
+
+    assert len(chunks) > 1
+    assert all(token_count <= 64 for _, token_count in chunks)
+    # every paragraph lands whole in one chunk, in order
+    assert [part for chunk, _ in chunks for part in chunk.split("\n\n")] == paragraphs
+
+def test_long_paragraph_is_cut_into_overlapping_windows():
+    rng = random.Random(2)
+    long_paragraph = paragraph(rng, 400)
+    before, after = "Read this first.", "Read this last."
+    max_tokens, overlap_tokens = 100, 20
+    encoder = get_encoder()
+    tokens = encoder.encode(long_paragraph)
+    step = max_tokens - overlap_tokens
+
+    chunks = [chunk for chunk, _ in chunk_text(f"{before}\n\n{long_paragraph}\n\n{after}", max_tokens=max_tokens, overlap_tokens=overlap_tokens)]
+
+    # the paragraphs around the long one aren't packed into its windows
+    assert chunks[0] == before
+    assert chunks[-1] == after
+    windows = chunks[1:-1]
+    assert len(windows) == math.ceil((len(tokens) - max_tokens) / step) + 1
+    for index, (window, next_window) in enumerate(zip(windows, windows[1:])):
+        overlap = encoder.decode(tokens[(index + 1) * step:index * step + max_tokens])
+        assert window.endswith(overlap)
+        assert next_window.startswith(overlap)
+    assert long_paragraph.endswith(windows[-1])
+
+def test_ingest_under_a_prefix_only_deletes_documents_under_it(tmp_path):
+    documents = {"hr/leave.md": "Vacation needs approval.", "hr/old.md": "Retired policy.", "it/vpn.md": "Reset the VPN password."}
+    run_ingest(tmp_path, MemorySource(documents))
+
+    del documents["hr/old.md"], documents["it/vpn.md"]
+    stats, index, manifest = run_ingest(tmp_path, MemorySource(documents, prefix="hr/"))
+
+    assert stats.deleted == 1
+    assert set(manifest.documents) == {"hr/leave.md", "it/vpn.md"}
+    assert {chunk.file_name for chunk in index.chunks.values()} == {"hr/leave.md", "it/vpn.md"}
+
+def test_empty_source_deletes_nothing_unless_allowed(tmp_path):
+    run_ingest(tmp_path, MemorySource({"leave.md": "Vacation needs approval."}))
+
+    with pytest.raises(ValueError):
+        run_ingest(tmp_path, MemorySource({}))
+    _, index, manifest = run_ingest(tmp_path, MemorySource({"leave.md": "Vacation needs approval."}))
+    assert set(manifest.documents) == {"leave.md"} and len(index) == 1
+
+    stats, index, manifest = run_ingest(tmp_path, MemorySource({}), allow_empty_source=True)
+    assert stats.deleted == 1
+    assert manifest.documents == {} and len(index) == 0
+
+class PartlyFailingSearchClient:
+    """Reports a per-document 503 for the keys in `failing`, like a throttled Azure AI Search batch."""
+    def __init__(self, failing: set[str]):
+        self.failing = failing
+
+    async def merge_or_upload_documents(self, documents: list[dict]) -> list[SimpleNamespace]:
+        return [
+            SimpleNamespace(key=document["id"], succeeded=document["id"] not in self.failing, status_code=503 if document["id"] in self.failing else 200, error_message=None)
+            for document in documents
+        ]
+
+    async def close(self) -> None:
+        pass
+
+def test_documents_azure_search_rejected_are_failed_and_retried(tmp_path):
+    sink = AzureSearchSink(endpoint="https://search.invalid", index_name="policies", api_key="key")
+    sink.client = PartlyFailingSearchClient(failing={chunk_id("vpn.md", 0)})
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+
+    stats = asyncio.run(ingest(MemorySource({"leave.md": "Vacation needs approval.", "vpn.md": "Reset the VPN password."}), sink, manifest))
+
+    assert stats.failed == ["vpn.md"]
+    assert set(manifest.documents) == {"leave.md"}
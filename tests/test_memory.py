@@ -0,0 +1,51 @@
+import asyncio
+
+from benchmarks.fakes import FakeCosmosRepository
+from shared.memory import InProcessMemoryBackend
+from shared.schemas import ChatResponse
+from shared.utils import get_memory
+
+def chatlog(conversation_id: str, query: str, answer: str, timestamp: str) -> dict:
+    return {"conversation_id": conversation_id, "query": query, "answer": answer, "timestamp": timestamp}
+
+def test_append_only_extends_windows_already_cached():
+    backend = InProcessMemoryBackend(window_size=2)
+
+    async def run():
+        await backend.append("c1", {"query": "q1", "answer": "a1"})
+        assert await backend.get("c1") is None
+
+        await backend.set("c1", [{"query": "q1", "answer": "a1"}])
+        await backend.append("c1", {"query": "q2", "answer": "a2"})
+        await backend.append("c1", {"query": "q3", "answer": "a3"})
+        return await backend.get("c1")
+
+    assert asyncio.run(run()) == [{"query": "q2", "answer": "a2"}, {"query": "q3", "answer": "a3"}]
+
+def test_without_a_cache_every_turn_reads_the_latest_history_from_cosmos():
+    store = {"chat_responses": [chatlog("c1", "q1", "a1", "2026-01-01T00:00:01")]}
+    repo = FakeCosmosRepository(store, "chat_responses", ChatResponse)
+
+    async def run():
+        first = await get_memory(repo, "c1", limit=5, cache=None)
+        # a turn answered by another worker
+        store["chat_responses"].append(chatlog("c1", "q2", "a2", "2026-01-01T00:00:02"))
+        second = await get_memory(repo, "c1", limit=5, cache=None)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first["memory"] == [{"role": "user", "content": "q1"}, {"role": "assistant", "content": "a1"}]
+    assert [message["content"] for message in second["memory"]] == ["q1", "a1", "q2", "a2"]
+
+def test_a_cached_window_is_served_without_reading_cosmos():
+    store = {"chat_responses": [chatlog("c1", "q1", "a1", "2026-01-01T00:00:01")]}
+    repo = FakeCosmosRepository(store, "chat_responses", ChatResponse)
+    backend = InProcessMemoryBackend()
+
+    async def run():
+        await get_memory(repo, "c1", limit=5, cache=backend)
+        store["chat_responses"].clear()
+        return await get_memory(repo, "c1", limit=5, cache=backend)
+
+    assert [message["content"] for message in asyncio.run(run())["memory"]] == ["q1", "a1"]
@@ -0,0 +1,57 @@
+import random
+
+from langchain_core.documents import Document
+
+from benchmarks.fakes import WORDS
+from shared.rerank import select_documents
+
+def word_count(doc: Document) -> int:
+    return len(doc.page_content.split())
+
+def make_doc(name: str, words: int, seed: int) -> Document:
+    rng = random.Random(seed)
+    return Document(page_content=" ".join(rng.choice(WORDS) for _ in range(words)), metadata={"file_name": name})
+
+def names(docs: list[Document]) -> list[str]:
+    return [doc.metadata["file_name"] for doc in docs]
+
+def test_empty_candidates_select_nothing():
+    assert select_documents([], [], token_budget=100, count_tokens=word_count) == []
+
+def test_most_relevant_long_document_goes_first_then_best_value_within_budget():
+    docs = [make_doc("long", 50, 1), make_doc("short1", 10, 2), make_doc("short2", 10, 3), make_doc("short3", 10, 4)]
+
+    selected = select_documents(docs, [1.0, 0.6, 0.5, 0.4], token_budget=75, count_tokens=word_count)
+
+    assert names(selected) == ["long", "short1", "short2"]
+    assert sum(word_count(doc) for doc in selected) <= 75
+
+def test_candidates_over_the_budget_are_skipped():
+    docs = [make_doc("huge", 100, 1), make_doc("short1", 10, 2), make_doc("short2", 10, 3)]
+
+    selected = select_documents(docs, [1.0, 0.9, 0.8], token_budget=30, count_tokens=word_count)
+
+    assert names(selected) == ["short1", "short2"]
+
+def test_near_duplicates_are_skipped():
+    original = make_doc("original", 20, 1)
+    duplicate = Document(page_content=original.page_content, metadata={"file_name": "duplicate"})
+    docs = [original, duplicate, make_doc("other", 20, 2)]
+
+    selected = select_documents(docs, [0.9, 0.8, 0.7], token_budget=1000, count_tokens=word_count)
+
+    assert names(selected) == ["original", "other"]
+
+def test_candidates_far_below_the_best_score_are_dropped():
+    docs = [make_doc("relevant", 10, 1), make_doc("marginal", 10, 2)]
+
+    selected = select_documents(docs, [1.0, 0.1], token_budget=1000, count_tokens=word_count, min_relative_relevance=0.25)
+
+    assert names(selected) == ["relevant"]
+
+def test_max_documents_caps_the_selection():
+    docs = [make_doc(f"doc{i}", 10, i) for i in range(6)]
+
+    selected = select_documents(docs, [1.0, 0.9, 0.8, 0.7, 0.6, 0.5], token_budget=1000, count_tokens=word_count, max_documents=2)
+
+    assert names(selected) == ["doc0", "doc1"]
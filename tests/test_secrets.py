@@ -0,0 +1,82 @@
+import asyncio
+import threading
+from typing import Optional
+
+from api.employee_desk import utils
+from api.employee_desk.chains import get_employee_desk_chain
+from api.employee_desk.retrievers import close_search_session
+from api.employee_desk.schemas import EmployeeConfig
+from api.employee_desk.tenants import TURN_SECRETS
+from benchmarks.fakes import FakeCosmosRepository, FakeKeyVaultBackend, fake_secret_values
+from shared.secrets import SECRET_NAMES, Secrets, secrets
+
+ORG_ID = "secrets-test"
+
+class RecordingBackend(FakeKeyVaultBackend):
+    """Records every fetch, and separately the ones made on a running event loop."""
+    def __init__(self, values: dict[str, str], latency: float = 0.0):
+        super().__init__(values, latency=latency)
+        self.fetched: list[str] = []
+        self.fetched_on_loop: list[str] = []
+        self._lock = threading.Lock()
+
+    def get_secret(self, name: str) -> Optional[str]:
+        try:
+            asyncio.get_running_loop()
+            on_loop = True
+        except RuntimeError:
+            on_loop = False
+        with self._lock:
+            self.fetched.append(name)
+            if on_loop:
+                self.fetched_on_loop.append(name)
+        return super().get_secret(name)
+
+class FakeEmployeeConfigRepository(FakeCosmosRepository):
+    async def find_by_org_id(self, org_id: str) -> list[EmployeeConfig]:
+        return await self.query("", [{"name": "@org_id", "value": org_id}])
+
+def test_building_a_chain_after_the_turn_prefetch_fetches_no_secret_on_the_event_loop(monkeypatch):
+    backend = RecordingBackend(fake_secret_values("http://127.0.0.1:9", "http://127.0.0.1:9"))
+    monkeypatch.setattr(secrets, "_backend", backend)
+    monkeypatch.setattr(secrets, "_values", {})
+    store = {"company_configs": [EmployeeConfig(
+        id=ORG_ID, org_id=ORG_ID, org_name="FourthSquare", query="HR and IT policies",
+        about="FourthSquare HR and IT policies.", index_name=f"{ORG_ID}-index",
+    ).model_dump()]}
+    monkeypatch.setattr(utils, "EmployeeConfigRepository", lambda conn_str: FakeEmployeeConfigRepository(store, "company_configs", EmployeeConfig))
+
+    async def build():
+        await secrets.aprefetch(TURN_SECRETS)
+        try:
+            return await get_employee_desk_chain(ORG_ID)
+        finally:
+            await close_search_session()
+
+    assert asyncio.run(build()) is not None
+    assert backend.fetched
+    assert backend.fetched_on_loop == []
+
+def test_concurrent_misses_share_one_fetch():
+    backend = RecordingBackend({"AZURE-AI-SEARCH-API-KEY": "key"}, latency=0.05)
+    cache = Secrets(backend=backend)
+
+    async def fetch_many():
+        return await asyncio.gather(*(cache.aget("azure_ai_search_api_key") for _ in range(8)))
+
+    assert asyncio.run(fetch_many()) == ["key"] * 8
+    assert backend.fetched == [SECRET_NAMES["azure_ai_search_api_key"]]
+    assert backend.fetched_on_loop == []
+
+def test_expired_secret_is_served_stale_while_it_refreshes():
+    backend = RecordingBackend({"AZURE-AI-SEARCH-API-KEY": "old"})
+    cache = Secrets(backend=backend, ttl=0.0)
+    assert cache.azure_ai_search_api_key == "old"
+
+    backend.values["AZURE-AI-SEARCH-API-KEY"] = "new"
+    assert cache.azure_ai_search_api_key == "old"
+    # wait for the background refresh
+    cache._executor.shutdown(wait=True)
+
+    assert cache._values["AZURE-AI-SEARCH-API-KEY"][1] == "new"
+    assert len(backend.fetched) == 2
@@ -0,0 +1,121 @@
+import asyncio
+import json
+
+from pydantic import BaseModel
+
+from benchmarks.fakes import FakeCosmosRepository
+from shared.write_behind import WriteBehindWriter
+
+class Note(BaseModel):
+    id: str
+    conversation_id: str
+
+class FlakyRepository(FakeCosmosRepository):
+    """Fails every batch while `down` is set, and blocks every batch while `stalled` is clear."""
+    def __init__(self, store: dict[str, list[dict]]):
+        super().__init__(store, "notes", Note)
+        self.down = False
+        self.stalled = asyncio.Event()
+        self.stalled.set()
+        self.batches: list[tuple[str, list[str]]] = []
+
+    async def upsert_batch(self, items: list[Note], partition_key: str) -> None:
+        await self.stalled.wait()
+        if self.down:
+            raise ConnectionError("Cosmos unavailable")
+        self.batches.append((partition_key, [item.id for item in items]))
+        await super().upsert_batch(items, partition_key)
+
+def make_writer(repo: FlakyRepository, spill_path: str, **kwargs) -> WriteBehindWriter[Note]:
+    return WriteBehindWriter(
+        repo_factory=lambda: repo,
+        partition_key=lambda note: note.conversation_id,
+        model_cls=Note,
+        spill_path=spill_path,
+        flush_interval=0.01,
+        **kwargs,
+    )
+
+def spilled_ids(spill_path) -> list[str]:
+    with open(spill_path, encoding="utf-8") as spill_file:
+        return [json.loads(line)["id"] for line in spill_file]
+
+def test_queued_items_are_written_in_one_batch_per_partition(tmp_path):
+    store: dict[str, list[dict]] = {}
+    repo = FlakyRepository(store)
+    writer = make_writer(repo, str(tmp_path / "spill.jsonl"))
+
+    async def run():
+        for note_id, conversation_id in [("a", "c1"), ("b", "c2"), ("c", "c1")]:
+            assert await writer.enqueue(Note(id=note_id, conversation_id=conversation_id)) is True
+        await writer.drain()
+
+    asyncio.run(run())
+
+    assert sorted(repo.batches) == [("c1", ["a", "c"]), ("c2", ["b"])]
+    assert not (tmp_path / "spill.jsonl").exists()
+
+def test_failed_batches_are_spilled_and_replayed_after_a_successful_flush(tmp_path):
+    store: dict[str, list[dict]] = {}
+    repo = FlakyRepository(store)
+    spill_path = tmp_path / "spill.jsonl"
+    writer = make_writer(repo, str(spill_path), spill_replay_interval=0)
+
+    async def run():
+        repo.down = True
+        await writer.enqueue(Note(id="a", conversation_id="c1"))
+        await writer.enqueue(Note(id="b", conversation_id="c1"))
+        await writer._queue.join()
+        assert sorted(spilled_ids(spill_path)) == ["a", "b"]
+
+        repo.down = False
+        await writer.enqueue(Note(id="c", conversation_id="c2"))
+        # the replay runs after a successful flush, and not once the writer is draining
+        await writer._queue.join()
+        await writer.drain()
+
+    asyncio.run(run())
+
+    assert sorted(item["id"] for item in store["notes"]) == ["a", "b", "c"]
+    assert not spill_path.exists()
+
+def test_spill_pending_saves_the_inflight_batch_and_the_queue_without_the_loop(tmp_path):
+    store: dict[str, list[dict]] = {}
+    repo = FlakyRepository(store)
+    spill_path = tmp_path / "spill.jsonl"
+    writer = make_writer(repo, str(spill_path))
+
+    async def run():
+        repo.stalled.clear()
+        await writer.enqueue(Note(id="a", conversation_id="c1"))
+        # let the background task take "a" as its in-flight batch
+        await asyncio.sleep(0.05)
+        await writer.enqueue(Note(id="b", conversation_id="c1"))
+
+        writer.spill_pending()
+        assert await writer.enqueue(Note(id="c", conversation_id="c1")) is False
+
+    asyncio.run(run())
+
+    assert spilled_ids(spill_path) == ["a", "b", "c"]
+    assert repo.batches == []
+
+def test_enqueue_spills_when_the_queue_stays_full(tmp_path):
+    store: dict[str, list[dict]] = {}
+    repo = FlakyRepository(store)
+    spill_path = tmp_path / "spill.jsonl"
+    writer = make_writer(repo, str(spill_path), max_queue_size=1, enqueue_timeout=0.01)
+
+    async def run():
+        repo.stalled.clear()
+        await writer.enqueue(Note(id="a", conversation_id="c1"))
+        await asyncio.sleep(0.05)
+        assert await writer.enqueue(Note(id="b", conversation_id="c1")) is True
+        assert await writer.enqueue(Note(id="c", conversation_id="c1")) is False
+        repo.stalled.set()
+        await writer.drain()
+
+    asyncio.run(run())
+
+    assert spilled_ids(spill_path) == ["c"]
+    assert sorted(item["id"] for item in store["notes"]) == ["a", "b"]